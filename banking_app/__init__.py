@@ -1,82 +1,115 @@
-from flask import Flask, jsonify
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from sqlalchemy import text
 import os
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
 def create_app():
-    app = Flask(__name__)
-
-    # Load config by environment
-    env = os.environ.get("FLASK_ENV", "production")
-    if env == "development":
-        from config import DevelopmentConfig as AppConfig
-    else:
-        from config import ProductionConfig as AppConfig
-    app.config.from_object(AppConfig)
-
-    # Init extensions
-    db.init_app(app)
-    login_manager.init_app(app)
-    login_manager.login_view = "auth.login"
-    login_manager.login_message = "Please log in to access this page."
-    login_manager.login_message_category = "info"
-
-    # Health endpoint (for DNS/LB checks)
-    @app.route("/health")
-    def health_check():
-        try:
-            db.session.execute(text("SELECT 1"))
-            return jsonify({
-                "status": "healthy",
-                "database": "connected",
-                "version": "1.0.0",
-                "environment": env
-            }), 200
-        except Exception as e:
-            return jsonify({
-                "status": "unhealthy",
-                "database": "disconnected",
-                "error": str(e)
-            }), 503
-
-    # Readiness endpoint (deeper check)
-    @app.route("/ready")
-    def readiness_check():
-        try:
-            db.session.execute(text("SELECT 1"))
-            return jsonify({
-                "ready": True,
-                "database": "operational"
-            }), 200
-        except Exception as e:
-            return jsonify({
-                "ready": False,
-                "database": "unavailable",
-                "error": str(e)
-            }), 503
-
-    # Blueprints
-    from banking_app.auth import bp as auth_bp
-    from banking_app.customer import bp as customer_bp
-    from banking_app.admin import bp as admin_bp
-    from banking_app.main import bp as main_bp
-
-    app.register_blueprint(auth_bp, url_prefix="/auth")
-    app.register_blueprint(customer_bp, url_prefix="/customer")
-    app.register_blueprint(admin_bp, url_prefix="/admin")
-    app.register_blueprint(main_bp)
-
-    # Ensure tables exist (safe if already created)
-    with app.app_context():
-        db.create_all()
+    # Phase timings for "flask startup profile" (see startup.py)
+    from banking_app.startup import StartupProfile
+    profile = StartupProfile()
+
+    with profile.phase("config"):
+        app = Flask(__name__)
+        app.extensions["startup"] = profile
+
+        # Load config by environment
+        env = os.environ.get("FLASK_ENV", "production")
+        if env == "development":
+            from config import DevelopmentConfig as AppConfig
+        else:
+            from config import ProductionConfig as AppConfig
+        app.config.from_object(AppConfig)
+
+        # Client address from X-Forwarded-For when behind reverse proxies
+        if app.config.get("TRUSTED_PROXIES"):
+            from werkzeug.middleware.proxy_fix import ProxyFix
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXIES"],
+                                    x_proto=app.config["TRUSTED_PROXIES"])
+
+    with profile.phase("extensions"):
+        # Init extensions (pool class first: the engine is built by db.init_app)
+        from banking_app import dbpool
+        dbpool.init_app(app)
+        db.init_app(app)
+        login_manager.init_app(app)
+        login_manager.login_view = "auth.login"
+        login_manager.login_message = "Please log in to access this page."
+        login_manager.login_message_category = "info"
+        # JSON clients get 401 instead of a redirect to the login page
+        login_manager.blueprint_login_views = {"api": None}
+
+        # Template adapters for Money values
+        from banking_app.money import format_money
+        app.add_template_filter(format_money, 'money')
+
+    with profile.phase("services"):
+        # Latency histograms and /metrics
+        from banking_app import metrics
+        metrics.init_app(app)
+
+        # {% cache %} row fragments and the compiled-template cache (after
+        # metrics, which exports the fragment cache size)
+        from banking_app import fragments
+        fragments.init_app(app)
+
+        # Per-request query counting, Server-Timing and query budgets
+        from banking_app import instrumentation
+        instrumentation.init_app(app)
+
+        # Cached user/role snapshots for load_user
+        from banking_app import principal
+        principal.init_app(app)
+
+        # Password KDF worker pool
+        from banking_app import passwords
+        passwords.init_app(app)
+
+        # Block-reserved account-number allocator (one pool per worker)
+        from banking_app import account_numbers
+        account_numbers.init_app(app)
+
+        # Replay store for idempotency keys on money-moving POSTs
+        from banking_app import idempotency
+        idempotency.init_app(app)
+
+        # Login/registration throttling (per IP and per username)
+        from banking_app import ratelimit
+        ratelimit.init_app(app)
+
+        # Liveness (/live) and cached readiness (/ready, /health) probes
+        from banking_app import probes
+        probes.init_app(app)
+
+    with profile.phase("schema check"):
+        # Schema revisions: startup only compares the applied revision with HEAD;
+        # tables are created and changed by "flask db upgrade"
+        from banking_app import migrations
+        migrations.init_app(app)
+
+    with profile.phase("blueprints"):
+        from banking_app.auth import bp as auth_bp
+        from banking_app.customer import bp as customer_bp
+        from banking_app.admin import bp as admin_bp
+        from banking_app.main import bp as main_bp
+        from banking_app.api import bp as api_bp
+
+        app.register_blueprint(auth_bp, url_prefix="/auth")
+        app.register_blueprint(customer_bp, url_prefix="/customer")
+        app.register_blueprint(admin_bp, url_prefix="/admin")
+        app.register_blueprint(main_bp)
+        app.register_blueprint(api_bp, url_prefix="/api/v1")
+
+    with profile.phase("cli"):
+        from banking_app.commands import register_commands
+        register_commands(app)
 
     return app
 
 @login_manager.user_loader
 def load_user(user_id):
-    from banking_app.models import User
-    return User.query.get(int(user_id))
+    from banking_app.principal import Principal, load_snapshot
+    snapshot = load_snapshot(int(user_id))
+    return Principal(snapshot) if snapshot else None
@@ -0,0 +1,194 @@
+"""
+Account-number allocation.
+
+Numbers are 10 digits: a 9-digit serial followed by a Luhn check digit, so
+with ``ACCOUNT_NUMBER_CHECK_DIGIT`` on a mistyped number is rejected by
+``looks_valid`` before any lookup. Serials come from a counter row in
+``number_sequence`` that each worker advances by ``ACCOUNT_NUMBER_BLOCK_SIZE``
+at a time; the worker then hands the block out from memory. Allocation is collision-free without a uniqueness retry, costs
+one UPDATE per block, and consecutive accounts get neighbouring numbers, so
+inserts into the ``account_number`` index stay on its right-hand edge.
+
+Blocks are reserved on their own connection and committed at once, like a
+database sequence: a rolled-back account just leaves a gap. SQLite allows one
+writer at a time, which would make that connection wait on the caller's own
+transaction, so there a block is reserved inside the caller's transaction and
+only shared with other requests once that transaction commits.
+
+Serials already taken by pre-allocator (random) numbers are skipped when a
+block is reserved.
+"""
+
+import os
+import threading
+from collections import deque
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from banking_app import db
+
+SEQUENCE_NAME = 'account_number'
+SERIAL_DIGITS = 9
+MAX_SERIAL = 10 ** SERIAL_DIGITS - 1
+_SESSION_KEY = 'account_number_block'
+
+
+class NumberSpaceExhausted(RuntimeError):
+    """Every 9-digit serial has been handed out."""
+
+
+# ----------------------------------------------------------------------
+# Check digits
+# ----------------------------------------------------------------------
+def check_digit(payload):
+    """Luhn check digit for the digit string ``payload``."""
+    total = 0
+    for position, char in enumerate(reversed(payload)):
+        digit = int(char)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def format_number(serial):
+    payload = f'{serial:0{SERIAL_DIGITS}d}'
+    return payload + check_digit(payload)
+
+
+def is_valid(number):
+    """True if ``number`` is 10 digits with a correct check digit."""
+    return (isinstance(number, str) and len(number) == SERIAL_DIGITS + 1 and number.isdigit()
+            and check_digit(number[:-1]) == number[-1])
+
+
+def looks_valid(number):
+    """
+    Cheap pre-lookup check for user-entered numbers. Only checks the shape
+    unless ``ACCOUNT_NUMBER_CHECK_DIGIT`` is on, since pre-allocator numbers
+    have no check digit.
+    """
+    if current_app.config.get('ACCOUNT_NUMBER_CHECK_DIGIT', False):
+        return is_valid(number)
+    return isinstance(number, str) and len(number) == SERIAL_DIGITS + 1 and number.isdigit()
+
+
+# ----------------------------------------------------------------------
+# Block reservation
+# ----------------------------------------------------------------------
+def _reserve(execute, count, start):
+    """Advance the counter by ``count``; returns the free serials of the block."""
+    from banking_app.models import Account, NumberSequence
+
+    stmt = (update(NumberSequence)
+            .where(NumberSequence.name == SEQUENCE_NAME)
+            .values(next_value=NumberSequence.next_value + count))
+    if db.engine.dialect.update_returning:
+        end = execute(stmt.returning(NumberSequence.next_value)).scalar()
+    elif execute(stmt).rowcount == 1:
+        end = execute(select(NumberSequence.next_value)
+                      .where(NumberSequence.name == SEQUENCE_NAME)).scalar()
+    else:
+        end = None
+    if end is None:
+        end = start + count
+        execute(insert(NumberSequence).values(name=SEQUENCE_NAME, next_value=end))
+
+    first = end - count
+    if end - 1 > MAX_SERIAL:
+        raise NumberSpaceExhausted('Account number space exhausted')
+    taken = set(execute(select(Account.account_number).where(
+        Account.account_number.between(format_number(first)[:-1] + '0',
+                                       format_number(end - 1)[:-1] + '9'))).scalars())
+    return [serial for serial in range(first, end) if format_number(serial) not in taken]
+
+
+def _in_own_transaction(count, start):
+    for attempt in range(2):
+        try:
+            with db.engine.begin() as connection:
+                return _reserve(connection.execute, count, start)
+        except IntegrityError:
+            # Another worker created the counter row first; update it instead
+            if attempt:
+                raise
+
+
+class AccountNumberAllocator:
+    """Per-process pool of reserved serials."""
+
+    def __init__(self, block_size=100, start=100000000):
+        self.block_size = block_size
+        self.start = start
+        self._lock = threading.Lock()
+        self._free = deque()
+        self._pid = os.getpid()
+
+    def _take(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked (e.g. gunicorn --preload): the parent's block is not ours
+                self._free.clear()
+                self._pid = os.getpid()
+            return self._free.popleft() if self._free else None
+
+    def release(self, serials):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._free.extend(serials)
+
+    def allocate_serial(self):
+        if db.engine.dialect.name != 'sqlite':
+            while True:
+                serial = self._take()
+                if serial is not None:
+                    return serial
+                self.release(_in_own_transaction(self.block_size, self.start))
+
+        private = db.session.info.setdefault(_SESSION_KEY, deque())
+        if not private:
+            serial = self._take()
+            if serial is not None:
+                return serial
+        while not private:
+            private.extend(_reserve(db.session.execute, self.block_size, self.start))
+        return private.popleft()
+
+    def allocate(self):
+        return format_number(self.allocate_serial())
+
+    def allocate_many(self, count):
+        return [self.allocate() for _ in range(count)]
+
+
+@event.listens_for(Session, 'after_commit')
+def _share_block(session):
+    block = session.info.pop(_SESSION_KEY, None)
+    if block and has_app_context():
+        get_allocator().release(block)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_block(session, previous_transaction):
+    # The counter UPDATE was rolled back, so the block may be handed out again
+    session.info.pop(_SESSION_KEY, None)
+
+
+def get_allocator():
+    return current_app.extensions['account_numbers']
+
+
+def allocate():
+    """Next free account number for a new account."""
+    return get_allocator().allocate()
+
+
+def init_app(app):
+    app.extensions['account_numbers'] = AccountNumberAllocator(
+        app.config.get('ACCOUNT_NUMBER_BLOCK_SIZE', 100),
+        app.config.get('ACCOUNT_NUMBER_START', 100000000))
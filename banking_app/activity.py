@@ -0,0 +1,145 @@
+"""
+Recent-activity read model.
+
+Each user keeps a ring of their last ``RECENT_ACTIVITY_SIZE`` transactions in
+``recent_activity``. Rows are written in the same DB transaction as the
+posting that produced them, so dashboards read one indexed range instead of
+rebuilding history from every account.
+"""
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import joinedload
+
+from banking_app import db
+from banking_app import history
+from banking_app.models import Account, RecentActivity, Transaction, User
+
+DEFAULT_SIZE = 20
+TRIM_CHUNK = 1000
+
+
+def ring_size():
+    return current_app.config.get('RECENT_ACTIVITY_SIZE', DEFAULT_SIZE)
+
+
+def _trim(user_ids, size):
+    """Drop everything past the newest ``size`` rows for each of ``user_ids``, in one DELETE."""
+    ranked = (select(RecentActivity.id,
+                     func.row_number().over(
+                         partition_by=RecentActivity.user_id,
+                         order_by=(RecentActivity.created_at.desc(), RecentActivity.id.desc()),
+                     ).label('rank'))
+              .where(RecentActivity.user_id.in_(user_ids))
+              .subquery())
+    stale = select(ranked.c.id).where(ranked.c.rank > size)
+    db.session.execute(
+        delete(RecentActivity).where(RecentActivity.id.in_(stale)).execution_options(synchronize_session=False))
+
+
+def record_activity(transaction, *accounts):
+    """
+    Add ``transaction`` to the feed of every user owning one of ``accounts``.
+
+    Must be called before the posting commits; the caller's commit makes the
+    feed update atomic with the balance change.
+    """
+    record_many([(transaction, accounts)])
+
+
+def record_many(postings):
+    """
+    Batch form of ``record_activity``: ``postings`` is an iterable of
+    ``(transaction, accounts)``. Each affected user's ring is trimmed once.
+    """
+    rows = []
+    for transaction, accounts in postings:
+        for user_id in {account.user_id for account in accounts if account is not None}:
+            rows.append((user_id, transaction))
+    if not rows:
+        return
+
+    if any(t.id is None or t.created_at is None for _, t in rows):
+        db.session.flush()
+
+    db.session.execute(insert(RecentActivity), [
+        {'user_id': user_id, 'transaction_id': t.id, 'created_at': t.created_at}
+        for user_id, t in rows
+    ])
+    user_ids = sorted({user_id for user_id, _ in rows})
+    size = ring_size()
+    for i in range(0, len(user_ids), TRIM_CHUNK):
+        _trim(user_ids[i:i + TRIM_CHUNK], size)
+
+
+def recent_for_user(user_id, limit=10):
+    """The ``limit`` most recent transactions for ``user_id``, newest first."""
+    return (Transaction.query
+            .join(RecentActivity, RecentActivity.transaction_id == Transaction.id)
+            .filter(RecentActivity.user_id == user_id)
+            .options(joinedload(Transaction.from_account), joinedload(Transaction.to_account))
+            .order_by(RecentActivity.created_at.desc(), RecentActivity.id.desc())
+            .limit(min(limit, ring_size()))
+            .all())
+
+
+def _rebuild_users(executor, user_ids, size):
+    """Replace the rings of ``user_ids`` from history; ``executor`` is a connection or the session."""
+    for user_id in user_ids:
+        account_ids = executor.execute(select(Account.id).where(Account.user_id == user_id)).scalars().all()
+        executor.execute(delete(RecentActivity).where(RecentActivity.user_id == user_id)
+                         .execution_options(synchronize_session=False))
+        newest = (history.history_query(account_ids, limit=size)
+                  .with_entities(Transaction.id, Transaction.created_at)
+                  .statement)
+        rows = [{'user_id': user_id, 'transaction_id': row.id, 'created_at': row.created_at}
+                for row in executor.execute(newest)]
+        if rows:
+            executor.execute(insert(RecentActivity), rows)
+
+
+def rebuild(user_ids=None, batch_size=500):
+    """
+    Backfill the feed from transaction history.
+
+    Rebuilds every user when ``user_ids`` is ``None``. Commits once per batch
+    of users and returns the number of users processed.
+    """
+    if user_ids is None:
+        user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+
+    user_ids = list(user_ids)
+    size = ring_size()
+    for i in range(0, len(user_ids), batch_size):
+        _rebuild_users(db.session, user_ids[i:i + batch_size], size)
+        db.session.commit()
+    return len(user_ids)
+
+
+def rebuild_incomplete(executor, batch_size=500, commit=None):
+    """
+    Rebuild every user whose ring holds fewer than ``RECENT_ACTIVITY_SIZE``
+    rows, such as users whose history predates the feed (schema revision 13).
+    ``executor`` is a connection or the session; ``commit`` runs after each
+    batch of users. Returns the number of users rebuilt.
+    """
+    size = ring_size()
+    rings = (select(RecentActivity.user_id, func.count().label('rows'))
+             .group_by(RecentActivity.user_id)
+             .subquery())
+    rebuilt = 0
+    last_id = 0
+    while True:
+        user_ids = executor.execute(
+            select(User.id)
+            .outerjoin(rings, rings.c.user_id == User.id)
+            .where(User.id > last_id, func.coalesce(rings.c.rows, 0) < size)
+            .order_by(User.id)
+            .limit(batch_size)).scalars().all()
+        if not user_ids:
+            return rebuilt
+        _rebuild_users(executor, user_ids, size)
+        if commit:
+            commit()
+        rebuilt += len(user_ids)
+        last_id = user_ids[-1]
@@ -1,34 +1,54 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app
 from flask_login import login_required, current_user
 from banking_app.admin import bp
 from banking_app.models import User, Account, Transaction, Role
-from banking_app import db
+from banking_app import db, activity, dbpool, fragments, history, listings, metrics, probes, statements, stats
+from banking_app.forms import RefreshStatsForm
 from banking_app.utils import admin_required
-from sqlalchemy import func
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import time
 
 @bp.route('/dashboard')
 @login_required
 @admin_required
 def dashboard():
-    # System statistics
-    total_users = User.query.count()
-    total_accounts = Account.query.filter_by(is_active=True).count()
-    total_balance = db.session.query(func.sum(Account.balance)).scalar() or 0
+    # System statistics from the materialized counters (see stats.py)
+    snapshot = stats.current()
     recent_transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(10).all()
+    # Rows already rendered need no accounts; the rest get theirs in one query
+    history.load_accounts(fragments.uncached('admin-recent-transaction', recent_transactions))
     
-    return render_template('admin/dashboard.html', 
-                         total_users=total_users,
-                         total_accounts=total_accounts, 
-                         total_balance=total_balance,
-                         recent_transactions=recent_transactions)
+    return render_template('admin/admin_dashboard.html', 
+                         total_users=snapshot.user_count,
+                         total_accounts=snapshot.active_account_count, 
+                         total_balance=snapshot.total_balance,
+                         stats_updated_at=snapshot.updated_at,
+                         stats_refreshed_at=snapshot.refreshed_at,
+                         recent_transactions=recent_transactions,
+                         refresh_form=RefreshStatsForm())
+
+@bp.route('/dashboard/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_stats():
+    if RefreshStatsForm().validate_on_submit():
+        stats.refresh()
+        flash('System statistics recomputed.', 'success')
+    return redirect(url_for('admin.dashboard'))
 
 @bp.route('/users')
 @login_required
 @admin_required
 def users():
-    page = request.args.get('page', 1, type=int)
-    users = User.query.paginate(page=page, per_page=20, error_out=False)
-    return render_template('admin/users.html', users=users)
+    # Keyset-paginated, prefix-searchable (see listings.py)
+    page = listings.user_page(q=request.args.get('q', '').strip(),
+                              role=request.args.get('role'),
+                              status=request.args.get('status'),
+                              cursor=request.args.get('cursor'))
+    return render_template('admin/users.html', users=page.items, next_cursor=page.next_cursor,
+                           total=page.total, filters=request.args)
 
 @bp.route('/user/<int:user_id>')
 @login_required
@@ -37,13 +57,8 @@ def user_detail(user_id):
     user = User.query.get_or_404(user_id)
     accounts = user.accounts.filter_by(is_active=True).all()
     
-    # Get all transactions for this user
-    all_transactions = []
-    for account in accounts:
-        transactions = account.get_transactions()
-        all_transactions.extend(transactions)
-    
-    all_transactions = sorted(all_transactions, key=lambda x: x.created_at, reverse=True)[:20]
+    # Latest 20 transactions from the user's recent-activity feed
+    all_transactions = activity.recent_for_user(user.id, limit=20)
     
     return render_template('admin/user_detail.html', user=user, accounts=accounts, transactions=all_transactions)
 
@@ -51,40 +66,139 @@ def user_detail(user_id):
 @login_required
 @admin_required
 def accounts():
-    page = request.args.get('page', 1, type=int)
-    accounts = Account.query.filter_by(is_active=True).paginate(page=page, per_page=20, error_out=False)
-    return render_template('admin/accounts.html', accounts=accounts)
+    page = listings.account_page(q=request.args.get('q', '').strip(),
+                                 account_type=request.args.get('type'),
+                                 status=request.args.get('status', 'active'),
+                                 user_id=request.args.get('user_id', type=int),
+                                 cursor=request.args.get('cursor'))
+    return render_template('admin/admin_accounts.html', accounts=page.items, next_cursor=page.next_cursor,
+                           total=page.total, filters=request.args)
 
 @bp.route('/transactions')
 @login_required
 @admin_required
 def transactions():
-    page = request.args.get('page', 1, type=int)
-    transactions = Transaction.query.order_by(Transaction.created_at.desc()).paginate(
-        page=page, per_page=50, error_out=False)
-    return render_template('admin/transactions.html', transactions=transactions)
+    try:
+        start = statements.parse_day(request.args.get('start'))
+        end = statements.parse_day(request.args.get('end'))
+    except ValueError:
+        abort(400)
+    
+    page = listings.transaction_page(account_number=request.args.get('account', '').strip(),
+                                     user_id=request.args.get('user_id', type=int),
+                                     transaction_type=request.args.get('type'),
+                                     status=request.args.get('status'),
+                                     start=start, end=end,
+                                     cursor=request.args.get('cursor'),
+                                     with_accounts=False)
+    history.load_accounts(fragments.uncached('admin-transaction-row', page.items))
+    return render_template('admin/admin_transactions.html', transactions=page.items,
+                           next_cursor=page.next_cursor, total=page.total, filters=request.args)
+
+@bp.route('/transactions/export.<fmt>')
+@login_required
+@admin_required
+def export_transactions(fmt):
+    if fmt not in statements.FORMATS:
+        abort(404)
+    try:
+        start = statements.parse_day(request.args.get('start'))
+        end = statements.parse_day(request.args.get('end'))
+    except ValueError:
+        abort(400)
+    
+    # Every account unless ?account=<number> narrows it down
+    account_ids = None
+    if request.args.get('account'):
+        account = Account.query.filter_by(account_number=request.args['account']).first_or_404()
+        account_ids = [account.id]
+    
+    return statements.stream_response(fmt, statements.statement_query(account_ids, start, end), start, end)
+
+# Health page component -> latency histogram behind it (see metrics.py)
+HEALTH_COMPONENTS = {
+    'database': 'db_query_duration_seconds',
+    'api': 'http_request_duration_seconds',
+    'authentication': 'password_kdf_seconds',
+    'transactions': 'posting_commit_seconds',
+}
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def _latency_report():
+    """Sliding-window percentiles (ms) per health component."""
+    registry = metrics.get_registry()
+    report = {}
+    for component, metric in HEALTH_COMPONENTS.items():
+        count, percentiles = registry.combined(metric) if registry else (0, {})
+        report[component] = {'count': count, **{f'p{int(q * 100)}': _ms(v) for q, v in percentiles.items()}}
+    return report
+
+def _ping_database():
+    """Round-trip time of ``SELECT 1`` in seconds, or ``None`` if the database is down."""
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
+    return time.perf_counter() - started
 
 @bp.route('/system_health')
 @login_required
 @admin_required
 def system_health():
-    # Simulate system health metrics
-    health_data = {
-        'database': {'status': 'healthy', 'response_time': '5ms'},
-        'api': {'status': 'healthy', 'response_time': '12ms'},
-        'authentication': {'status': 'healthy', 'response_time': '3ms'},
-        'transactions': {'status': 'healthy', 'response_time': '8ms'},
-    }
+    ping = _ping_database()
+    latency = _latency_report()
+    # Statuses come from the readiness checker's latest verdict (see probes.py)
+    verdict = probes.get_checker().current()
+    checks = verdict['checks']
+    serving = {'ready': 'healthy', 'degraded': 'degraded'}.get(verdict['state'], 'unavailable')
+    health_data = {}
+    for component, data in latency.items():
+        health_data[component] = {
+            'status': serving,
+            'response_time': f"p95 {data['p95']}ms" if data.get('p95') is not None else 'no data yet',
+        }
+    database_ok = ping is not None and checks.get('database', {}).get('ok', False)
+    health_data['database']['status'] = 'healthy' if database_ok else 'unavailable'
+    if ping is not None:
+        health_data['database']['response_time'] += f' (ping {_ms(ping)}ms)'
+    # Remaining probes (pool, schema revision, ...) get a card each
+    for name, result in checks.items():
+        if name not in health_data:
+            health_data[name] = {'status': 'healthy' if result['ok'] else 'unavailable',
+                                 'response_time': result['detail']}
     
-    return render_template('admin/system_health.html', health_data=health_data)
+    registry = metrics.get_registry()
+    endpoints = [
+        {'endpoint': labels.get('endpoint'), 'count': count,
+         **{f'p{int(q * 100)}': _ms(v) for q, v in percentiles.items()}}
+        for labels, count, percentiles in (registry.summaries('http_request_duration_seconds') if registry else [])
+        if count
+    ][:15]
+    
+    return render_template('admin/system_health.html', health_data=health_data, endpoints=endpoints,
+                           window=current_app.config.get('METRICS_WINDOW_SECONDS', 300))
+
+@bp.route('/api/pool')
+@login_required
+@admin_required
+def pool_api():
+    # Live pool occupancy and checkout waits for this worker (see dbpool.py)
+    return jsonify(dbpool.pool_status(db.engine, current_app.config))
 
 @bp.route('/api/health')
 @login_required
 @admin_required
 def health_api():
     # Health check endpoint for monitoring
+    ping = _ping_database()
     return jsonify({
-        'status': 'healthy',
-        'timestamp': db.func.now(),
-        'version': '1.0.0'
+        'status': 'healthy' if ping is not None else 'degraded',
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'version': '1.0.0',
+        'database_ping_ms': _ms(ping),
+        'latency_ms': _latency_report(),
     })
@@ -0,0 +1,320 @@
+"""
+Versioned JSON API (``/api/v1``) for accounts, balances, transaction history
+and transfers.
+
+Authentication is the same cookie session as the HTML views:
+
+1. ``POST /api/v1/session`` with ``{"username", "password"}`` as JSON. The
+   attempt goes through the login rate limits and the KDF pool exactly like
+   the login form (``passwords.authenticate``): ``429`` with ``Retry-After``
+   when throttled, ``503`` when no KDF slot frees up, ``401`` on bad
+   credentials. On success the response sets the session cookie and returns
+   the user with a ``csrf_token``. Only JSON bodies are accepted, so a
+   cross-site form cannot log a browser into someone else's account.
+2. Every later POST or DELETE carries that token in ``X-CSRFToken``
+   (``GET /api/v1/me`` returns a fresh one).
+3. ``DELETE /api/v1/session`` logs out.
+
+Services and idempotency keys are shared with the HTML views too. Every
+listing accepts ``?fields=a,b`` to return only those fields.
+
+Reads are conditional. The ``ETag`` is a hash of the ``(id, version)`` of
+the accounts a response is about, and ``Account.version`` is bumped by every
+balance change (see postings.py), so a client that polls with
+``If-None-Match`` gets ``304`` from a single account query until money
+actually moves. ``Last-Modified`` is the time of the latest journal entry
+of those accounts (one second granularity, so prefer the ``ETag``).
+"""
+
+import hashlib
+
+from flask import abort, current_app, jsonify, request
+from flask_login import current_user, login_required, login_user, logout_user
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from sqlalchemy import and_, func, inspect, or_, select
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from wtforms.validators import ValidationError
+
+from banking_app import account_numbers, db, history, idempotency, metrics, postings
+from banking_app.api import bp
+from banking_app.models import Account, JournalEntry, Transaction
+from banking_app.money import Money
+from banking_app.passwords import PasswordVerifierBusy, authenticate
+from banking_app.utils import customer_required
+
+MAX_PAGE_SIZE = 100
+
+
+def _timestamp(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def _number(account):
+    return account.account_number if account is not None else None
+
+
+# ----------------------------------------------------------------------
+# Representations
+# ----------------------------------------------------------------------
+ACCOUNT_FIELDS = {
+    'account_number': lambda a: a.account_number,
+    'account_type': lambda a: a.account_type,
+    'balance': lambda a: str(a.balance),
+    'balance_cents': lambda a: a.balance.cents,
+    'version': lambda a: a.version,
+    'created_at': lambda a: _timestamp(a.created_at),
+}
+
+TRANSACTION_FIELDS = {
+    'id': lambda t: t.id,
+    'type': lambda t: t.transaction_type,
+    'amount': lambda t: str(t.amount),
+    'amount_cents': lambda t: Money.coerce(t.amount).cents,
+    'status': lambda t: t.status,
+    'description': lambda t: t.description,
+    'from_account': lambda t: _number(t.from_account),
+    'to_account': lambda t: _number(t.to_account),
+    'created_at': lambda t: _timestamp(t.created_at),
+}
+
+
+def _fields(available):
+    """The ``?fields=`` selection (all fields by default); 400 on unknown names."""
+    requested = request.args.get('fields')
+    if not requested:
+        return list(available)
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        abort(400, description=f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(available)}")
+    return names
+
+
+def _represent(objs, available, names):
+    return [{name: available[name](obj) for name in names} for obj in objs]
+
+
+def _transactions(rows):
+    names = _fields(TRANSACTION_FIELDS)
+    if 'from_account' in names or 'to_account' in names:
+        history.load_accounts(rows)  # one query instead of two lazy loads per row
+    return _represent(rows, TRANSACTION_FIELDS, names)
+
+
+# ----------------------------------------------------------------------
+# Conditional GET
+# ----------------------------------------------------------------------
+def version_etag(accounts):
+    raw = f'{current_user.id}|' + ','.join(f'{a.id}.{a.version}' for a in sorted(accounts, key=lambda a: a.id))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def last_modified(accounts):
+    """Time of the newest journal entry (or account opening) among ``accounts``."""
+    latest = [a.created_at for a in accounts if a.created_at]
+    heads = [and_(JournalEntry.account_id == a.id, JournalEntry.sequence == a.last_sequence)
+             for a in accounts if a.last_sequence]
+    if heads:
+        # Point lookups on the (account_id, sequence) unique index
+        journaled = db.session.execute(select(func.max(JournalEntry.created_at)).where(or_(*heads))).scalar()
+        if journaled:
+            latest.append(journaled)
+    return max(latest) if latest else None
+
+
+def _cacheable(response, etag, modified):
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    # Revalidate every time; the ETag makes that a cheap 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def conditional(accounts, build):
+    """
+    ``build()`` as JSON tagged with the versions of ``accounts``, or an empty
+    304 when the client's copy is current. The accounts are read before
+    ``build`` runs, so a concurrent posting can only make the tag older than
+    the body, never newer.
+    """
+    etag = version_etag(accounts)
+    if request.if_none_match.contains_weak(etag):
+        metrics.inc('api_conditional_total', endpoint=request.endpoint, result='not_modified')
+        return _cacheable(current_app.response_class(status=304), etag, None)
+    modified = last_modified(accounts)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        metrics.inc('api_conditional_total', endpoint=request.endpoint, result='not_modified')
+        return _cacheable(current_app.response_class(status=304), etag, modified)
+    metrics.inc('api_conditional_total', endpoint=request.endpoint, result='modified')
+    return _cacheable(jsonify(build()), etag, modified)
+
+
+# ----------------------------------------------------------------------
+# Errors, CSRF and lookups
+# ----------------------------------------------------------------------
+@bp.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+@bp.before_request
+def check_csrf():
+    # Anonymous requests fall through to login_required (401)
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or not current_user.is_authenticated:
+        return
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as e:
+            abort(400, description=str(e))
+
+
+def _active_accounts():
+    return current_user.accounts.filter_by(is_active=True).order_by(Account.id).all()
+
+
+def _own_account(account_number):
+    account = current_user.accounts.filter_by(account_number=account_number, is_active=True).first()
+    if account is None:
+        abort(404, description='Account not found')
+    return account
+
+
+def _page_size():
+    return min(max(request.args.get('limit', history.DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+
+def _me(user):
+    return {'id': user.id, 'username': user.username, 'first_name': user.first_name, 'csrf_token': generate_csrf()}
+
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+@bp.route('/session', methods=['POST'])
+def create_session():
+    payload = request.get_json(silent=True) if request.is_json else None
+    if not isinstance(payload, dict):
+        abort(400, description='Expected a JSON object')
+    username, password = payload.get('username'), payload.get('password')
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        abort(400, description='username and password are required')
+
+    try:
+        user, decision = authenticate(username, password)
+    except PasswordVerifierBusy:
+        abort(503, description='Login is busy right now. Please try again in a moment.')
+    if not decision.allowed:
+        response = jsonify({'error': f'Too many login attempts. Please try again in {decision.retry_after} seconds.'})
+        return response, 429, {'Retry-After': str(decision.retry_after)}
+    if user is None:
+        abort(401, description='Invalid username or password')
+    if not user.is_customer() or not login_user(user):
+        abort(403, description='This account cannot use the API')
+    return jsonify(_me(user))
+
+
+@bp.route('/session', methods=['DELETE'])
+@login_required
+def delete_session():
+    logout_user()
+    return '', 204
+
+
+@bp.route('/me')
+@login_required
+@customer_required
+def me():
+    return jsonify(_me(current_user))
+
+
+@bp.route('/accounts')
+@login_required
+@customer_required
+def accounts():
+    user_accounts = _active_accounts()
+    names = _fields(ACCOUNT_FIELDS)
+    return conditional(user_accounts, lambda: {'accounts': _represent(user_accounts, ACCOUNT_FIELDS, names)})
+
+
+@bp.route('/accounts/<account_number>')
+@login_required
+@customer_required
+def account(account_number):
+    account = _own_account(account_number)
+    names = _fields(ACCOUNT_FIELDS)
+    return conditional([account], lambda: _represent([account], ACCOUNT_FIELDS, names)[0])
+
+
+@bp.route('/accounts/<account_number>/transactions')
+@login_required
+@customer_required
+def account_transactions(account_number):
+    account = _own_account(account_number)
+    return conditional([account], lambda: _transaction_page([account.id]))
+
+
+@bp.route('/transactions')
+@login_required
+@customer_required
+def transactions():
+    user_accounts = _active_accounts()
+    return conditional(user_accounts, lambda: _transaction_page([a.id for a in user_accounts]))
+
+
+def _transaction_page(account_ids):
+    rows, next_cursor = history.transaction_page(account_ids, cursor=request.args.get('cursor'),
+                                                 per_page=_page_size())
+    return {'transactions': _transactions(rows), 'next_cursor': next_cursor}
+
+
+@bp.route('/transfers', methods=['POST'])
+@login_required
+@customer_required
+@idempotency.idempotent
+def create_transfer():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400, description='Expected a JSON object')
+
+    try:
+        amount = Money.coerce(str(payload.get('amount', '')).strip())
+    except TypeError:
+        abort(400, description='Amount must be a number like 25.00')
+    if amount <= 0:
+        abort(400, description='Amount must be positive')
+    description = payload.get('description') or None
+    if description is not None and (not isinstance(description, str) or len(description) > 200):
+        abort(400, description='Description must be text of at most 200 characters')
+    to_number = str(payload.get('to_account') or '').strip()
+    if not account_numbers.looks_valid(to_number):
+        abort(400, description='Invalid account number. Please check it and try again.')
+
+    # Source defaults to the first checking account, as in the transfer form
+    if payload.get('from_account'):
+        from_account = _own_account(str(payload['from_account']))
+    else:
+        from_account = current_user.accounts.filter_by(account_type='checking', is_active=True).first()
+        if from_account is None:
+            abort(400, description='No checking account found for transfer')
+    if to_number == from_account.account_number:
+        abort(400, description='Cannot transfer to the source account')
+    to_account = Account.query.filter_by(account_number=to_number, is_active=True).first()
+    if to_account is None:
+        abort(404, description='Destination account not found')
+
+    try:
+        transaction = postings.transfer(from_account, to_account, amount, description)
+    except postings.PostingError as e:
+        abort(422, description=str(e))
+    # The commit expired all three rows; reload them in one query
+    transaction = db.session.get(Transaction, inspect(transaction).identity, populate_existing=True,
+                                 options=[joinedload(Transaction.from_account), joinedload(Transaction.to_account)])
+
+    return jsonify({
+        'transaction': _represent([transaction], TRANSACTION_FIELDS, list(TRANSACTION_FIELDS))[0],
+        'from_account': _represent([from_account], ACCOUNT_FIELDS, list(ACCOUNT_FIELDS))[0],
+    }), 201
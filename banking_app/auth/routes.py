@@ -3,7 +3,12 @@ from flask_login import login_user, logout_user, current_user
 from banking_app.auth import bp
 from banking_app.models import User, Role, Account
 from banking_app.forms import LoginForm, RegistrationForm
-from banking_app import db
+from banking_app import db, ratelimit, stats
+from banking_app.passwords import PasswordVerifierBusy, authenticate
+
+def _too_many(template, form, decision, attempts):
+    flash(f'Too many {attempts}. Please try again in {decision.retry_after} seconds.', 'warning')
+    return render_template(template, form=form), 429, {'Retry-After': str(decision.retry_after)}
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -15,8 +20,15 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        # Throttled before the user lookup and the password KDF
+        try:
+            user, decision = authenticate(form.username.data, form.password.data)
+        except PasswordVerifierBusy:
+            flash('Login is busy right now. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', form=form), 503
+        if not decision.allowed:
+            return _too_many('auth/login.html', form, decision, 'login attempts')
+        if user is not None:
             login_user(user)
             next_page = request.args.get('next')
             if not next_page:
@@ -35,6 +47,11 @@ def register():
         return redirect(url_for('main.index'))
     
     form = RegistrationForm()
+    if form.is_submitted():
+        # Before validation: the username/email validators query the database
+        decision = ratelimit.get_limiter().hit('register_ip', ratelimit.client_ip())
+        if not decision.allowed:
+            return _too_many('auth/register.html', form, decision, 'registration attempts')
     if form.validate_on_submit():
         # Get customer role
         customer_role = Role.query.filter_by(name='customer').first()
@@ -50,6 +67,8 @@ def register():
         user.set_password(form.password.data)
         
         db.session.add(user)
+        db.session.flush()
+        stats.bump(user.id, users=1)
         db.session.commit()
         
         # Create a default checking account
@@ -59,6 +78,8 @@ def register():
             user_id=user.id
         )
         db.session.add(account)
+        db.session.flush()
+        stats.bump(account.id, accounts=1)
         db.session.commit()
         
         flash('Registration successful! Please log in.', 'success')
@@ -0,0 +1,284 @@
+"""
+Flask CLI commands (run with ``flask --app wsgi <group> <command>``).
+"""
+
+import click
+from flask.cli import AppGroup
+
+activity_cli = AppGroup('activity', help='Recent-activity read model maintenance.')
+money_cli = AppGroup('money', help='Money column maintenance.')
+ledger_cli = AppGroup('ledger', help='Journal verification and maintenance.')
+limits_cli = AppGroup('limits', help='Transaction limits and daily usage counters.')
+statements_cli = AppGroup('statements', help='Statement and regulatory exports.')
+stats_cli = AppGroup('stats', help='Materialized admin dashboard statistics.')
+db_cli = AppGroup('db', help='Versioned schema revisions.')
+startup_cli = AppGroup('startup', help='Startup-time profiling.')
+idempotency_cli = AppGroup('idempotency', help='Idempotency key maintenance.')
+outbox_cli = AppGroup('outbox', help='Transactional outbox (drained by worker.py).')
+templates_cli = AppGroup('templates', help='Compiled-template and fragment caches.')
+
+
+@activity_cli.command('rebuild')
+@click.option('--user-id', 'user_ids', type=int, multiple=True,
+              help='Only rebuild these users (repeatable). Defaults to everyone.')
+def rebuild_activity(user_ids):
+    """Backfill the per-user recent-activity feed from transaction history."""
+    from banking_app import activity
+    count = activity.rebuild(list(user_ids) or None)
+    click.echo(f'✅ Rebuilt recent activity for {count} user(s)')
+
+
+@money_cli.command('migrate')
+def migrate_money():
+    """Convert legacy FLOAT balance/amount columns to integer cents."""
+    from banking_app import db
+    from banking_app.money import convert_legacy_columns
+    with db.engine.begin() as connection:
+        converted = convert_legacy_columns(connection)
+    if converted:
+        click.echo(f"✅ Converted to cents: {', '.join(converted)}")
+    else:
+        click.echo('✅ Money columns already use integer cents')
+
+
+@ledger_cli.command('verify')
+@click.option('--batch-size', default=1000, show_default=True, help='Accounts checked per batch.')
+def verify_ledger(batch_size):
+    """Check the journal against Account.balance for every account."""
+    from banking_app import ledger
+    problems = 0
+    for account_id, problem in ledger.verify(batch_size=batch_size):
+        problems += 1
+        click.echo(f'❌ account {account_id}: {problem}')
+    if problems:
+        raise SystemExit(1)
+    click.echo('✅ Journal matches every account balance')
+
+
+@ledger_cli.command('backfill')
+def backfill_ledger():
+    """Journal opening balances for accounts created before the journal."""
+    from banking_app import ledger
+    count = ledger.backfill_opening_balances()
+    click.echo(f'✅ Journaled opening balances for {count} account(s)')
+
+
+@ledger_cli.command('balance')
+@click.argument('account_number')
+@click.option('--sequence', type=int, help='Balance after this journal entry.')
+@click.option('--at', type=click.DateTime(), help='Balance as of this UTC time.')
+def ledger_balance(account_number, sequence, at):
+    """Point-in-time balance of an account from snapshots + journal."""
+    from banking_app import ledger
+    from banking_app.models import Account
+    account = Account.query.filter_by(account_number=account_number).first()
+    if account is None:
+        raise click.ClickException(f'Account {account_number} not found')
+    click.echo(f'${ledger.balance_at(account.id, sequence=sequence, at=at)}')
+
+
+@limits_cli.command('reconcile')
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']), help='UTC day to rebuild. Defaults to today.')
+def reconcile_limits(day):
+    """Rebuild daily usage counters from transaction history."""
+    from banking_app import limits
+    count = limits.reconcile(day.date() if day else None)
+    click.echo(f'✅ Rebuilt daily usage for {count} account(s)')
+
+
+@limits_cli.command('set')
+@click.argument('account_number')
+@click.option('--single', help='Per-transaction limit, e.g. 2500.00; "default" clears the override.')
+@click.option('--daily', help='Per-day limit, e.g. 20000.00; "default" clears the override.')
+def set_limits(account_number, single, daily):
+    """Override the transaction limits of one account."""
+    from banking_app import db
+    from banking_app.models import Account
+    from banking_app.money import Money
+    account = Account.query.filter_by(account_number=account_number).first()
+    if account is None:
+        raise click.ClickException(f'Account {account_number} not found')
+    try:
+        if single is not None:
+            account.single_limit = None if single == 'default' else Money.coerce(single)
+        if daily is not None:
+            account.daily_limit = None if daily == 'default' else Money.coerce(daily)
+    except (TypeError, ArithmeticError):
+        raise click.ClickException('Limits must be amounts like 2500.00')
+    db.session.commit()
+    describe = lambda value: 'default' if value is None else f'${value}'
+    click.echo(f'✅ {account_number}: single {describe(account.single_limit)}, '
+               f'daily {describe(account.daily_limit)}')
+
+
+@statements_cli.command('export')
+@click.option('--account', 'account_numbers', multiple=True,
+              help='Only this account number (repeatable). Defaults to every account.')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First UTC day, inclusive.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last UTC day, inclusive.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File to write. Defaults to stdout.')
+@click.option('--fetch-size', type=int, help='Rows per round trip. Defaults to STATEMENT_FETCH_SIZE.')
+def export_statements(account_numbers, start, end, fmt, output, fetch_size):
+    """Stream transactions to CSV/NDJSON with flat memory (bulk exports)."""
+    from banking_app import db, statements
+    from banking_app.models import Account
+    account_ids = None
+    if account_numbers:
+        rows = db.session.query(Account.id, Account.account_number).filter(
+            Account.account_number.in_(account_numbers)).all()
+        missing = set(account_numbers) - {row.account_number for row in rows}
+        if missing:
+            raise click.ClickException(f"Account(s) not found: {', '.join(sorted(missing))}")
+        account_ids = [row.id for row in rows]
+    stmt = statements.statement_query(account_ids, start and start.date(), end and end.date())
+    for chunk in statements.generate(fmt, stmt, fetch_size):
+        output.write(chunk)
+    output.flush()
+
+
+@stats_cli.command('refresh')
+def refresh_stats():
+    """Recompute the dashboard counters from the base tables (run periodically)."""
+    from banking_app import stats
+    stats.refresh()
+    snapshot = stats.current()
+    click.echo(f'✅ {snapshot.user_count} users, {snapshot.active_account_count} active accounts, '
+               f'${snapshot.total_balance} total balance')
+
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, help='Stop at this revision. Defaults to the latest.')
+def upgrade_schema(target):
+    """Apply pending schema revisions."""
+    from banking_app import migrations
+    applied = migrations.upgrade(target, echo=lambda message: click.echo(f'  {message}'))
+    state = migrations.status()
+    click.echo(f'✅ Schema at revision {state.current} ({len(applied)} applied)')
+
+
+@db_cli.command('current')
+def current_schema():
+    """Show the applied schema revision; exits 1 when behind."""
+    from banking_app import migrations
+    state = migrations.status()
+    if not state.is_current:
+        click.echo(f'❌ Schema at revision {state.current or "none"}, latest is {state.head}')
+        raise SystemExit(1)
+    click.echo(f'✅ Schema at revision {state.current} (latest)')
+
+
+@db_cli.command('history')
+def schema_history():
+    """List applied schema revisions."""
+    from banking_app import migrations
+    for version, description, applied_at in migrations.history():
+        click.echo(f'{version:>4}  {applied_at:%Y-%m-%d %H:%M:%S}  {description}')
+
+
+@startup_cli.command('profile')
+@click.option('--module', default='wsgi', show_default=True, help='Module whose import is profiled.')
+@click.option('--top', default=20, show_default=True, help='Slowest imports to list.')
+def profile_startup(module, top):
+    """Report create_app phase times and the slowest imports of a fresh process."""
+    from flask import current_app
+    from banking_app import startup
+    profile = current_app.extensions['startup']
+    click.echo('create_app phases (this process):')
+    for name, seconds in profile.phases:
+        click.echo(f'  {seconds * 1000:8.1f}ms  {name}')
+    click.echo(f'  {profile.total * 1000:8.1f}ms  total')
+
+    total, entries = startup.import_times(module)
+    click.echo(f'\nimport {module} in a fresh interpreter: {total * 1000:.1f}ms wall')
+    click.echo(f'  {"cumulative":>10}  {"self":>8}  module')
+    for entry in entries[:top]:
+        click.echo(f'  {entry.cumulative_s * 1000:8.1f}ms  {entry.self_s * 1000:6.1f}ms  {entry.module}')
+    own = sorted((e for e in entries if e.module.split('.')[0] in ('banking_app', 'config', module)),
+                 key=lambda e: e.self_s, reverse=True)
+    click.echo('\nslowest application modules (self time):')
+    for entry in own[:top]:
+        click.echo(f'  {entry.self_s * 1000:8.1f}ms  {entry.module}')
+
+
+@idempotency_cli.command('sweep')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per commit.')
+def sweep_idempotency_keys(batch_size):
+    """Delete expired idempotency keys (run periodically)."""
+    from banking_app import idempotency
+    count = idempotency.sweep(batch_size=batch_size)
+    click.echo(f'✅ Deleted {count} expired idempotency key(s)')
+
+
+@outbox_cli.command('status')
+def outbox_status():
+    """Event counts by state and the age of the oldest unprocessed event."""
+    from datetime import datetime
+    from banking_app import outbox
+    state = outbox.status()
+    for name in ('pending', 'processing', 'done', 'dead'):
+        click.echo(f'{state.counts.get(name, 0):>10}  {name}')
+    if state.oldest_pending:
+        age = (datetime.utcnow() - state.oldest_pending).total_seconds()
+        click.echo(f'Oldest unprocessed event: {age:.1f}s old')
+    if state.counts.get('dead'):
+        click.echo(f'❌ {state.counts["dead"]} dead-lettered event(s); see "flask outbox requeue"')
+        raise SystemExit(1)
+
+
+@outbox_cli.command('drain')
+@click.option('--batch-size', type=int, help='Events claimed per batch. Defaults to OUTBOX_BATCH_SIZE.')
+def drain_outbox(batch_size):
+    """Process every due event in this process, then exit."""
+    from banking_app import outbox
+    outcomes = outbox.drain(batch_size)
+    summary = ', '.join(f'{n} {outcome}' for outcome, n in sorted(outcomes.items())) or 'nothing due'
+    click.echo(f'✅ Outbox drained: {summary}')
+
+
+@outbox_cli.command('requeue')
+@click.option('--id', 'event_ids', type=int, multiple=True,
+              help='Only this event (repeatable). Defaults to every dead-lettered event.')
+def requeue_outbox(event_ids):
+    """Give dead-lettered events a fresh set of attempts."""
+    from banking_app import outbox
+    count = outbox.requeue(list(event_ids) or None)
+    click.echo(f'✅ Requeued {count} event(s)')
+
+
+@outbox_cli.command('purge')
+@click.option('--older-than-days', type=int, help='Defaults to OUTBOX_RETENTION_DAYS.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per commit.')
+def purge_outbox(older_than_days, batch_size):
+    """Delete processed events past retention (run periodically)."""
+    from datetime import datetime, timedelta
+    from flask import current_app
+    from banking_app import outbox
+    days = older_than_days if older_than_days is not None else current_app.config.get('OUTBOX_RETENTION_DAYS', 7)
+    count = outbox.purge(datetime.utcnow() - timedelta(days=days), batch_size=batch_size)
+    click.echo(f'✅ Deleted {count} processed event(s)')
+
+
+@templates_cli.command('compile')
+def compile_templates():
+    """Compile every template into the bytecode cache (run at build/deploy time)."""
+    from flask import current_app
+    from banking_app import fragments
+    count = fragments.compile_templates(current_app)
+    cache = current_app.jinja_env.bytecode_cache
+    where = f'into {cache.directory}' if cache is not None else '(bytecode cache disabled)'
+    click.echo(f'✅ Compiled {count} template(s) {where}')
+
+
+def register_commands(app):
+    app.cli.add_command(activity_cli)
+    app.cli.add_command(money_cli)
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(limits_cli)
+    app.cli.add_command(statements_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(startup_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(templates_cli)
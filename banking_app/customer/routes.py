@@ -1,24 +1,26 @@
-from flask import render_template, redirect, url_for, flash, request
+import json
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, abort
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 from flask_login import login_required, current_user
 from banking_app.customer import bp
-from banking_app.models import User, Account, Transaction
-from banking_app.forms import TransferForm, DepositForm, WithdrawalForm, CreateAccountForm
-from banking_app import db
+from banking_app.models import User, Account
+from banking_app.forms import TransferForm, DepositForm, WithdrawalForm, CreateAccountForm, BatchTransferForm
 from banking_app.utils import customer_required
+from banking_app import activity, batch, history, idempotency, postings, statements
+
+def _first_checking(accounts):
+    # From the already-loaded active accounts instead of another query
+    return next((a for a in accounts if a.account_type == 'checking'), None)
 
 @bp.route('/dashboard')
 @login_required
 @customer_required
 def dashboard():
     accounts = current_user.accounts.filter_by(is_active=True).all()
-    recent_transactions = []
-    
-    for account in accounts:
-        transactions = account.get_transactions()[:5]  # Get 5 most recent
-        recent_transactions.extend(transactions)
     
-    # Sort by date and get top 10
-    recent_transactions = sorted(recent_transactions, key=lambda x: x.created_at, reverse=True)[:10]
+    # Top 10 from the maintained recent-activity feed
+    recent_transactions = activity.recent_for_user(current_user.id, limit=10)
     
     return render_template('customer/dashboard.html', accounts=accounts, transactions=recent_transactions)
 
@@ -35,24 +37,7 @@ def accounts():
 def create_account():
     form = CreateAccountForm()
     if form.validate_on_submit():
-        account = Account(
-            account_type=form.account_type.data,
-            balance=form.initial_deposit.data or 0.0,
-            user_id=current_user.id
-        )
-        db.session.add(account)
-        
-        # If there's an initial deposit, create a transaction record
-        if form.initial_deposit.data and form.initial_deposit.data > 0:
-            transaction = Transaction(
-                transaction_type='deposit',
-                amount=form.initial_deposit.data,
-                description='Initial deposit',
-                to_account_id=account.id
-            )
-            db.session.add(transaction)
-        
-        db.session.commit()
+        postings.open_account(current_user.id, form.account_type.data, form.initial_deposit.data)
         flash(f'{form.account_type.data.title()} account created successfully!', 'success')
         return redirect(url_for('customer.accounts'))
     
@@ -61,13 +46,14 @@ def create_account():
 @bp.route('/transfer', methods=['GET', 'POST'])
 @login_required
 @customer_required
+@idempotency.idempotent
 def transfer():
     form = TransferForm()
     user_accounts = current_user.accounts.filter_by(is_active=True).all()
     
     if form.validate_on_submit():
         # Find source account (default to first checking account)
-        from_account = current_user.accounts.filter_by(account_type='checking', is_active=True).first()
+        from_account = _first_checking(user_accounts)
         if not from_account:
             flash('No checking account found for transfer', 'danger')
             return redirect(url_for('customer.transfer'))
@@ -78,61 +64,95 @@ def transfer():
             flash('Destination account not found', 'danger')
             return render_template('customer/transfer.html', form=form, accounts=user_accounts)
         
-        # Check if user has sufficient balance
-        if from_account.balance < form.amount.data:
-            flash('Insufficient funds', 'danger')
+        # Atomic conditional debit/credit; the funds check happens in the UPDATE
+        message = f'Successfully transferred ${form.amount.data:.2f} to account {to_account.account_number}'
+        idempotency.expect_redirect(url_for('customer.dashboard'), ('success', message))
+        try:
+            postings.transfer(from_account, to_account, form.amount.data, form.description.data)
+        except postings.PostingError as e:
+            flash(str(e), 'danger')
             return render_template('customer/transfer.html', form=form, accounts=user_accounts)
         
-        # Perform transfer
-        from_account.balance -= form.amount.data
-        to_account.balance += form.amount.data
-        
-        # Create transaction record
-        transaction = Transaction(
-            transaction_type='transfer',
-            amount=form.amount.data,
-            description=form.description.data or f'Transfer to {to_account.account_number}',
-            from_account_id=from_account.id,
-            to_account_id=to_account.id
-        )
-        
-        db.session.add(transaction)
-        db.session.commit()
-        
-        flash(f'Successfully transferred ${form.amount.data:.2f} to account {to_account.account_number}', 'success')
+        flash(message, 'success')
         return redirect(url_for('customer.dashboard'))
     
     return render_template('customer/transfer.html', form=form, accounts=user_accounts)
 
+@bp.route('/batch_transfer', methods=['GET', 'POST'])
+@login_required
+@customer_required
+@idempotency.idempotent
+def batch_transfer():
+    form = BatchTransferForm()
+    from_account = current_user.accounts.filter_by(account_type='checking', is_active=True).first()
+    
+    # JSON clients post the payee list directly (CSRF token in X-CSRFToken, key in
+    # Idempotency-Key)
+    if request.is_json:
+        if current_app.config.get('WTF_CSRF_ENABLED', True):
+            try:
+                validate_csrf(request.headers.get('X-CSRFToken'))
+            except ValidationError as e:
+                return jsonify({'error': str(e)}), 400
+        if not from_account:
+            return jsonify({'error': 'No checking account found for transfer'}), 400
+        try:
+            lines = batch.run_batch(from_account, batch.parse_json(request.get_json()))
+        except batch.BatchError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'summary': batch.summarize(lines), 'lines': [line.to_dict() for line in lines]})
+    
+    lines = None
+    if form.validate_on_submit():
+        if not from_account:
+            flash('No checking account found for transfer', 'danger')
+            return redirect(url_for('customer.batch_transfer'))
+        
+        try:
+            if form.payee_file.data:
+                upload = form.payee_file.data
+                text = upload.read().decode('utf-8-sig')
+                if upload.filename.lower().endswith('.json'):
+                    lines = batch.parse_json(json.loads(text))
+                else:
+                    lines = batch.parse_csv(text)
+            else:
+                lines = batch.parse_csv(form.payees.data or '')
+            lines = batch.run_batch(from_account, lines)
+        except (batch.BatchError, ValueError) as e:
+            flash(f'Could not process batch: {e}', 'danger')
+            lines = None
+        else:
+            summary = batch.summarize(lines)
+            flash(f"Posted {summary['posted']} of {summary['total']} transfers (${summary['amount_posted']})",
+                  'success' if not summary['failed'] else 'warning')
+    
+    return render_template('customer/batch_transfer.html', form=form, account=from_account, lines=lines)
+
 @bp.route('/deposit', methods=['GET', 'POST'])
 @login_required
 @customer_required
+@idempotency.idempotent
 def deposit():
     form = DepositForm()
     user_accounts = current_user.accounts.filter_by(is_active=True).all()
     
     if form.validate_on_submit():
         # Default to first checking account
-        account = current_user.accounts.filter_by(account_type='checking', is_active=True).first()
+        account = _first_checking(user_accounts)
         if not account:
             flash('No checking account found for deposit', 'danger')
             return redirect(url_for('customer.deposit'))
         
-        # Perform deposit
-        account.balance += form.amount.data
-        
-        # Create transaction record
-        transaction = Transaction(
-            transaction_type='deposit',
-            amount=form.amount.data,
-            description=form.description.data or 'Cash deposit',
-            to_account_id=account.id
-        )
+        message = f'Successfully deposited ${form.amount.data:.2f}'
+        idempotency.expect_redirect(url_for('customer.dashboard'), ('success', message))
+        try:
+            postings.deposit(account, form.amount.data, form.description.data)
+        except postings.PostingError as e:
+            flash(str(e), 'danger')
+            return render_template('customer/deposit.html', form=form, accounts=user_accounts)
         
-        db.session.add(transaction)
-        db.session.commit()
-        
-        flash(f'Successfully deposited ${form.amount.data:.2f}', 'success')
+        flash(message, 'success')
         return redirect(url_for('customer.dashboard'))
     
     return render_template('customer/deposit.html', form=form, accounts=user_accounts)
@@ -140,37 +160,28 @@ def deposit():
 @bp.route('/withdraw', methods=['GET', 'POST'])
 @login_required
 @customer_required
+@idempotency.idempotent
 def withdraw():
     form = WithdrawalForm()
     user_accounts = current_user.accounts.filter_by(is_active=True).all()
     
     if form.validate_on_submit():
         # Default to first checking account
-        account = current_user.accounts.filter_by(account_type='checking', is_active=True).first()
+        account = _first_checking(user_accounts)
         if not account:
             flash('No checking account found for withdrawal', 'danger')
             return redirect(url_for('customer.withdraw'))
         
-        # Check sufficient balance
-        if account.balance < form.amount.data:
-            flash('Insufficient funds', 'danger')
+        # Atomic conditional debit; the funds check happens in the UPDATE
+        message = f'Successfully withdrew ${form.amount.data:.2f}'
+        idempotency.expect_redirect(url_for('customer.dashboard'), ('success', message))
+        try:
+            postings.withdraw(account, form.amount.data, form.description.data)
+        except postings.PostingError as e:
+            flash(str(e), 'danger')
             return render_template('customer/withdraw.html', form=form, accounts=user_accounts)
         
-        # Perform withdrawal
-        account.balance -= form.amount.data
-        
-        # Create transaction record
-        transaction = Transaction(
-            transaction_type='withdrawal',
-            amount=form.amount.data,
-            description=form.description.data or 'Cash withdrawal',
-            from_account_id=account.id
-        )
-        
-        db.session.add(transaction)
-        db.session.commit()
-        
-        flash(f'Successfully withdrew ${form.amount.data:.2f}', 'success')
+        flash(message, 'success')
         return redirect(url_for('customer.dashboard'))
     
     return render_template('customer/withdraw.html', form=form, accounts=user_accounts)
@@ -179,23 +190,33 @@ def withdraw():
 @login_required
 @customer_required
 def transactions():
-    page = request.args.get('page', 1, type=int)
-    
-    # Get all transactions for user's accounts
-    user_accounts = current_user.accounts.filter_by(is_active=True).all()
-    all_transactions = []
+    cursor = request.args.get('cursor')
     
-    for account in user_accounts:
-        transactions = account.get_transactions()
-        all_transactions.extend(transactions)
+    # Keyset-paginated history across all of the user's active accounts
+    account_ids = [a.id for a in current_user.accounts.filter_by(is_active=True).with_entities(Account.id)]
+    transactions_page, next_cursor = history.transaction_page(account_ids, cursor=cursor)
     
-    # Sort by date
-    all_transactions = sorted(all_transactions, key=lambda x: x.created_at, reverse=True)
+    return render_template('customer/transactions.html', transactions=transactions_page,
+                           next_cursor=next_cursor, is_first_page=not cursor)
+
+@bp.route('/transactions/export.<fmt>')
+@login_required
+@customer_required
+def export_transactions(fmt):
+    if fmt not in statements.FORMATS:
+        abort(404)
+    try:
+        start = statements.parse_day(request.args.get('start'))
+        end = statements.parse_day(request.args.get('end'))
+    except ValueError:
+        abort(400)
     
-    # Paginate manually (for simplicity)
-    per_page = 20
-    start = (page - 1) * per_page
-    end = start + per_page
-    transactions_page = all_transactions[start:end]
+    # One account (?account=<number>) or every active account of the user
+    accounts = current_user.accounts.filter_by(is_active=True)
+    if request.args.get('account'):
+        accounts = accounts.filter_by(account_number=request.args['account'])
+    account_ids = [a.id for a in accounts.with_entities(Account.id)]
+    if request.args.get('account') and not account_ids:
+        abort(404)
     
-    return render_template('customer/transactions.html', transactions=transactions_page)
+    return statements.stream_response(fmt, statements.statement_query(account_ids, start, end), start, end)
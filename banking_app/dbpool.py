@@ -0,0 +1,112 @@
+"""
+Connection-pool instrumentation.
+
+The pool itself is sized in ``Config`` (see the pool profile there). This
+module swaps in ``TimedQueuePool``, a ``QueuePool`` that also records how long
+each checkout waited for a free connection and how many gave up after
+``DB_POOL_TIMEOUT``, and reports both with the pool's live occupancy. Numbers
+are per worker process: every gunicorn worker has its own pool.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolWaitStats:
+    __slots__ = ('_lock', 'checkouts', 'waited', 'total_wait', 'max_wait', 'timeouts')
+
+    # A checkout slower than this had to wait for a connection
+    WAIT_THRESHOLD = 0.001
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            if seconds >= self.WAIT_THRESHOLD:
+                self.waited += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def to_dict(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'waited': self.waited,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that times every checkout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return entry
+
+
+def pool_status(engine, config):
+    """Live pool occupancy, wait statistics and the configured profile."""
+    pool = engine.pool
+    status = {'pid': os.getpid(), 'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+    if isinstance(pool, TimedQueuePool):
+        status['wait'] = pool.wait_stats.to_dict()
+
+    workers = config.get('GUNICORN_WORKERS', 1)
+    per_worker = config.get('DB_POOL_SIZE', 0) + config.get('DB_MAX_OVERFLOW', 0)
+    status['profile'] = {
+        'workers': workers,
+        'threads': config.get('GUNICORN_THREADS'),
+        'pool_size': config.get('DB_POOL_SIZE'),
+        'max_overflow': config.get('DB_MAX_OVERFLOW'),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT'),
+        'pool_recycle': config.get('DB_POOL_RECYCLE'),
+        'pre_ping': config.get('DB_POOL_PRE_PING'),
+        'statement_timeout_ms': config.get('DB_STATEMENT_TIMEOUT_MS'),
+        'lock_timeout_ms': config.get('DB_LOCK_TIMEOUT_MS'),
+        'max_app_connections': workers * per_worker,
+        'db_max_connections': config.get('DB_MAX_CONNECTIONS'),
+    }
+    return status
+
+
+def init_app(app):
+    """Must run before ``db.init_app``: picks the pool class for the engine."""
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if 'pool_size' in options:
+        options.setdefault('poolclass', TimedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
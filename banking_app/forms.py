@@ -1,7 +1,28 @@
+import uuid
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SelectField, FloatField, TextAreaField, BooleanField
+from flask_wtf.file import FileField, FileAllowed
+from wtforms import StringField, PasswordField, SelectField, DecimalField, TextAreaField, BooleanField, HiddenField
 from wtforms.validators import DataRequired, Email, Length, NumberRange, ValidationError
-from banking_app.models import User
+from banking_app import account_numbers
+from banking_app.money import Money
+
+class MoneyField(DecimalField):
+    """Decimal input whose ``data`` is a ``Money`` value (exact cents)."""
+
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, places=2, **kwargs)
+
+    def process_formdata(self, valuelist):
+        super().process_formdata(valuelist)
+        if self.data is not None:
+            try:
+                self.data = Money.coerce(self.data)
+            except TypeError:
+                self.data = None
+                raise ValueError(self.gettext('Not a valid decimal value.')) from None
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=25)])
@@ -16,29 +37,47 @@ class RegistrationForm(FlaskForm):
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
 
     def validate_username(self, username):
+        from banking_app.models import User
         user = User.query.filter_by(username=username.data).first()
         if user:
             raise ValidationError('Username already exists. Please choose a different one.')
 
     def validate_email(self, email):
+        from banking_app.models import User
         user = User.query.filter_by(email=email.data).first()
         if user:
             raise ValidationError('Email already registered. Please use a different email.')
 
 class TransferForm(FlaskForm):
     to_account = StringField('To Account Number', validators=[DataRequired(), Length(min=10, max=10)])
-    amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01, max=5000)])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=Money(1))])
     description = TextAreaField('Description', validators=[Length(max=200)])
+    # Fresh per rendered form; resubmitting the same form posts once (see idempotency.py)
+    idempotency_key = HiddenField(default=new_idempotency_key)
+
+    def validate_to_account(self, to_account):
+        if not account_numbers.looks_valid(to_account.data):
+            raise ValidationError('Invalid account number. Please check it and try again.')
 
 class DepositForm(FlaskForm):
-    amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01, max=10000)])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=Money(1), max=Money(1000000))])
     description = TextAreaField('Description', validators=[Length(max=200)])
+    idempotency_key = HiddenField(default=new_idempotency_key)
 
 class WithdrawalForm(FlaskForm):
-    amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
+    amount = MoneyField('Amount', validators=[DataRequired(), NumberRange(min=Money(1))])
     description = TextAreaField('Description', validators=[Length(max=200)])
+    idempotency_key = HiddenField(default=new_idempotency_key)
 
 class CreateAccountForm(FlaskForm):
     account_type = SelectField('Account Type', choices=[('checking', 'Checking'), ('savings', 'Savings')], 
                              validators=[DataRequired()])
-    initial_deposit = FloatField('Initial Deposit', validators=[NumberRange(min=0)])
+    initial_deposit = MoneyField('Initial Deposit', validators=[NumberRange(min=Money())])
+
+class BatchTransferForm(FlaskForm):
+    payee_file = FileField('Payee File', validators=[FileAllowed(['csv', 'json'], 'Upload a .csv or .json file')])
+    payees = TextAreaField('Or Paste CSV', validators=[Length(max=1000000)])
+    idempotency_key = HiddenField(default=new_idempotency_key)
+
+class RefreshStatsForm(FlaskForm):
+    """CSRF-protected "recompute now" button on the admin dashboard."""
@@ -0,0 +1,167 @@
+"""
+Rendered-fragment cache and compiled-template cache.
+
+Transaction and account tables re-render the same rows on every request.
+Templates wrap a row in ``{% cache 'name', obj %}...{% endcache %}``: the
+rendered HTML is kept in a per-process LRU under ``name`` plus a key derived
+from ``obj`` by the function registered in ``KEYS``, so a hit costs a dict
+lookup instead of running the row's template code and any lazy loads in it.
+
+Keys carry everything that can change what a row shows. Transactions are
+immutable once posted apart from ``status``, so rows are keyed by id and
+status; account summaries are keyed by ``Account.version``, which every
+balance change bumps (see postings.py), so a posting invalidates them
+without any explicit purge. Views can ask ``uncached(name, objs)`` which
+rows will actually render and load related rows for just those (see
+``history.load_accounts``).
+
+Compiled templates are cached too: a ``FileSystemBytecodeCache`` lets a
+fresh worker load template bytecode instead of compiling, and
+``compile_templates`` fills it (``flask templates compile``, or the Gunicorn
+master before it forks, see startup.py).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from flask_login import current_user
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from banking_app import metrics
+
+
+def transaction_key(transaction):
+    return transaction.id, transaction.status
+
+
+def account_key(account):
+    return account.id, account.version
+
+
+def viewer_transaction_key(transaction):
+    # Direction (to/from, +/-) depends on whose dashboard it is
+    return transaction.id, transaction.status, current_user.id
+
+
+KEYS = {
+    'admin-transaction-row': transaction_key,
+    'admin-recent-transaction': transaction_key,
+    'customer-transaction': transaction_key,
+    'dashboard-transaction': viewer_transaction_key,
+    'account-card': account_key,
+    'dashboard-account': account_key,
+}
+
+
+class FragmentCache:
+    """Thread-safe in-process LRU of rendered fragments."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('fragments')
+
+
+def fragment_key(name, obj):
+    return (name,) + tuple(KEYS[name](obj))
+
+
+def uncached(name, objs):
+    """The members of ``objs`` whose ``name`` fragment will be rendered, not served from cache."""
+    cache = get_cache()
+    if cache is None:
+        return list(objs)
+    return [obj for obj in objs if fragment_key(name, obj) not in cache]
+
+
+# ----------------------------------------------------------------------
+# Jinja integration
+# ----------------------------------------------------------------------
+class FragmentCacheExtension(Extension):
+    """``{% cache 'name', obj %}body{% endcache %}`` renders ``body`` once per key."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        parser.stream.expect('comma')
+        obj = parser.parse_expression()
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [name, obj]), [], [], body).set_lineno(lineno)
+
+    def _render(self, name, obj, caller):
+        cache = get_cache()
+        if cache is None:
+            return caller()
+        key = fragment_key(name, obj)
+        html = cache.get(key)
+        if html is None:
+            metrics.inc('fragment_cache_total', fragment=name, result='miss')
+            html = Markup(caller())
+            cache.set(key, html)
+        else:
+            metrics.inc('fragment_cache_total', fragment=name, result='hit')
+        return html
+
+
+def compile_templates(app):
+    """Load every template once (compiling into the bytecode cache if enabled); returns the count."""
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    if app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+        directory = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            env.bytecode_cache = FileSystemBytecodeCache(directory)
+        else:
+            env.bytecode_cache = FileSystemBytecodeCache()
+
+    size = app.config.get('FRAGMENT_CACHE_SIZE', 10000)
+    if size:
+        cache = app.extensions['fragments'] = FragmentCache(size)
+        if 'metrics' in app.extensions:
+            app.extensions['metrics'].gauge('fragment_cache_entries', lambda: [({}, len(cache))],
+                                            'Rendered fragments held by this worker.')
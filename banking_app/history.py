@@ -0,0 +1,111 @@
+"""
+Transaction history engine.
+
+Answers "transactions touching any of these accounts, newest first" with a
+single SQL statement. Each side of the UNION walks its own composite index
+((from_account_id, created_at, id) / (to_account_id, created_at, id)) and
+stops after one page, so page N costs the same as page 1 regardless of how
+much history an account has.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, false, or_, select, union
+
+from banking_app.models import Account, Transaction
+
+DEFAULT_PAGE_SIZE = 20
+
+
+# ----------------------------------------------------------------------
+# Cursor helpers
+# ----------------------------------------------------------------------
+def encode_cursor(transaction):
+    """Opaque keyset cursor pointing just past ``transaction``."""
+    raw = f"{transaction.created_at.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` for a cursor, or ``None`` if it is invalid."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, txn_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(txn_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+# ----------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------
+def older_than(position):
+    """Keyset predicate: rows strictly after ``position`` in newest-first order."""
+    created_at, txn_id = position
+    return or_(
+        Transaction.created_at < created_at,
+        and_(Transaction.created_at == created_at, Transaction.id < txn_id),
+    )
+
+
+def _branch(column, account_ids, position, limit, filters):
+    stmt = select(Transaction.id).where(column.in_(account_ids), *filters)
+    if position:
+        stmt = stmt.where(older_than(position))
+    stmt = stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit)
+    # Wrapped so the per-branch ORDER BY / LIMIT survive inside the UNION
+    return select(stmt.subquery().c.id)
+
+
+def history_query(account_ids, position=None, limit=DEFAULT_PAGE_SIZE, filters=()):
+    """
+    Query for up to ``limit`` transactions touching ``account_ids``, newest
+    first. ``filters`` are extra ``Transaction`` criteria applied in each branch.
+    """
+    account_ids = list(account_ids)
+    if not account_ids:
+        return Transaction.query.filter(false())
+
+    candidate_ids = union(
+        _branch(Transaction.from_account_id, account_ids, position, limit, filters),
+        _branch(Transaction.to_account_id, account_ids, position, limit, filters),
+    ).subquery()
+
+    return (Transaction.query
+            .filter(Transaction.id.in_(select(candidate_ids.c.id)))
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .limit(limit))
+
+
+def transaction_page(account_ids, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of history.
+
+    Returns ``(transactions, next_cursor)``; ``next_cursor`` is ``None`` on the
+    last page.
+    """
+    rows = history_query(account_ids, decode_cursor(cursor), per_page + 1).all()
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def recent_transactions(account_ids, limit=10):
+    """The ``limit`` newest transactions touching ``account_ids``."""
+    return history_query(account_ids, limit=limit).all()
+
+
+def load_accounts(transactions):
+    """
+    Load the from/to accounts of ``transactions`` in one query. The
+    relationships then resolve from the session's identity map instead of
+    two lazy loads per row.
+    """
+    ids = {account_id for t in transactions for account_id in (t.from_account_id, t.to_account_id)
+           if account_id is not None}
+    if ids:
+        Account.query.filter(Account.id.in_(ids)).all()
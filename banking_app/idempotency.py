@@ -0,0 +1,323 @@
+"""
+Idempotency keys for money-moving POSTs.
+
+A POST carrying a key (the ``Idempotency-Key`` header, or the
+``idempotency_key`` field the posting forms embed) runs at most once per user
+and key. The first request claims the key by inserting a ``pending`` row into
+``idempotency_key`` (unique on user and key) and committing. The posting
+service marks the key done in the posting's own commit (``stage_completion``,
+see postings.py), so a key is never left pending once money has moved, even
+if the worker dies before the view returns. Form views announce their
+success redirect up front (``expect_redirect``), so that commit stores their
+final answer; otherwise it stores a provisional one, which the view's answer
+(a redirect and its flashed messages, or for JSON views, see api/routes.py,
+a 2xx body) replaces once it returns. Completed answers are also kept in an
+in-process LRU.
+
+Repeats are answered from the LRU or the row without running form
+validation or the posting. A repeat that arrives while the first request is
+still running waits up to ``IDEMPOTENCY_WAIT_SECONDS`` for it, then gets 409;
+reusing a key with a different payload gets 422. Any request that did not
+post (validation errors, a missing account, rejected postings, exceptions)
+releases the key, so the same form can be corrected and submitted again.
+
+Keys expire after ``IDEMPOTENCY_TTL_SECONDS``; ``sweep`` deletes expired rows
+in batches (``flask idempotency sweep``).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+from importlib import import_module
+
+from flask import abort, current_app, flash, g, make_response, redirect, request, session
+from flask_login import current_user
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from banking_app import db, metrics
+from banking_app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+POLL_INTERVAL = 0.05
+PROCESSED = 'This request was already processed.'
+
+Result = namedtuple('Result', 'fingerprint status location flashes body', defaults=(None,))
+
+
+def _file_digests(files):
+    digests = []
+    for name, upload in files.items(multi=True):
+        digests.append((name, upload.filename, hashlib.sha256(upload.read()).hexdigest()))
+        upload.seek(0)
+    return digests
+
+
+def fingerprint(endpoint, form, payload=None, files=None):
+    """Hash of the endpoint and submitted fields (CSRF token and key excluded), uploads or JSON payload."""
+    items = sorted((name, value) for name, values in form.lists()
+                   if name not in ('csrf_token', FIELD) for value in values)
+    if files:
+        items += sorted(_file_digests(files))
+    parts = [endpoint, items] if payload is None else [endpoint, items, payload]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe in-process LRU of completed results with a per-entry TTL."""
+
+    def __init__(self, maxsize=10000, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key):
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return result
+
+    def set(self, user_id, key, result):
+        with self._lock:
+            self._entries[(user_id, key)] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_cache():
+    return current_app.extensions['idempotency']
+
+
+# ----------------------------------------------------------------------
+# Dedup table
+# ----------------------------------------------------------------------
+def _row_filter(user_id, key):
+    return (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+
+
+def _insert_ignore(values):
+    """Insert the claim row unless the key exists; True if this call created it."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        module = import_module(f'sqlalchemy.dialects.{dialect}')
+        stmt = module.insert(IdempotencyKey).values(**values).on_conflict_do_nothing()
+        return db.session.execute(stmt).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(IdempotencyKey).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def claim(user_id, key, endpoint, fp):
+    """Record ``key`` as in progress and commit; False if it is already taken."""
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+    values = {'user_id': user_id, 'key': key, 'endpoint': endpoint, 'fingerprint': fp,
+              'state': 'pending', 'created_at': now, 'expires_at': now + ttl}
+    created = _insert_ignore(values)
+    if not created:
+        # An expired key that has not been swept yet is free again
+        expired = db.session.execute(
+            delete(IdempotencyKey).where(*_row_filter(user_id, key), IdempotencyKey.expires_at < now))
+        if expired.rowcount:
+            created = _insert_ignore(values)
+    db.session.commit()
+    return created
+
+
+def load(user_id, key):
+    """The live ``Result`` for ``key`` (``status`` is ``None`` while pending), else ``None``."""
+    row = db.session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.state, IdempotencyKey.response)
+        .where(*_row_filter(user_id, key), IdempotencyKey.expires_at >= datetime.utcnow())).first()
+    db.session.rollback()  # end the read so the next poll sees fresh data
+    if row is None:
+        return None
+    if row.state != 'done':
+        return Result(row.fingerprint, None, None, [])
+    stored = json.loads(row.response)
+    return Result(row.fingerprint, stored['status'], stored['location'], [tuple(f) for f in stored['flashes']],
+                  stored.get('body'))
+
+
+def _dump(result):
+    return json.dumps({'status': result.status, 'location': result.location,
+                       'flashes': result.flashes, 'body': result.body})
+
+
+def expect_redirect(location, *flashes):
+    """
+    Declare the redirect (and ``(category, message)`` flashes) the current
+    view answers with once its posting commits, so ``stage_completion`` stores
+    it in that commit. Call before the posting.
+    """
+    g.idempotency_expected = (location, list(flashes))
+
+
+def stage_completion():
+    """
+    Mark the current request's key done in the caller's transaction. Called by
+    the posting service right before it commits; a no-op without a claimed key.
+
+    The stored answer is the view's expected redirect, or else provisional (the
+    view has not returned yet): a redirect back to the form, or a 200 JSON
+    body, saying the request was already processed.
+    """
+    claimed = g.get('idempotency_claim')
+    if claimed is None:
+        return
+    user_id, key, fp = claimed
+    if 'idempotency_expected' in g:
+        location, flashes = g.idempotency_expected
+        result = Result(fp, 302, location, flashes)
+    elif request.is_json:
+        result = Result(fp, 200, None, [], json.dumps({'message': PROCESSED}))
+    else:
+        result = Result(fp, 302, request.path, [('info', PROCESSED)])
+    db.session.execute(update(IdempotencyKey).where(*_row_filter(user_id, key))
+                       .values(state='done', response=_dump(result)))
+    g.idempotency_staged = result
+
+
+def confirm_completion():
+    """Called by the posting service once the commit that staged the completion succeeded."""
+    if 'idempotency_staged' in g:
+        g.idempotency_done = g.pop('idempotency_staged')
+
+
+def complete(user_id, key, result):
+    """Replace the answer stored when the posting marked ``key`` done with the view's own."""
+    db.session.execute(update(IdempotencyKey)
+                       .where(*_row_filter(user_id, key), IdempotencyKey.state == 'done')
+                       .values(response=_dump(result)))
+    db.session.commit()
+
+
+def release(user_id, key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(*_row_filter(user_id, key),
+                                                    IdempotencyKey.state == 'pending'))
+    db.session.commit()
+
+
+def sweep(batch_size=1000, now=None):
+    """Delete expired keys, committing every ``batch_size`` rows. Returns the count."""
+    now = now or datetime.utcnow()
+    deleted = 0
+    while True:
+        batch = select(IdempotencyKey.id).where(IdempotencyKey.expires_at < now).limit(batch_size)
+        count = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(batch))).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+# ----------------------------------------------------------------------
+# View decorator
+# ----------------------------------------------------------------------
+def _replay(result, fp, source):
+    if result.fingerprint != fp:
+        metrics.inc('idempotency_conflicts_total', reason='payload')
+        abort(422, description='This idempotency key was already used for a different request.')
+    metrics.inc('idempotency_replays_total', source=source)
+    if result.body is not None:
+        response = current_app.response_class(result.body, status=result.status, mimetype='application/json')
+        if result.location:
+            response.headers['Location'] = result.location
+        return response
+    for category, message in result.flashes:
+        flash(message, category)
+    return redirect(result.location, code=result.status)
+
+
+def _wait_for(user_id, key, fp):
+    """Result of the request holding ``key``, polled until it completes; ``None`` if released."""
+    deadline = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 2)
+    while True:
+        result = load(user_id, key)
+        if result is None or result.status is not None or result.fingerprint != fp:
+            return result
+        if time.monotonic() >= deadline:
+            metrics.inc('idempotency_conflicts_total', reason='in_progress')
+            abort(409, description='This request is already being processed.')
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(view):
+    """Run a POST view at most once per user and idempotency key (see module docstring)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(HEADER) or request.form.get(FIELD)) if request.method == 'POST' else None
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            abort(400, description=f'Idempotency keys are at most {MAX_KEY_LENGTH} characters.')
+
+        user_id = current_user.id
+        fp = fingerprint(request.endpoint, request.form, request.get_json(silent=True) if request.is_json else None,
+                         request.files)
+        cached = get_cache().get(user_id, key)
+        if cached is not None:
+            return _replay(cached, fp, 'cache')
+
+        while not claim(user_id, key, request.endpoint, fp):
+            result = _wait_for(user_id, key, fp)
+            if result is not None:
+                if result.status is not None:
+                    get_cache().set(user_id, key, result)
+                return _replay(result, fp, 'db')
+            # The first attempt was released (rejected): run this one instead
+
+        flashed = len(session.get('_flashes', []))
+        g.idempotency_claim = (user_id, key, fp)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            release(user_id, key)
+            raise
+        finally:
+            g.pop('idempotency_claim', None)
+            g.pop('idempotency_expected', None)
+            g.pop('idempotency_staged', None)
+            done = g.pop('idempotency_done', None)
+        if done is None:
+            # Nothing was posted under this key
+            release(user_id, key)
+            return response
+        result = done
+        if 300 <= response.status_code < 400:
+            result = Result(fp, response.status_code, response.location,
+                            [tuple(f) for f in session.get('_flashes', [])[flashed:]])
+        elif response.is_json and 200 <= response.status_code < 300:
+            result = Result(fp, response.status_code, response.location, [], response.get_data(as_text=True))
+        if result != done:
+            complete(user_id, key, result)
+        get_cache().set(user_id, key, result)
+        return response
+    return wrapper
+
+
+def init_app(app):
+    app.extensions['idempotency'] = ResultCache(app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000),
+                                                app.config.get('IDEMPOTENCY_TTL_SECONDS', 86400))
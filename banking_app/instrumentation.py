@@ -0,0 +1,135 @@
+"""
+Per-request query instrumentation.
+
+Counts SQL statements, total DB time and repeated statement shapes for each
+request via SQLAlchemy engine events. Results go out as a ``Server-Timing``
+header and one structured log line per request. Endpoints listed in
+``QUERY_BUDGETS`` (or covered by ``QUERY_BUDGET_DEFAULT``) are checked against
+their statement budget; in strict mode (on by default under ``TESTING``) an
+overrun raises ``QueryBudgetExceeded`` so regressions fail the test run. A
+write (POST etc.) has usually committed by then, so its overrun is recorded
+in ``app.extensions['query_budget_overruns']`` instead of turning a posted
+request into a 500; the test suite fails on any recorded overrun.
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from banking_app import db, metrics
+
+logger = logging.getLogger('banking_app.queries')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when an endpoint runs more statements than budgeted."""
+
+
+class RequestQueryStats:
+    __slots__ = ('count', 'duration', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold):
+        """Statement shapes executed at least ``threshold`` times (likely N+1)."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def current_stats():
+    """Stats for the active request, or ``None`` outside a request."""
+    if not has_request_context():
+        return None
+    return g.get('_query_stats')
+
+
+# ----------------------------------------------------------------------
+# Engine hooks
+# ----------------------------------------------------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start_time'].pop()
+    metrics.observe('db_query_duration_seconds', duration)
+    stats = current_stats()
+    if stats is not None:
+        # Statements are already parameterised, so the text is the shape
+        stats.record(statement, duration)
+
+
+# ----------------------------------------------------------------------
+# Request hooks
+# ----------------------------------------------------------------------
+def _budget_for(app, endpoint):
+    return app.config.get('QUERY_BUDGETS', {}).get(endpoint, app.config.get('QUERY_BUDGET_DEFAULT'))
+
+
+def init_app(app):
+    # Statement timing also feeds db_query_duration_seconds (see metrics.py)
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if not app.config.get('QUERY_INSTRUMENTATION', True):
+        return
+
+    repeat_threshold = app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+    app.extensions['query_budget_overruns'] = []
+
+    @app.before_request
+    def _start_query_stats():
+        g._query_stats = RequestQueryStats()
+
+    @app.after_request
+    def _report_query_stats(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+
+        db_ms = stats.duration * 1000
+        response.headers.add(
+            'Server-Timing', f'db;dur={db_ms:.2f};desc="{stats.count} queries"')
+
+        repeated = stats.repeated(repeat_threshold)
+        logger.info(json.dumps({
+            'event': 'request_queries',
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(db_ms, 2),
+            'repeated': [{'count': n, 'statement': shape[:200]} for shape, n in repeated],
+        }))
+        if repeated:
+            logger.warning('Possible N+1 on %s: %d statement shape(s) repeated >= %d times',
+                           request.endpoint, len(repeated), repeat_threshold)
+
+        budget = _budget_for(app, request.endpoint)
+        if budget is not None and stats.count > budget:
+            message = f'{request.endpoint} ran {stats.count} queries (budget {budget})'
+            strict = app.config.get('QUERY_BUDGET_STRICT')
+            if strict is None:
+                strict = app.testing
+            if strict and request.method in SAFE_METHODS:
+                raise QueryBudgetExceeded(message)
+            if strict:
+                app.extensions['query_budget_overruns'].append(message)
+            logger.warning('Query budget exceeded: %s', message)
+        return response
@@ -0,0 +1,223 @@
+"""
+Append-only double-entry journal.
+
+Every balance change made by the posting service is also written to
+``journal_entry`` as one signed leg per account: debits negative, credits
+positive, numbered by a per-account ``sequence``. A transfer therefore yields a
+balanced debit/credit pair; deposits and withdrawals pair with the bank's
+external cash position, which is not an account row.
+
+Every ``LEDGER_SNAPSHOT_INTERVAL`` entries the account's balance is
+checkpointed in ``balance_snapshot``, so a point-in-time balance is the
+nearest snapshot plus the sum over a short, indexed range of entries.
+
+Balances that predate the journal are journaled as one ``opening`` entry
+(schema revision 12, or ``flask ledger backfill``): sequence 1 for an
+account with no entries yet, sequence 0 for one that has already posted
+since, carrying whatever its entries do not explain.
+"""
+
+from flask import current_app
+from sqlalchemy import case, func, insert, select, update
+
+from banking_app import db
+from banking_app.models import Account, BalanceSnapshot, JournalEntry
+from banking_app.money import Money
+
+DEFAULT_SNAPSHOT_INTERVAL = 100
+
+
+def snapshot_interval():
+    return current_app.config.get('LEDGER_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL)
+
+
+def _leg_rows(account_id, delta, sequence, balance_after, transaction_id, entry_type):
+    delta = Money.coerce(delta)
+    entry = {
+        'account_id': account_id,
+        'sequence': sequence,
+        'entry_type': entry_type or ('debit' if delta < 0 else 'credit'),
+        'amount': delta,
+        'transaction_id': transaction_id,
+    }
+    snapshot = None
+    if sequence % snapshot_interval() == 0:
+        snapshot = {'account_id': account_id, 'sequence': sequence, 'balance': balance_after}
+    return entry, snapshot
+
+
+def _insert(entries, snapshots):
+    # Plain executemany INSERTs: journal rows are never read back in the posting
+    if entries:
+        db.session.execute(insert(JournalEntry), entries)
+    if snapshots:
+        db.session.execute(insert(BalanceSnapshot), snapshots)
+
+
+def _columns(model, row):
+    """``row`` keyed by column name, for core INSERTs on a plain connection."""
+    return {model.__mapper__.attrs[key].columns[0].key: value for key, value in row.items()}
+
+
+def record_leg(account_id, delta, sequence, balance_after, transaction_id=None, entry_type=None):
+    """
+    Journal one account leg. Called inside the posting's DB transaction.
+
+    ``sequence`` and ``balance_after`` come from the same UPDATE that moved the
+    balance, so they are consistent even under concurrent postings.
+    """
+    entry, snapshot = _leg_rows(account_id, delta, sequence, balance_after, transaction_id, entry_type)
+    _insert([entry], [snapshot] if snapshot else [])
+
+
+def record_legs(applied):
+    """
+    Journal legs applied by per-account UPDATEs, with one INSERT per table.
+
+    ``applied`` is a list of ``(account_id, legs, last_sequence, final_balance)``
+    where ``legs`` is ``[(delta, transaction_id), ...]`` in posting order and
+    the UPDATE reserved sequences ``last_sequence - len(legs) + 1 ..
+    last_sequence``, leaving the account at ``final_balance``.
+    """
+    entries, snapshots = [], []
+    for account_id, legs, last_sequence, final_balance in applied:
+        balance = Money.coerce(final_balance) - sum((Money.coerce(d) for d, _ in legs), Money())
+        first = last_sequence - len(legs) + 1
+        for offset, (delta, transaction_id) in enumerate(legs):
+            balance += delta
+            entry, snapshot = _leg_rows(account_id, delta, first + offset, balance, transaction_id, None)
+            entries.append(entry)
+            if snapshot:
+                snapshots.append(snapshot)
+    _insert(entries, snapshots)
+
+
+# ----------------------------------------------------------------------
+# Point-in-time balances
+# ----------------------------------------------------------------------
+def balance_at(account_id, sequence=None, at=None):
+    """
+    Balance of ``account_id`` after journal entry ``sequence``, or as of time
+    ``at``; the current journal balance when neither is given.
+    """
+    if at is not None:
+        sequence = (db.session.query(func.max(JournalEntry.sequence))
+                    .filter(JournalEntry.account_id == account_id, JournalEntry.created_at <= at)
+                    .scalar())
+        if sequence is None:
+            sequence = -1  # before the first entry
+
+    snapshot_query = BalanceSnapshot.query.filter(BalanceSnapshot.account_id == account_id)
+    if sequence is not None:
+        snapshot_query = snapshot_query.filter(BalanceSnapshot.sequence <= sequence)
+    snapshot = snapshot_query.order_by(BalanceSnapshot.sequence.desc()).first()
+
+    # Without a snapshot start before sequence 0 (a late opening entry)
+    base, after = (snapshot.balance, snapshot.sequence) if snapshot else (Money(), -1)
+    delta_query = db.session.query(func.sum(JournalEntry.amount)).filter(
+        JournalEntry.account_id == account_id, JournalEntry.sequence > after)
+    if sequence is not None:
+        delta_query = delta_query.filter(JournalEntry.sequence <= sequence)
+    return base + (delta_query.scalar() or Money())
+
+
+# ----------------------------------------------------------------------
+# Maintenance
+# ----------------------------------------------------------------------
+def journal_openings(executor, batch_size=1000, commit=None):
+    """
+    Journal an ``opening`` entry for every account whose balance its journal
+    does not explain and that has none yet: rows created before the journal
+    existed, including ones that have posted since. ``executor`` is a
+    connection (schema revisions) or the session; ``commit`` runs after each
+    batch. Returns the count.
+    """
+    journal = (select(JournalEntry.account_id,
+                      func.sum(JournalEntry.amount).label('total'),
+                      func.sum(case((JournalEntry.entry_type == 'opening', 1), else_=0)).label('openings'))
+               .group_by(JournalEntry.account_id)
+               .subquery())
+    created = 0
+    last_id = 0
+    while True:
+        # Balance and journal total from one statement, so a posting that
+        # commits meanwhile is either in both or in neither
+        accounts = executor.execute(
+            select(Account.id, Account.balance.label('balance'), Account.last_sequence,
+                   journal.c.total, journal.c.openings)
+            .outerjoin(journal, journal.c.account_id == Account.id)
+            .where(Account.id > last_id)
+            .order_by(Account.id)
+            .limit(batch_size)).all()
+        if not accounts:
+            break
+        last_id = accounts[-1].id
+        for account in accounts:
+            missing = Money.coerce(account.balance) - (account.total or Money())
+            if not missing or account.openings:
+                continue
+            if account.last_sequence == 0:
+                claimed = executor.execute(
+                    update(Account).where(Account.id == account.id, Account.last_sequence == 0)
+                    .values(last_sequence=1).execution_options(synchronize_session=False)).rowcount
+                if not claimed:
+                    continue  # posted meanwhile; the next run journals it at sequence 0
+                entry, snapshot = _leg_rows(account.id, missing, 1, account.balance, None, 'opening')
+            else:
+                entry, snapshot = _leg_rows(account.id, missing, 0, missing, None, 'opening')
+                snapshot = None  # sequence 0 precedes every snapshot
+            executor.execute(insert(JournalEntry.__table__), [_columns(JournalEntry, entry)])
+            if snapshot:
+                executor.execute(insert(BalanceSnapshot.__table__), [_columns(BalanceSnapshot, snapshot)])
+            created += 1
+        if commit:
+            commit()
+    return created
+
+
+def backfill_opening_balances(batch_size=1000):
+    """Journal opening balances the journal is missing (see ``journal_openings``). Returns the count."""
+    return journal_openings(db.session, batch_size, commit=db.session.commit)
+
+
+def verify(batch_size=1000):
+    """
+    Check the journal against ``Account.balance``, one batch of accounts at a
+    time so memory stays flat. Yields ``(account_id, problem)`` for every
+    mismatch; an empty result means the journal agrees with every balance.
+    """
+    last_id = 0
+    while True:
+        accounts = (db.session.query(Account.id, Account.balance, Account.last_sequence)
+                    .filter(Account.id > last_id)
+                    .order_by(Account.id)
+                    .limit(batch_size)
+                    .all())
+        if not accounts:
+            break
+        last_id = accounts[-1].id
+
+        totals = {
+            row.account_id: row
+            for row in db.session.query(
+                JournalEntry.account_id,
+                func.sum(JournalEntry.amount).label('total'),
+                func.count(JournalEntry.id).label('entries'),
+                func.min(JournalEntry.sequence).label('min_sequence'),
+                func.max(JournalEntry.sequence).label('max_sequence'),
+            ).filter(JournalEntry.account_id.in_([a.id for a in accounts]))
+             .group_by(JournalEntry.account_id)
+        }
+        for account in accounts:
+            row = totals.get(account.id)
+            total = row.total if row else Money()
+            entries = row.entries if row else 0
+            max_sequence = row.max_sequence if row else 0
+            # A late opening entry sits at sequence 0, before the posted ones
+            expected = account.last_sequence + (1 if row and row.min_sequence == 0 else 0)
+            if total != account.balance:
+                yield account.id, f'journal total {total} != balance {account.balance}'
+            if entries != expected or max_sequence != account.last_sequence:
+                yield account.id, (f'{entries} entries up to #{max_sequence}, '
+                                   f'expected #{account.last_sequence} without gaps')
+        db.session.expire_all()
@@ -0,0 +1,129 @@
+"""
+Transaction limits.
+
+``TRANSACTION_LIMIT_SINGLE`` caps one outgoing posting and
+``TRANSACTION_LIMIT_DAILY`` caps an account's outgoing total per UTC day;
+either can be overridden per account (``Account.single_limit`` /
+``Account.daily_limit``).
+
+Daily usage lives in a ``daily_usage`` counter row per account and day that is
+bumped by a conditional upsert in the same DB transaction as the posting, so
+the check costs one indexed statement no matter how many transactions the
+account made today, the first included. ``reconcile`` rebuilds the counters from ``Transaction``
+history.
+"""
+
+from datetime import datetime, timedelta
+from importlib import import_module
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from banking_app import db
+from banking_app.models import DailyUsage, Transaction
+from banking_app.money import Money
+
+OUTGOING_TYPES = ('transfer', 'withdrawal')
+
+
+def today():
+    return datetime.utcnow().date()
+
+
+def single_limit(account):
+    """Largest single outgoing posting allowed for ``account``."""
+    override = getattr(account, 'single_limit', None)
+    return override if override is not None else Money.coerce(current_app.config['TRANSACTION_LIMIT_SINGLE'])
+
+
+def daily_limit(account):
+    """Outgoing total allowed per UTC day for ``account``."""
+    override = getattr(account, 'daily_limit', None)
+    return override if override is not None else Money.coerce(current_app.config['TRANSACTION_LIMIT_DAILY'])
+
+
+def _insert_ignore(account_id, day):
+    """Create today's counter row if missing; True if this call created it."""
+    values = {'account_id': account_id, 'day': day, 'used': Money()}
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # Imported on first use: the postgresql dialect package is heavy to load at startup
+        module = import_module(f'sqlalchemy.dialects.{dialect}')
+        stmt = module.insert(DailyUsage).values(**values).on_conflict_do_nothing()
+        return db.session.execute(stmt).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(DailyUsage).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def consume(account_id, amount, limit, day=None):
+    """
+    Add ``amount`` to the account's usage for ``day`` if it stays within
+    ``limit``. Returns False (and changes nothing) when it would not.
+    """
+    amount = Money.coerce(amount)
+    limit = Money.coerce(limit)
+    if amount > limit:
+        return False
+    day = day or today()
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # Create today's row or add to it, unless that would pass the limit
+        module = import_module(f'sqlalchemy.dialects.{dialect}')
+        used = DailyUsage.__table__.c.used_cents
+        stmt = (module.insert(DailyUsage)
+                .values(account_id=account_id, day=day, used=amount)
+                .on_conflict_do_update(index_elements=['account_id', 'day'],
+                                       set_={used: used + amount},
+                                       where=used <= limit - amount))
+        return db.session.execute(stmt).rowcount == 1
+
+    stmt = (update(DailyUsage)
+            .where(DailyUsage.account_id == account_id,
+                   DailyUsage.day == day,
+                   DailyUsage.used <= limit - amount)
+            .values(used=DailyUsage.used + amount)
+            .execution_options(synchronize_session=False))
+
+    if db.session.execute(stmt).rowcount == 1:
+        return True
+    # Either no counter yet today, or already over the limit
+    if _insert_ignore(account_id, day):
+        return db.session.execute(stmt).rowcount == 1
+    return False
+
+
+def remaining(account):
+    """Outgoing allowance left today for ``account``."""
+    used = (db.session.query(DailyUsage.used)
+            .filter_by(account_id=account.id, day=today())
+            .scalar()) or Money()
+    return max(daily_limit(account) - used, Money())
+
+
+def reconcile(day=None):
+    """
+    Rebuild every counter for ``day`` (default today) from ``Transaction``
+    history. Returns the number of accounts with usage.
+    """
+    day = day or today()
+    start = datetime.combine(day, datetime.min.time())
+    totals = (db.session.query(Transaction.from_account_id, func.sum(Transaction.amount))
+              .filter(Transaction.from_account_id.isnot(None),
+                      Transaction.transaction_type.in_(OUTGOING_TYPES),
+                      Transaction.created_at >= start,
+                      Transaction.created_at < start + timedelta(days=1))
+              .group_by(Transaction.from_account_id)
+              .all())
+
+    DailyUsage.query.filter_by(day=day).delete(synchronize_session=False)
+    if totals:
+        db.session.execute(insert(DailyUsage), [
+            {'account_id': account_id, 'day': day, 'used': used} for account_id, used in totals
+        ])
+    db.session.commit()
+    return len(totals)
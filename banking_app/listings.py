@@ -0,0 +1,193 @@
+"""
+Admin list queries.
+
+Users, accounts and transactions are paged with keyset cursors (newest first)
+instead of ``OFFSET``, so page 500 costs the same as page 1, and every filter
+maps onto an indexed column: prefix searches are range predicates
+(``col >= 'ab' AND col < 'ab\\U0010ffff'``) that a B-tree can seek, and
+transaction filters ride the ``(transaction_type|status, created_at, id)``
+indexes. Totals are approximate: the planner's row estimate on PostgreSQL,
+otherwise a count capped at ``ADMIN_COUNT_CAP``.
+"""
+
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, inspect, or_, text
+from sqlalchemy.orm import joinedload
+
+from banking_app import db
+from banking_app import history
+from banking_app.models import Account, Role, Transaction, User
+
+DEFAULT_COUNT_CAP = 1000
+PREFIX_END = '\U0010ffff'
+
+Page = namedtuple('Page', 'items next_cursor total')
+
+
+class Count:
+    """A row count that may be an estimate (``~``) or a lower bound (``+``)."""
+    __slots__ = ('value', 'kind')
+
+    def __init__(self, value, kind='exact'):
+        self.value = value
+        self.kind = kind  # exact, estimate, at_least
+
+    def __str__(self):
+        if self.kind == 'estimate':
+            return f'~{self.value:,}'
+        if self.kind == 'at_least':
+            return f'{self.value:,}+'
+        return f'{self.value:,}'
+
+
+# ----------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------
+def prefix(column, value):
+    """Index-friendly ``column LIKE 'value%'``."""
+    return and_(column >= value, column < value + PREFIX_END)
+
+
+def day_range(column, start=None, end=None):
+    """Criteria for ``start <= column < end + 1 day`` (dates, both optional)."""
+    criteria = []
+    if start:
+        criteria.append(column >= datetime.combine(start, datetime.min.time()))
+    if end:
+        criteria.append(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return criteria
+
+
+def explain(query):
+    """``EXPLAIN (FORMAT JSON)`` of ``query`` with its values still bound as parameters."""
+    dialect = type(db.session.get_bind().dialect)(paramstyle='named')
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    return text(f'EXPLAIN (FORMAT JSON) {compiled}').bindparams(*(
+        bindparam(name, value, type_=compiled.binds[name].type if name in compiled.binds else None)
+        for name, value in compiled.params.items()))
+
+
+def _planner_estimate(query):
+    plan = db.session.execute(explain(query)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(query):
+    """Cheap ``Count`` of the rows ``query`` would return."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        try:
+            with db.session.begin_nested():
+                return Count(_planner_estimate(query), 'estimate')
+        except Exception:  # unsupported literal etc.: fall back to the capped count
+            current_app.logger.debug('Planner estimate failed', exc_info=True)
+
+    cap = current_app.config.get('ADMIN_COUNT_CAP', DEFAULT_COUNT_CAP)
+    primary_key = inspect(query.column_descriptions[0]['entity']).primary_key
+    capped = query.with_entities(*primary_key).order_by(None).limit(cap + 1).subquery()
+    value = db.session.query(func.count()).select_from(capped).scalar()
+    return Count(cap, 'at_least') if value > cap else Count(value)
+
+
+def _decode_id(cursor):
+    try:
+        return int(cursor) if cursor else None
+    except ValueError:
+        return None
+
+
+def _id_page(query, model, cursor, per_page):
+    """Newest-first page of ``query`` keyed on ``model.id``."""
+    after = _decode_id(cursor)
+    if after:
+        query = query.filter(model.id < after)
+    rows = query.order_by(model.id.desc()).limit(per_page + 1).all()
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, str(rows[-1].id)
+    return rows, None
+
+
+# ----------------------------------------------------------------------
+# Lists
+# ----------------------------------------------------------------------
+def user_page(q=None, role=None, status=None, cursor=None, per_page=20):
+    """Users matching a username/email prefix, role name and active status."""
+    query = User.query
+    if q:
+        query = query.filter(or_(prefix(User.username, q), prefix(User.email, q)))
+    if role:
+        query = query.filter(User.role_id.in_(db.session.query(Role.id).filter(Role.name == role)))
+    if status in ('active', 'inactive'):
+        query = query.filter(User.is_active.is_(status == 'active'))
+
+    rows, next_cursor = _id_page(query.options(joinedload(User.role)), User, cursor, per_page)
+    return Page(rows, next_cursor, approximate_count(query))
+
+
+def account_page(q=None, account_type=None, status='active', user_id=None, cursor=None, per_page=20):
+    """Accounts matching an account-number prefix, type, status and owner."""
+    query = Account.query
+    if q:
+        query = query.filter(prefix(Account.account_number, q))
+    if account_type:
+        query = query.filter(Account.account_type == account_type)
+    if status in ('active', 'inactive'):
+        query = query.filter(Account.is_active.is_(status == 'active'))
+    if user_id:
+        query = query.filter(Account.user_id == user_id)
+
+    rows, next_cursor = _id_page(query.options(joinedload(Account.owner)), Account, cursor, per_page)
+    return Page(rows, next_cursor, approximate_count(query))
+
+
+def transaction_page(account_number=None, user_id=None, transaction_type=None, status=None,
+                     start=None, end=None, cursor=None, per_page=50, with_accounts=True):
+    """
+    Transactions newest first, optionally narrowed to one account (exact
+    number) or one user's accounts, a type, a status and a date range.
+    ``with_accounts=False`` leaves the from/to accounts to the caller (see
+    ``history.load_accounts``).
+    """
+    filters = day_range(Transaction.created_at, start, end)
+    if transaction_type:
+        filters.append(Transaction.transaction_type == transaction_type)
+    if status:
+        filters.append(Transaction.status == status)
+
+    account_ids = None
+    if account_number or user_id:
+        accounts = db.session.query(Account.id)
+        if account_number:
+            accounts = accounts.filter(Account.account_number == account_number)
+        if user_id:
+            accounts = accounts.filter(Account.user_id == user_id)
+        account_ids = [row.id for row in accounts]
+
+    position = history.decode_cursor(cursor)
+    if account_ids is not None:
+        # Walks the per-account indexes like the customer history
+        page = history.history_query(account_ids, position, per_page + 1, filters)
+        count_query = Transaction.query.filter(
+            or_(Transaction.from_account_id.in_(account_ids), Transaction.to_account_id.in_(account_ids)),
+            *filters)
+    else:
+        count_query = Transaction.query.filter(*filters)
+        page = count_query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        if position:
+            page = page.filter(history.older_than(position))
+        page = page.limit(per_page + 1)
+
+    if with_accounts:
+        page = page.options(joinedload(Transaction.from_account), joinedload(Transaction.to_account))
+    rows = page.all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = history.encode_cursor(rows[-1])
+    return Page(rows, next_cursor, approximate_count(count_query))
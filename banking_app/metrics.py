@@ -0,0 +1,299 @@
+"""
+In-process metrics registry.
+
+Latencies are recorded into fixed-bucket histograms: an observation is one
+``bisect`` and a few integer increments, so instrumenting a hot path costs
+microseconds. Each histogram keeps lifetime bucket counts (exported to
+Prometheus as ``_bucket``/``_sum``/``_count``) and a ring of time slices
+covering the last ``METRICS_WINDOW_SECONDS``, from which p50/p95/p99 are
+interpolated for the admin health page and ``<name>_window`` gauges.
+
+Recorded out of the box:
+
+* ``http_request_duration_seconds{endpoint}`` and ``http_requests_total``
+* ``db_query_duration_seconds`` (every statement, see instrumentation.py)
+* ``password_kdf_seconds{op}`` (hash/verify, see passwords.py)
+* ``posting_commit_seconds{kind}`` (see postings.py)
+
+Metrics are per worker process; Prometheus should scrape each worker or
+aggregate across them. ``/metrics`` answers 404 until ``METRICS_TOKEN`` is
+set, and then only to ``Authorization: Bearer <token>``.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+from flask import Response, abort, current_app, g, has_app_context, request
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    'http_request_duration_seconds': 'Request latency by endpoint.',
+    'http_requests_total': 'Requests by endpoint, method and status.',
+    'db_query_duration_seconds': 'Round-trip time of each SQL statement.',
+    'password_kdf_seconds': 'Password hashing/verification time.',
+    'posting_commit_seconds': 'Commit time of ledger postings.',
+    'idempotency_replays_total': 'Repeated POSTs answered from a stored result, by source.',
+    'idempotency_conflicts_total': 'Repeated POSTs rejected (key in progress or reused with another payload).',
+    'ratelimit_decisions_total': 'Rate-limit decisions on login/registration, by rule and outcome.',
+    'api_conditional_total': 'Conditional API reads answered 304 (not_modified) or in full (modified), by endpoint.',
+    'fragment_cache_total': 'Cached template fragments served (hit) or rendered (miss), by fragment.',
+    'db_ping_seconds': 'SELECT 1 round trip sampled by the readiness checker.',
+}
+
+
+def interpolate(buckets, counts, quantiles=QUANTILES):
+    """``{q: value}`` from bucket ``counts``, linear within a bucket (``None`` when empty)."""
+    observed = sum(counts)
+    result = {}
+    for q in quantiles:
+        result[q] = None
+        if not observed:
+            continue
+        rank = q * observed
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if n and cumulative + n >= rank:
+                lower = buckets[i - 1] if i else 0.0
+                upper = buckets[i] if i < len(buckets) else lower
+                result[q] = lower + (upper - lower) * (rank - cumulative) / n
+                break
+            cumulative += n
+    return result
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count', 'window', 'slice_seconds', '_slices', '_lock')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=300, slices=10):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.window = window
+        self.slice_seconds = window / slices
+        self._slices = deque()  # (slice start, bucket counts)
+        self._lock = threading.Lock()
+
+    def observe(self, value, now=None):
+        index = bisect_left(self.buckets, value)
+        now = time.monotonic() if now is None else now
+        start = now - now % self.slice_seconds
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+            if not self._slices or self._slices[-1][0] != start:
+                self._slices.append((start, [0] * len(self.counts)))
+                while self._slices[0][0] <= now - self.window - self.slice_seconds:
+                    self._slices.popleft()
+            self._slices[-1][1][index] += 1
+
+    def window_counts(self, now=None):
+        now = time.monotonic() if now is None else now
+        merged = [0] * len(self.counts)
+        with self._lock:
+            for start, counts in self._slices:
+                if start > now - self.window:
+                    for i, n in enumerate(counts):
+                        merged[i] += n
+        return merged
+
+    def percentiles(self, quantiles=QUANTILES, now=None):
+        """``{q: seconds}`` over the sliding window (``None`` when empty)."""
+        return interpolate(self.buckets, self.window_counts(now), quantiles)
+
+
+class MetricsRegistry:
+    def __init__(self, window=300, slices=10, buckets=DEFAULT_BUCKETS):
+        self.window = window
+        self.slices = slices
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def histogram(self, name, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(
+                    key, Histogram(self.buckets, self.window, self.slices))
+        return histogram
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, collect, help=None):
+        """Register ``collect() -> [(labels dict, value), ...]``, read at export time."""
+        self._gauges[name] = collect
+        if help:
+            HELP.setdefault(name, help)
+
+    def counter_value(self, name, **labels):
+        return self._counters.get(self._key(name, labels), 0)
+
+    def summaries(self, name):
+        """``[(labels, count, {q: seconds})]`` for every series of ``name``, busiest first."""
+        rows = []
+        for (series, labels), histogram in list(self._histograms.items()):
+            if series == name:
+                percentiles = histogram.percentiles()
+                rows.append((dict(labels), sum(histogram.window_counts()), percentiles))
+        return sorted(rows, key=lambda row: -row[1])
+
+    def combined(self, name):
+        """``(count, {q: seconds})`` over the window across every series of ``name``."""
+        counts = [0] * (len(self.buckets) + 1)
+        for (series, _), histogram in list(self._histograms.items()):
+            if series == name:
+                for i, n in enumerate(histogram.window_counts()):
+                    counts[i] += n
+        return sum(counts), interpolate(self.buckets, counts)
+
+    # ------------------------------------------------------------------
+    # Prometheus text exposition
+    # ------------------------------------------------------------------
+    def render_prometheus(self):
+        lines = []
+
+        def header(name, kind):
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+        histograms = sorted(self._histograms.items())
+        for name in sorted({name for (name, _), _ in histograms}):
+            header(name, 'histogram')
+            for (series, labels), histogram in histograms:
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float('inf'),), histogram.counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{fmt(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{fmt(labels)} {histogram.total}')
+                lines.append(f'{name}_count{fmt(labels)} {histogram.count}')
+            header(f'{name}_window', 'gauge')
+            for (series, labels), histogram in histograms:
+                if series != name:
+                    continue
+                for q, value in histogram.percentiles().items():
+                    if value is not None:
+                        lines.append(f'{name}_window{fmt(labels, [("quantile", str(q))])} {value}')
+
+        counters = sorted(self._counters.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            header(name, 'counter')
+            for (series, labels), value in counters:
+                if series == name:
+                    lines.append(f'{series}{fmt(labels)} {value}')
+
+        for name, collect in sorted(self._gauges.items()):
+            header(name, 'gauge')
+            for labels, value in collect():
+                lines.append(f'{name}{fmt(sorted(labels.items()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# ----------------------------------------------------------------------
+# Recording helpers (no-ops outside an app or with metrics disabled)
+# ----------------------------------------------------------------------
+def get_registry():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('metrics')
+
+
+def observe(name, seconds, **labels):
+    registry = get_registry()
+    if registry is not None:
+        registry.observe(name, seconds, **labels)
+
+
+def inc(name, amount=1, **labels):
+    registry = get_registry()
+    if registry is not None:
+        registry.inc(name, amount, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of the ``with`` block into histogram ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+# ----------------------------------------------------------------------
+# Flask wiring
+# ----------------------------------------------------------------------
+def _pool_gauges(app):
+    def collect():
+        from banking_app import db, dbpool
+        with app.app_context():
+            status = dbpool.pool_status(db.engine, app.config)
+        return [({'state': state}, status[state])
+                for state in ('size', 'checked_in', 'checked_out', 'overflow') if state in status]
+    return collect
+
+
+def init_app(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    registry = MetricsRegistry(app.config.get('METRICS_WINDOW_SECONDS', 300))
+    app.extensions['metrics'] = registry
+    registry.gauge('db_pool_connections', _pool_gauges(app), 'Connection pool occupancy.')
+
+    @app.before_request
+    def _start_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('_request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            registry.observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+            registry.inc('http_requests_total', endpoint=endpoint, method=request.method,
+                         status=str(response.status_code))
+        return response
+
+    def metrics_view():
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
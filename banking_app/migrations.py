@@ -0,0 +1,418 @@
+"""
+Versioned schema revisions.
+
+The schema is changed by ``flask db upgrade`` (``setup.py`` runs it too),
+never by application startup. Each applied revision leaves a row in
+``schema_revision``; booting a worker costs one ``SELECT max(version)`` to
+compare against ``HEAD`` instead of reflecting every table, and the readiness
+checker reports the database as unavailable while it is behind.
+
+Revisions are idempotent "ensure" steps: each creates the tables, columns or
+indexes it introduces only when they are missing. Databases built by the old
+``db.create_all()`` at startup, with any subset of later features, are
+brought to ``HEAD`` and stamped without redoing work. An empty database
+skips the chain: ``create_all`` and a stamp of every revision.
+
+Revisions never build DDL from the live models: each table is frozen below
+as the ``Table`` its revision created, and later columns and indexes are
+added by explicit SQL, so editing a model cannot change what an old
+revision does. Data revisions marked ``batched`` commit as they go (a
+rerun after a crash resumes where it stopped) and are stamped afterwards.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData,
+                        String, Table, Text, UniqueConstraint, func, insert, inspect, select, text)
+from sqlalchemy.exc import SQLAlchemyError
+
+from banking_app import activity, db, ledger
+from banking_app.money import convert_legacy_columns
+
+Revision = namedtuple('Revision', 'version description upgrade batched', defaults=(False,))
+
+REVISIONS = []
+
+# Arbitrary key for pg_advisory_lock, so concurrent deploys upgrade one at a time
+LOCK_KEY = 0x5EC0BA4C
+
+
+def revision(version, description, batched=False):
+    def register(upgrade):
+        assert not REVISIONS or version == REVISIONS[-1].version + 1, 'revisions must be consecutive'
+        REVISIONS.append(Revision(version, description, upgrade, batched))
+        return upgrade
+    return register
+
+
+# ----------------------------------------------------------------------
+# Frozen tables, as created by their revision (never edit one that has shipped)
+# ----------------------------------------------------------------------
+_schema = MetaData()
+
+# Revision 1: the pre-versioning schema (FLOAT money, no journal columns)
+_role_table = Table(
+    'user_role', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(50), unique=True, nullable=False),
+    Column('description', String(200)),
+)
+
+_user_table = Table(
+    'user', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('password_hash', String(200), nullable=False),
+    Column('first_name', String(50), nullable=False),
+    Column('last_name', String(50), nullable=False),
+    Column('phone', String(20)),
+    Column('created_at', DateTime),
+    Column('is_active', Boolean),
+    Column('role_id', Integer, ForeignKey('user_role.id'), nullable=False),
+)
+
+_account_table = Table(
+    'account', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('account_number', String(20), unique=True, nullable=False),
+    Column('account_type', String(20), nullable=False),
+    Column('balance', Float),
+    Column('created_at', DateTime),
+    Column('is_active', Boolean),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+)
+
+_transaction_table = Table(
+    'transaction', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('transaction_type', String(20), nullable=False),
+    Column('amount', Float, nullable=False),
+    Column('description', String(200)),
+    Column('created_at', DateTime),
+    Column('status', String(20)),
+    Column('from_account_id', Integer, ForeignKey('account.id')),
+    Column('to_account_id', Integer, ForeignKey('account.id')),
+)
+
+# Revision 4
+_recent_activity_table = Table(
+    'recent_activity', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('transaction_id', Integer, ForeignKey('transaction.id'), nullable=False),
+    Column('created_at', DateTime, nullable=False),
+    Index('ix_recent_activity_user_created', 'user_id', 'created_at', 'id'),
+)
+
+# Revision 5
+_journal_entry_table = Table(
+    'journal_entry', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('account_id', Integer, ForeignKey('account.id'), nullable=False),
+    Column('sequence', Integer, nullable=False),
+    Column('entry_type', String(10), nullable=False),
+    Column('amount_cents', BigInteger, nullable=False),
+    Column('transaction_id', Integer, ForeignKey('transaction.id')),
+    Column('created_at', DateTime, nullable=False),
+    UniqueConstraint('account_id', 'sequence', name='uq_journal_entry_account_sequence'),
+)
+
+_balance_snapshot_table = Table(
+    'balance_snapshot', _schema,
+    Column('account_id', Integer, ForeignKey('account.id'), primary_key=True),
+    Column('sequence', Integer, primary_key=True),
+    Column('balance_cents', BigInteger, nullable=False),
+    Column('created_at', DateTime, nullable=False),
+)
+
+# Revision 6
+_daily_usage_table = Table(
+    'daily_usage', _schema,
+    Column('account_id', Integer, ForeignKey('account.id'), primary_key=True),
+    Column('day', Date, primary_key=True),
+    Column('used_cents', BigInteger, nullable=False),
+)
+
+# Revision 7
+_number_sequence_table = Table(
+    'number_sequence', _schema,
+    Column('name', String(50), primary_key=True),
+    Column('next_value', BigInteger, nullable=False),
+)
+
+# Revision 8
+_system_stats_table = Table(
+    'system_stats', _schema,
+    Column('slot', Integer, primary_key=True, autoincrement=False),
+    Column('user_count', Integer, nullable=False),
+    Column('active_account_count', Integer, nullable=False),
+    Column('total_balance_cents', BigInteger, nullable=False),
+    Column('refreshed_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+# Revision 10
+_idempotency_key_table = Table(
+    'idempotency_key', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('key', String(64), nullable=False),
+    Column('endpoint', String(50), nullable=False),
+    Column('fingerprint', String(64), nullable=False),
+    Column('state', String(10), nullable=False),
+    Column('response', Text),
+    Column('created_at', DateTime, nullable=False),
+    Column('expires_at', DateTime, nullable=False),
+    UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    Index('ix_idempotency_key_expires', 'expires_at'),
+)
+
+# Revision 11
+_outbox_event_table = Table(
+    'outbox_event', _schema,
+    Column('id', Integer, primary_key=True),
+    Column('topic', String(50), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('state', String(10), nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('available_at', DateTime, nullable=False),
+    Column('claim_token', String(32)),
+    Column('lease_until', DateTime),
+    Column('last_error', Text),
+    Column('created_at', DateTime, nullable=False),
+    Column('processed_at', DateTime),
+    Index('ix_outbox_event_state_available', 'state', 'available_at'),
+    Index('ix_outbox_event_claim_token', 'claim_token'),
+)
+
+# Bookkeeping, created before the first revision runs
+_schema_revision_table = Table(
+    'schema_revision', _schema,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+# ----------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------
+def _create_tables(connection, *tables):
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+
+def _add_column(connection, table, column, ddl):
+    """``ALTER TABLE table ADD COLUMN column ddl`` unless it exists."""
+    if column in {c['name'] for c in inspect(connection).get_columns(table)}:
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    connection.execute(text(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(column)} {ddl}'))
+
+
+def _create_index(connection, table, name, *columns):
+    """``CREATE INDEX name ON table (columns)`` unless it exists."""
+    if name in {i['name'] for i in inspect(connection).get_indexes(table)}:
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    connection.execute(text(f'CREATE INDEX {quote(name)} ON {quote(table)} '
+                            f'({", ".join(quote(column) for column in columns)})'))
+
+
+# ----------------------------------------------------------------------
+# Revisions (append only; never edit one that has shipped)
+# ----------------------------------------------------------------------
+@revision(1, 'baseline tables')
+def _baseline(connection):
+    _create_tables(connection, _role_table, _user_table, _account_table, _transaction_table)
+
+
+@revision(2, 'integer cents money columns')
+def _money_cents(connection):
+    convert_legacy_columns(connection)
+
+
+@revision(3, 'account version and journal sequence')
+def _account_version(connection):
+    _add_column(connection, 'account', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column(connection, 'account', 'last_sequence', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@revision(4, 'recent activity feed')
+def _recent_activity(connection):
+    _create_tables(connection, _recent_activity_table)
+
+
+@revision(5, 'journal and balance snapshots')
+def _journal(connection):
+    _create_tables(connection, _journal_entry_table, _balance_snapshot_table)
+
+
+@revision(6, 'transaction limits and daily usage')
+def _limits(connection):
+    _add_column(connection, 'account', 'single_limit_cents', 'BIGINT')
+    _add_column(connection, 'account', 'daily_limit_cents', 'BIGINT')
+    _create_tables(connection, _daily_usage_table)
+
+
+@revision(7, 'account number sequence')
+def _number_sequence(connection):
+    _create_tables(connection, _number_sequence_table)
+
+
+@revision(8, 'materialized system statistics')
+def _system_stats(connection):
+    _create_tables(connection, _system_stats_table)
+
+
+@revision(9, 'history, export and admin list indexes')
+def _indexes(connection):
+    for name, *columns in (('ix_transaction_from_account_created', 'from_account_id', 'created_at', 'id'),
+                           ('ix_transaction_to_account_created', 'to_account_id', 'created_at', 'id'),
+                           ('ix_transaction_created', 'created_at', 'id'),
+                           ('ix_transaction_type_created', 'transaction_type', 'created_at', 'id'),
+                           ('ix_transaction_status_created', 'status', 'created_at', 'id')):
+        _create_index(connection, 'transaction', name, *columns)
+    _create_index(connection, 'recent_activity', 'ix_recent_activity_user_created', 'user_id', 'created_at', 'id')
+
+
+@revision(10, 'idempotency keys')
+def _idempotency_keys(connection):
+    _create_tables(connection, _idempotency_key_table)
+
+
+@revision(11, 'transactional outbox')
+def _outbox(connection):
+    _create_tables(connection, _outbox_event_table)
+
+
+@revision(12, 'journal opening balances', batched=True)
+def _opening_balances(connection):
+    ledger.journal_openings(connection, commit=connection.commit)
+
+
+@revision(13, 'recent activity backfill', batched=True)
+def _activity_backfill(connection):
+    activity.rebuild_incomplete(connection, commit=connection.commit)
+
+
+HEAD = REVISIONS[-1].version
+
+
+# ----------------------------------------------------------------------
+# Status and upgrade
+# ----------------------------------------------------------------------
+class SchemaState(namedtuple('SchemaState', 'current head')):
+    @property
+    def is_current(self):
+        return self.current is not None and self.current >= self.head
+
+
+def current_revision(connection):
+    """Latest applied revision, or ``None`` for an unversioned database."""
+    try:
+        with connection.begin():
+            return connection.execute(select(func.max(_schema_revision_table.c.version))).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def status():
+    with db.engine.connect() as connection:
+        return SchemaState(current_revision(connection), HEAD)
+
+
+def _stamp(connection, revisions):
+    now = datetime.utcnow()
+    connection.execute(insert(_schema_revision_table), [
+        {'version': r.version, 'description': r.description, 'applied_at': now} for r in revisions
+    ])
+
+
+def upgrade(target=None, echo=None):
+    """
+    Apply every revision after the current one, up to ``target`` (default
+    ``HEAD``), each in its own transaction (batched revisions in several,
+    then their stamp). Returns the revisions applied.
+    """
+    target = HEAD if target is None else target
+    echo = echo or (lambda message: None)
+    applied = []
+    with db.engine.connect() as connection:
+        postgres = connection.dialect.name == 'postgresql'
+        if postgres:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': LOCK_KEY})
+            connection.commit()
+        try:
+            current = current_revision(connection)
+            if current is None:
+                with connection.begin():
+                    existing = set(inspect(connection).get_table_names())
+                    _create_tables(connection, _schema_revision_table)
+                    if not existing & set(db.metadata.tables):
+                        # Empty database: build head directly instead of replaying the chain
+                        db.metadata.create_all(connection)
+                        pending = [r for r in REVISIONS if r.version <= target]
+                        _stamp(connection, pending)
+                        echo(f'Created schema at revision {pending[-1].version}')
+                        return pending
+                current = 0
+            for rev in REVISIONS:
+                if current < rev.version <= target:
+                    if rev.batched:
+                        rev.upgrade(connection)
+                        connection.commit()
+                        with connection.begin():
+                            _stamp(connection, [rev])
+                    else:
+                        with connection.begin():
+                            rev.upgrade(connection)
+                            _stamp(connection, [rev])
+                    echo(f'Applied revision {rev.version}: {rev.description}')
+                    applied.append(rev)
+        finally:
+            if postgres:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': LOCK_KEY})
+                connection.commit()
+    return applied
+
+
+def history():
+    """Applied revisions as ``(version, description, applied_at)``, oldest first."""
+    with db.engine.connect() as connection:
+        if current_revision(connection) is None:
+            return []
+        return connection.execute(
+            select(_schema_revision_table.c.version, _schema_revision_table.c.description,
+                   _schema_revision_table.c.applied_at)
+            .order_by(_schema_revision_table.c.version)).all()
+
+
+# ----------------------------------------------------------------------
+# Boot and readiness checks
+# ----------------------------------------------------------------------
+def check_migrations():
+    """Readiness check: fails while the database is behind ``HEAD``."""
+    from banking_app.probes import ProbeFailed
+    state = status()
+    if not state.is_current:
+        raise ProbeFailed(f'schema at revision {state.current or "none"}, expected {state.head}')
+    return f'revision {state.current}'
+
+
+def init_app(app):
+    app.extensions['readiness'].register('migrations', check_migrations)
+    if not app.config.get('SCHEMA_REVISION_CHECK', True):
+        return
+    # One single-row query per process start; the schema is never reflected here
+    with app.app_context():
+        try:
+            state = status()
+        except SQLAlchemyError as e:
+            app.logger.warning('Schema revision check skipped: %s', e)
+            return
+    if not state.is_current:
+        app.logger.warning('Database schema is at revision %s, this code expects %s; run "flask db upgrade"',
+                           state.current or 'none', state.head)
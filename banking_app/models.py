@@ -1,9 +1,8 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from banking_app import db
-import random
-import string
+from banking_app import account_numbers, passwords
+from banking_app.money import MoneyType
 
 
 # ----------------------------------------------------------------------
@@ -43,12 +42,12 @@ class User(UserMixin, db.Model):
     role = db.relationship('Role', backref='users')
     accounts = db.relationship('Account', backref='owner', lazy='dynamic')
 
-    # ✅ Explicitly use pbkdf2 for compatibility with your admin password
+    # Hashing policy (algorithm, cost, salt length) comes from Config; see passwords.py
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
 
     def is_admin(self):
         return self.role.name == 'admin'
@@ -69,10 +68,19 @@ class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     account_number = db.Column(db.String(20), unique=True, nullable=False)
     account_type = db.Column(db.String(20), nullable=False)  # checking, savings
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column('balance_cents', MoneyType, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Bumped on every balance change (see postings.py); ORM writes are version-checked
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Sequence number of the latest journal entry for this account (see ledger.py)
+    last_sequence = db.Column(db.Integer, nullable=False, default=0)
+    # Per-account overrides of TRANSACTION_LIMIT_SINGLE / _DAILY (see limits.py)
+    single_limit = db.Column('single_limit_cents', MoneyType)
+    daily_limit = db.Column('daily_limit_cents', MoneyType)
+
+    __mapper_args__ = {'version_id_col': version}
 
     # Relationships
     transactions_sent = db.relationship(
@@ -89,7 +97,7 @@ class Account(db.Model):
     )
 
     def generate_account_number(self):
-        return ''.join(random.choices(string.digits, k=10))
+        return account_numbers.allocate()
 
     def __init__(self, **kwargs):
         super(Account, self).__init__(**kwargs)
@@ -111,10 +119,20 @@ class Account(db.Model):
 # ----------------------------------------------------------------------
 class Transaction(db.Model):
     __tablename__ = 'transaction'
+    __table_args__ = (
+        # Back the per-account, newest-first history scans (see history.py)
+        db.Index('ix_transaction_from_account_created', 'from_account_id', 'created_at', 'id'),
+        db.Index('ix_transaction_to_account_created', 'to_account_id', 'created_at', 'id'),
+        # Date-ranged scans across all accounts (statement exports, admin lists)
+        db.Index('ix_transaction_created', 'created_at', 'id'),
+        # Filtered admin lists, newest first (see listings.py)
+        db.Index('ix_transaction_type_created', 'transaction_type', 'created_at', 'id'),
+        db.Index('ix_transaction_status_created', 'status', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     transaction_type = db.Column(db.String(20), nullable=False)  # transfer, deposit, withdrawal
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column('amount_cents', MoneyType, nullable=False)
     description = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='completed')  # completed, pending, failed
@@ -125,3 +143,167 @@ class Transaction(db.Model):
 
     def __repr__(self):
         return f'<Transaction {self.transaction_type}: ${self.amount}>'
+
+
+# ----------------------------------------------------------------------
+# Recent activity read model (bounded per-user feed, see activity.py)
+# ----------------------------------------------------------------------
+class RecentActivity(db.Model):
+    __tablename__ = 'recent_activity'
+    __table_args__ = (
+        db.Index('ix_recent_activity_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    transaction = db.relationship('Transaction')
+
+    def __repr__(self):
+        return f'<RecentActivity user={self.user_id} txn={self.transaction_id}>'
+
+
+# ----------------------------------------------------------------------
+# Append-only journal (one row per account leg of a posting, see ledger.py)
+# ----------------------------------------------------------------------
+class JournalEntry(db.Model):
+    __tablename__ = 'journal_entry'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'sequence', name='uq_journal_entry_account_sequence'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    entry_type = db.Column(db.String(10), nullable=False)  # debit, credit, opening
+    amount = db.Column('amount_cents', MoneyType, nullable=False)  # signed: credits > 0
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<JournalEntry {self.account_id}#{self.sequence} {self.entry_type} {self.amount}>'
+
+
+# ----------------------------------------------------------------------
+# Balance checkpoints taken every LEDGER_SNAPSHOT_INTERVAL journal entries
+# ----------------------------------------------------------------------
+class BalanceSnapshot(db.Model):
+    __tablename__ = 'balance_snapshot'
+
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    sequence = db.Column(db.Integer, primary_key=True)
+    balance = db.Column('balance_cents', MoneyType, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<BalanceSnapshot {self.account_id}#{self.sequence} {self.balance}>'
+
+
+# ----------------------------------------------------------------------
+# Per-account, per-day outgoing usage counter (see limits.py)
+# ----------------------------------------------------------------------
+class DailyUsage(db.Model):
+    __tablename__ = 'daily_usage'
+
+    account_id = db.Column(db.Integer, db.ForeignKey('account.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    used = db.Column('used_cents', MoneyType, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyUsage {self.account_id} {self.day}: {self.used}>'
+
+
+# ----------------------------------------------------------------------
+# Named counters handed out in blocks (see account_numbers.py)
+# ----------------------------------------------------------------------
+class NumberSequence(db.Model):
+    __tablename__ = 'number_sequence'
+
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<NumberSequence {self.name}: {self.next_value}>'
+
+
+# ----------------------------------------------------------------------
+# Materialized system statistics, striped over slots (see stats.py)
+# ----------------------------------------------------------------------
+class SystemStats(db.Model):
+    __tablename__ = 'system_stats'
+
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    active_account_count = db.Column(db.Integer, nullable=False, default=0)
+    total_balance = db.Column('total_balance_cents', MoneyType, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<SystemStats slot={self.slot}>'
+
+
+# ----------------------------------------------------------------------
+# Applied schema revisions, one row each (see migrations.py)
+# ----------------------------------------------------------------------
+class SchemaRevision(db.Model):
+    __tablename__ = 'schema_revision'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<SchemaRevision {self.version}>'
+
+
+# ----------------------------------------------------------------------
+# Idempotency keys for money-moving POSTs (see idempotency.py)
+# ----------------------------------------------------------------------
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_key'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+        db.Index('ix_idempotency_key_expires', 'expires_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    endpoint = db.Column(db.String(50), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # hash of the submitted form
+    state = db.Column(db.String(10), nullable=False, default='pending')  # pending, done
+    response = db.Column(db.Text)  # JSON: status, location, flashes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.state}>'
+
+
+# ----------------------------------------------------------------------
+# Transactional outbox drained by worker.py (see outbox.py)
+# ----------------------------------------------------------------------
+class OutboxEvent(db.Model):
+    __tablename__ = 'outbox_event'
+    __table_args__ = (
+        db.Index('ix_outbox_event_state_available', 'state', 'available_at'),
+        db.Index('ix_outbox_event_claim_token', 'claim_token'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    state = db.Column(db.String(10), nullable=False, default='pending')  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # next attempt not before
+    claim_token = db.Column(db.String(32))  # batch that holds the lease
+    lease_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.topic} {self.state}>'
@@ -0,0 +1,174 @@
+"""
+Money as integer minor units (cents).
+
+Balances and amounts are stored in BIGINT ``*_cents`` columns via
+``MoneyType`` and surface in Python as ``Money`` values, so sums and postings
+are exact integer arithmetic instead of binary floating point.
+
+``Money(n)`` takes integer cents. Plain numbers only become money through
+``Money.coerce``, which reads them as major units (dollars), rounds half-up
+to the cent and raises ``TypeError`` for anything that is not a finite
+amount (``NaN``, ``Infinity``, exponents past the decimal context).
+Arithmetic and comparisons take ``Money`` (or zero, which is the same in
+every unit), never other plain numbers, so a unit cannot be mixed up
+silently.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from banking_app import db
+
+CENT = Decimal('0.01')
+
+
+class Money:
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int) or isinstance(cents, bool):
+            raise TypeError(f'Money() takes integer cents, got {type(cents).__name__}')
+        self.cents = cents
+
+    @classmethod
+    def coerce(cls, value):
+        """Convert a major-unit number (or Money) to ``Money``."""
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, float):
+            value = repr(value)  # shortest round-trip repr, so 0.1 -> '0.1'
+        try:
+            amount = Decimal(value)
+            if not amount.is_finite():
+                raise ValueError(value)
+            return cls(int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+        except (ArithmeticError, TypeError, ValueError):
+            raise TypeError(f'Cannot convert {value!r} to Money') from None
+
+    def to_decimal(self):
+        return (Decimal(self.cents) / 100).quantize(CENT)
+
+    @staticmethod
+    def _cents_of(other):
+        """Cents of a ``Money`` operand, 0 for a plain zero, else ``None``."""
+        if isinstance(other, Money):
+            return other.cents
+        if isinstance(other, (int, float, Decimal)) and not isinstance(other, bool) and other == 0:
+            return 0
+        return None
+
+    # Arithmetic -------------------------------------------------------
+    def __add__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else Money(self.cents + other)
+
+    __radd__ = __add__  # sum() starts from 0
+
+    def __sub__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else Money(self.cents - other)
+
+    def __rsub__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else Money(other - self.cents)
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    # Comparisons ------------------------------------------------------
+    def __eq__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else self.cents == other
+
+    def __lt__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else self.cents < other
+
+    def __le__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else self.cents <= other
+
+    def __gt__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else self.cents > other
+
+    def __ge__(self, other):
+        other = self._cents_of(other)
+        return NotImplemented if other is None else self.cents >= other
+
+    def __hash__(self):
+        # Equal only to Money with the same cents, or to 0 when zero (hash 0)
+        return hash(self.cents)
+
+    # Conversions ------------------------------------------------------
+    def __float__(self):
+        return self.cents / 100
+
+    def __str__(self):
+        return str(self.to_decimal())
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+class MoneyType(db.TypeDecorator):
+    """BIGINT column holding cents, exposed as ``Money``."""
+
+    impl = db.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else Money.coerce(value).cents
+
+    def process_result_value(self, value, dialect):
+        # Some drivers return aggregates over BIGINT as Decimal/float
+        return None if value is None else Money(int(round(value)))
+
+
+def format_money(value, places=2):
+    """Jinja filter: ``{{ account.balance|money }}`` -> ``1234.50``."""
+    if value is None:
+        value = Money()
+    return f'{Money.coerce(value).to_decimal():.{places}f}'
+
+
+# ----------------------------------------------------------------------
+# Migration from the legacy FLOAT columns
+# ----------------------------------------------------------------------
+LEGACY_COLUMNS = (
+    ('account', 'balance', 'balance_cents', '0'),
+    ('transaction', 'amount', 'amount_cents', None),
+)
+
+
+def convert_legacy_columns(connection):
+    """
+    Convert FLOAT ``account.balance`` / ``transaction.amount`` to BIGINT cents.
+
+    Adds the ``*_cents`` column, fills it with ``ROUND(old * 100)`` and drops
+    the old column. Tables that already have the cents column are skipped, so
+    this is safe to re-run. Returns the names of the converted tables.
+    """
+    inspector = db.inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    converted = []
+    for table, old, new, default in LEGACY_COLUMNS:
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        if new in columns or old not in columns:
+            continue
+        t, o, n = quote(table), quote(old), quote(new)
+        connection.execute(db.text(f'ALTER TABLE {t} ADD COLUMN {n} BIGINT NOT NULL DEFAULT 0'))
+        connection.execute(db.text(f'UPDATE {t} SET {n} = CAST(ROUND(COALESCE({o}, 0) * 100) AS BIGINT)'))
+        connection.execute(db.text(f'ALTER TABLE {t} DROP COLUMN {o}'))
+        if default is None and connection.dialect.name == 'postgresql':
+            connection.execute(db.text(f'ALTER TABLE {t} ALTER COLUMN {n} DROP DEFAULT'))
+        converted.append(table)
+    return converted
@@ -0,0 +1,264 @@
+"""
+Transactional outbox.
+
+Work that follows a posting (notifications, statistics, fraud checks) does
+not run on the request thread. The posting service writes an event row into
+``outbox_event`` in the same DB transaction as the balance change, so an
+event exists exactly when its posting committed, and the request pays one
+INSERT however many consumers there are.
+
+``worker.py`` drains the table from a pool of processes, no broker needed:
+
+* A batch is claimed with one UPDATE that stamps a fresh ``claim_token`` and
+  a lease on up to ``OUTBOX_BATCH_SIZE`` due rows. On PostgreSQL the rows are
+  picked ``FOR UPDATE SKIP LOCKED``, so workers never queue behind each
+  other; SQLite runs one writer at a time, which serializes claims anyway.
+* Each event runs its topic's handlers and is marked ``done`` in one commit,
+  guarded by its claim token: database effects of a handler happen once.
+  Effects outside the database are at-least-once, so handlers get the event
+  id to deduplicate on.
+* A failing event goes back to ``pending`` with exponential backoff; after
+  ``OUTBOX_MAX_ATTEMPTS`` it is dead-lettered (``state = 'dead'``) and left
+  for ``flask outbox requeue``. A worker that dies mid-batch loses its lease
+  after ``OUTBOX_LEASE_SECONDS`` and the events are claimed again.
+
+Handlers register with ``@handler(topic)``, receive an ``Event`` and must
+not commit.
+"""
+
+import json
+import logging
+import random
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from banking_app import db
+from banking_app.models import Account, OutboxEvent
+from banking_app.money import Money
+
+logger = logging.getLogger('banking_app.outbox')
+
+Event = namedtuple('Event', 'id topic payload attempts')
+Status = namedtuple('Status', 'counts oldest_pending')
+
+MAX_ERROR_LENGTH = 2000
+
+_handlers = defaultdict(list)
+
+
+def handler(topic):
+    """Register ``fn(event)`` as a consumer of ``topic``."""
+    def register(fn):
+        _handlers[topic].append(fn)
+        return fn
+    return register
+
+
+def emit(topic, *payloads):
+    """
+    Queue one event per payload dict. Runs inside the caller's transaction;
+    the events become visible to workers when it commits.
+    """
+    if payloads:
+        now = datetime.utcnow()
+        db.session.execute(insert(OutboxEvent), [
+            {'topic': topic, 'payload': json.dumps(payload), 'state': 'pending', 'attempts': 0,
+             'available_at': now, 'created_at': now}
+            for payload in payloads
+        ])
+
+
+# ----------------------------------------------------------------------
+# Claiming and processing
+# ----------------------------------------------------------------------
+def _claimable(now):
+    return or_(and_(OutboxEvent.state == 'pending', OutboxEvent.available_at <= now),
+               and_(OutboxEvent.state == 'processing', OutboxEvent.lease_until < now))
+
+
+def claim(batch_size, lease_seconds):
+    """Lease up to ``batch_size`` due events and commit; returns them as ``Event``s, oldest first."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    candidates = (select(OutboxEvent.id).where(_claimable(now))
+                  .order_by(OutboxEvent.id).limit(batch_size))
+    if db.session.get_bind().dialect.name == 'postgresql':
+        candidates = candidates.with_for_update(skip_locked=True)
+    claimed = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(state='processing', claim_token=token, attempts=OutboxEvent.attempts + 1,
+                lease_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    if not claimed:
+        return token, []
+    rows = db.session.execute(
+        select(OutboxEvent.id, OutboxEvent.topic, OutboxEvent.payload, OutboxEvent.attempts)
+        .where(OutboxEvent.claim_token == token).order_by(OutboxEvent.id)).all()
+    db.session.rollback()
+    return token, [Event(row.id, row.topic, json.loads(row.payload), row.attempts) for row in rows]
+
+
+def _finish(event, token, **values):
+    """Update ``event`` only if ``token`` still holds its lease; True if it did."""
+    return db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event.id, OutboxEvent.claim_token == token)
+        .values(claim_token=None, lease_until=None, **values)
+        .execution_options(synchronize_session=False)).rowcount == 1
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``: doubling from ``OUTBOX_RETRY_BACKOFF``, capped and jittered."""
+    config = current_app.config
+    delay = min(config.get('OUTBOX_RETRY_BACKOFF', 2.0) * 2 ** (attempts - 1),
+                config.get('OUTBOX_RETRY_MAX_DELAY', 600.0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _fail(event, token, error, retryable=True):
+    db.session.rollback()
+    now = datetime.utcnow()
+    message = f'{type(error).__name__}: {error}'[:MAX_ERROR_LENGTH]
+    if not retryable or event.attempts >= current_app.config.get('OUTBOX_MAX_ATTEMPTS', 8):
+        logger.error('Outbox event %s (%s) dead-lettered after %d attempt(s): %s',
+                     event.id, event.topic, event.attempts, message)
+        outcome = 'dead'
+        values = {'state': 'dead', 'last_error': message, 'processed_at': now}
+    else:
+        outcome = 'retry'
+        values = {'state': 'pending', 'last_error': message,
+                  'available_at': now + timedelta(seconds=retry_delay(event.attempts))}
+    if not _finish(event, token, **values):
+        outcome = 'lost'
+    db.session.commit()
+    return outcome
+
+
+def process(event, token):
+    """Run the handlers of one claimed event; returns the outcome (done, retry, dead or lost)."""
+    handlers = _handlers.get(event.topic)
+    if not handlers:
+        return _fail(event, token, LookupError(f'no handler for {event.topic!r}'), retryable=False)
+    try:
+        for fn in handlers:
+            fn(event)
+        if not _finish(event, token, state='done', last_error=None, processed_at=datetime.utcnow()):
+            # The lease expired and another worker owns the event now
+            db.session.rollback()
+            return 'lost'
+        db.session.commit()
+        return 'done'
+    except Exception as e:
+        logger.warning('Outbox event %s (%s) attempt %d failed', event.id, event.topic, event.attempts,
+                       exc_info=True)
+        return _fail(event, token, e)
+
+
+def process_batch(batch_size=None):
+    """Claim and process one batch; returns a ``Counter`` of outcomes (empty when nothing was due)."""
+    config = current_app.config
+    try:
+        token, events = claim(batch_size or config.get('OUTBOX_BATCH_SIZE', 100),
+                              config.get('OUTBOX_LEASE_SECONDS', 60))
+    except OperationalError:
+        # Busy database (SQLite lock): try again next poll
+        db.session.rollback()
+        logger.warning('Outbox claim failed', exc_info=True)
+        return Counter()
+    return Counter(process(event, token) for event in events)
+
+
+def drain(batch_size=None):
+    """Process batches until nothing is due; returns the summed outcomes."""
+    batch_size = batch_size or current_app.config.get('OUTBOX_BATCH_SIZE', 100)
+    total = Counter()
+    while True:
+        outcomes = process_batch(batch_size)
+        total.update(outcomes)
+        if sum(outcomes.values()) < batch_size:
+            return total
+
+
+def run(stop, batch_size=None, poll_interval=None):
+    """
+    Worker loop: process batches until ``stop`` (a ``threading`` or
+    ``multiprocessing`` Event) is set, sleeping ``OUTBOX_POLL_INTERVAL``
+    whenever a batch comes back short.
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('OUTBOX_BATCH_SIZE', 100)
+    poll_interval = poll_interval or config.get('OUTBOX_POLL_INTERVAL', 1.0)
+    logger.info('Outbox worker started (batch %d, poll %.1fs)', batch_size, poll_interval)
+    while not stop.is_set():
+        outcomes = process_batch(batch_size)
+        if outcomes:
+            logger.info('Outbox batch: %s', ', '.join(f'{n} {outcome}' for outcome, n in sorted(outcomes.items())))
+        if sum(outcomes.values()) < batch_size:
+            stop.wait(poll_interval)
+    db.session.remove()
+    logger.info('Outbox worker stopped')
+
+
+# ----------------------------------------------------------------------
+# Maintenance
+# ----------------------------------------------------------------------
+def status():
+    """Event counts by state and the creation time of the oldest pending event."""
+    counts = dict(db.session.query(OutboxEvent.state, func.count(OutboxEvent.id)).group_by(OutboxEvent.state))
+    oldest = (db.session.query(func.min(OutboxEvent.created_at))
+              .filter(OutboxEvent.state.in_(('pending', 'processing'))).scalar())
+    return Status(counts, oldest)
+
+
+def requeue(event_ids=None):
+    """Move dead-lettered events (all, or ``event_ids``) back to pending and commit. Returns the count."""
+    stmt = update(OutboxEvent).where(OutboxEvent.state == 'dead')
+    if event_ids:
+        stmt = stmt.where(OutboxEvent.id.in_(event_ids))
+    count = db.session.execute(
+        stmt.values(state='pending', attempts=0, available_at=datetime.utcnow(), processed_at=None)
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return count
+
+
+def purge(older_than, batch_size=1000):
+    """Delete ``done`` events processed before ``older_than``, committing per batch. Returns the count."""
+    deleted = 0
+    while True:
+        batch = (select(OutboxEvent.id)
+                 .where(OutboxEvent.state == 'done', OutboxEvent.processed_at < older_than)
+                 .limit(batch_size))
+        count = db.session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(batch))).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+# ----------------------------------------------------------------------
+# Built-in consumers
+# ----------------------------------------------------------------------
+notifications = logging.getLogger('banking_app.notifications')
+
+
+@handler('transaction.posted')
+def notify_account_holders(event):
+    """Tell the owners of the accounts a posting touched (logged until a delivery channel exists)."""
+    payload = event.payload
+    account_ids = [payload[key] for key in ('from_account_id', 'to_account_id') if payload.get(key)]
+    owners = dict(db.session.query(Account.id, Account.user_id).filter(Account.id.in_(account_ids)))
+    amount = Money(payload['amount_cents'])
+    for key, direction in (('from_account_id', 'debited'), ('to_account_id', 'credited')):
+        account_id = payload.get(key)
+        if account_id in owners:
+            notifications.info('user %s: account %s %s $%s (%s, transaction %s, event %s)',
+                               owners[account_id], account_id, direction, amount,
+                               payload['type'], payload['transaction_id'], event.id)
@@ -0,0 +1,178 @@
+"""
+Password hashing policy.
+
+The KDF (pbkdf2 or scrypt), its cost parameters and the salt length come from
+``Config``. Hashes written under an older policy keep verifying and are
+upgraded in the background the next time their owner logs in.
+
+When ``PASSWORD_VERIFY_WORKERS`` is set, KDF work runs on a bounded worker
+pool: at most that many hashes are computed at once, and a login that cannot
+get a slot within ``PASSWORD_VERIFY_TIMEOUT`` seconds fails fast with
+``PasswordVerifierBusy`` instead of tying up the request thread. Transfer
+traffic therefore keeps its share of CPU during a login burst. Background
+rehashes take a slot too (or are skipped until the next login when none is
+free), so a verification never queues behind them.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from banking_app import metrics, ratelimit
+
+logger = logging.getLogger('banking_app.passwords')
+
+
+class PasswordVerifierBusy(Exception):
+    """All KDF worker slots stayed busy for longer than the configured timeout."""
+
+
+# ----------------------------------------------------------------------
+# Policy
+# ----------------------------------------------------------------------
+def hash_method(config=None):
+    """Werkzeug method string for the configured policy, e.g. ``pbkdf2:sha256:600000``."""
+    config = config if config is not None else current_app.config
+    algorithm = config.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2:sha256')
+    if algorithm == 'scrypt':
+        return f"scrypt:{config.get('PASSWORD_SCRYPT_PARAMS', '32768:8:1')}"
+    return f"{algorithm}:{config.get('PASSWORD_HASH_ITERATIONS', 600000)}"
+
+
+def hash_password(password, config=None):
+    config = config if config is not None else current_app.config
+    with metrics.timed('password_kdf_seconds', op='hash'):
+        return generate_password_hash(password, method=hash_method(config),
+                                      salt_length=config.get('PASSWORD_SALT_LENGTH', 16))
+
+
+def needs_rehash(password_hash, config=None):
+    """True if ``password_hash`` was produced under a different policy."""
+    config = config if config is not None else current_app.config
+    try:
+        method, salt, _ = password_hash.split('$', 2)
+    except ValueError:
+        return True
+    return method != hash_method(config) or len(salt) < config.get('PASSWORD_SALT_LENGTH', 16)
+
+
+# ----------------------------------------------------------------------
+# Worker pool
+# ----------------------------------------------------------------------
+class KdfPool:
+    """Bounded pool for KDF work; ``workers=0`` verifies inline on the request thread."""
+
+    def __init__(self, workers, timeout):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers) if workers else None
+        self._executor = ThreadPoolExecutor(max_workers=workers or 1, thread_name_prefix='kdf')
+
+    def _submit(self, fn, *args):
+        # Called holding a slot; the slot is freed when the work finishes,
+        # not when a caller stops waiting for it
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """
+        Run ``fn`` on the pool and wait for it; raises ``PasswordVerifierBusy``
+        when no slot frees up, or the work does not finish, within ``timeout``.
+        """
+        if self._slots is None:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordVerifierBusy()
+        try:
+            return self._submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise PasswordVerifierBusy() from None
+
+    def submit(self, fn, *args):
+        """Fire-and-forget background work (used for rehashing); ``None`` if every slot is busy."""
+        if self._slots is None:
+            return self._executor.submit(fn, *args)
+        if not self._slots.acquire(blocking=False):
+            return None
+        return self._submit(fn, *args)
+
+
+def get_pool():
+    return current_app.extensions['kdf_pool']
+
+
+def verify_password(password_hash, password):
+    """Check ``password`` against ``password_hash`` on the KDF pool."""
+    with metrics.timed('password_kdf_seconds', op='verify'):
+        return get_pool().run(check_password_hash, password_hash, password)
+
+
+# ----------------------------------------------------------------------
+# Rehash on login
+# ----------------------------------------------------------------------
+def _rehash(app, user_id, old_hash, password):
+    from banking_app import db
+    from banking_app.models import User
+    with app.app_context():
+        try:
+            new_hash = hash_password(password, app.config)
+            # Conditional so a password change made meanwhile is never overwritten
+            User.query.filter_by(id=user_id, password_hash=old_hash).update(
+                {'password_hash': new_hash}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Password rehash failed for user %s', user_id)
+
+
+def schedule_rehash(user, password):
+    """Upgrade ``user``'s hash to the current policy in the background, if needed."""
+    app = current_app._get_current_object()
+    if not app.config.get('PASSWORD_REHASH_ON_LOGIN', True):
+        return False
+    if not needs_rehash(user.password_hash, app.config):
+        return False
+    # Skipped when the pool is saturated; the next login tries again
+    return get_pool().submit(_rehash, app, user.id, user.password_hash, password) is not None
+
+
+# ----------------------------------------------------------------------
+# Login
+# ----------------------------------------------------------------------
+def authenticate(username, password):
+    """
+    Check a login attempt for the login form and ``POST /api/v1/session``,
+    throttled before the user lookup and the KDF (see ratelimit.py).
+
+    Returns ``(user, decision)``; ``user`` is ``None`` when the credentials
+    are wrong or ``decision`` refused the attempt. Raises
+    ``PasswordVerifierBusy`` when no KDF slot frees up in time.
+    """
+    from banking_app.models import User
+    limiter = ratelimit.get_limiter()
+    key = ratelimit.username_key(username)
+    decision = limiter.hit('login_ip', ratelimit.client_ip())
+    if decision.allowed:
+        decision = limiter.check('login_username', key)
+    if not decision.allowed:
+        return None, decision
+
+    user = User.query.filter_by(username=username).first()
+    if user is not None and user.check_password(password):
+        # Upgrade hashes from an older policy off the request thread
+        schedule_rehash(user, password)
+        return user, decision
+    limiter.count('login_username', key)
+    return None, decision
+
+
+def init_app(app):
+    app.extensions['kdf_pool'] = KdfPool(app.config.get('PASSWORD_VERIFY_WORKERS', 0),
+                                         app.config.get('PASSWORD_VERIFY_TIMEOUT', 5))
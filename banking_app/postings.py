@@ -0,0 +1,287 @@
+"""
+Ledger-posting service.
+
+Every balance change is a single conditional UPDATE executed by the database
+(``balance = balance - :amt WHERE id = :id AND balance >= :amt``), so two
+concurrent requests on the same account can never both pass the funds check
+or lose each other's update. Multi-account postings touch rows in ascending
+id order, which keeps row-lock acquisition deterministic and deadlock-free.
+
+Each update also bumps ``Account.version``. ORM writes to an account are
+version-checked too, and the whole posting is retried with jittered
+exponential backoff when the database reports a transient conflict
+(deadlock, serialization failure, SQLite "database is locked").
+
+Each leg is also appended to the journal (see ledger.py) in the same commit,
+outgoing postings are charged against the account's transaction limits
+(see limits.py) before any balance moves, and the dashboard counters (see
+stats.py) move with them. Everything else that reacts to a posting runs
+later, off the request thread: each posting queues a ``transaction.posted``
+event in the same commit (see outbox.py). The request's idempotency key, if
+any, is marked done in that commit as well (see idempotency.py).
+"""
+
+import random
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from banking_app import db
+from banking_app import activity, idempotency, ledger, limits, metrics, outbox, stats
+from banking_app.models import Account, Transaction
+from banking_app.money import Money
+
+
+class PostingError(Exception):
+    """A posting was rejected; nothing was written."""
+
+
+class InsufficientFunds(PostingError):
+    pass
+
+
+class AccountUnavailable(PostingError):
+    pass
+
+
+class LimitExceeded(PostingError):
+    pass
+
+
+RETRYABLE_ERRORS = (OperationalError, StaleDataError)
+
+
+# ----------------------------------------------------------------------
+# Low-level balance updates
+# ----------------------------------------------------------------------
+def _apply(account_id, delta, entries=1):
+    """
+    Move ``delta`` on one account, reserving ``entries`` journal sequence
+    numbers; returns ``(last reserved sequence, new balance)``.
+    """
+    stmt = update(Account).where(Account.id == account_id, Account.is_active.is_(True))
+    if delta < 0:
+        stmt = stmt.where(Account.balance >= -delta)
+    stmt = (stmt
+            .values(balance=Account.balance + delta,
+                    version=Account.version + 1,
+                    last_sequence=Account.last_sequence + entries)
+            .execution_options(synchronize_session=False))
+
+    if db.session.get_bind().dialect.update_returning:
+        row = db.session.execute(stmt.returning(Account.last_sequence, Account.balance)).first()
+    elif db.session.execute(stmt).rowcount == 1:
+        # The UPDATE holds the row lock, so this read sees our own write
+        row = db.session.query(Account.last_sequence, Account.balance).filter_by(id=account_id).first()
+    else:
+        row = None
+
+    if row is None:
+        is_active = db.session.query(Account.is_active).filter_by(id=account_id).scalar()
+        if is_active is None:
+            raise AccountUnavailable('Account not found')
+        if not is_active:
+            raise AccountUnavailable('Account is inactive')
+        raise InsufficientFunds('Insufficient funds')
+    return row
+
+
+def _charge_limits(account, amounts):
+    """
+    Check ``amounts`` against the single-transaction limit and add their total
+    to today's usage of ``account``; raises ``LimitExceeded``. Runs before the
+    balance UPDATEs so the usage row is always locked first.
+    """
+    single = limits.single_limit(account)
+    total = Money()
+    for amount in amounts:
+        amount = Money.coerce(amount)
+        if amount > single:
+            raise LimitExceeded(f'Amount exceeds the ${single} single-transaction limit')
+        total += amount
+    daily = limits.daily_limit(account)
+    if not limits.consume(account.id, total, daily):
+        raise LimitExceeded(f'This would exceed the ${daily} daily limit')
+
+
+def _posted_event(transaction):
+    return {
+        'transaction_id': transaction.id,
+        'type': transaction.transaction_type,
+        'amount_cents': Money.coerce(transaction.amount).cents,
+        'from_account_id': transaction.from_account_id,
+        'to_account_id': transaction.to_account_id,
+    }
+
+
+def _commit(kind):
+    idempotency.stage_completion()
+    with metrics.timed('posting_commit_seconds', kind=kind):
+        db.session.commit()
+    idempotency.confirm_completion()
+
+
+def _post(transaction, legs, accounts, opened=0):
+    db.session.add(transaction)
+    db.session.flush()  # assign transaction.id for the journal
+    # Ascending account id order => consistent lock order across workers
+    applied = []
+    for account_id, delta in sorted(legs):
+        sequence, balance = _apply(account_id, delta)
+        applied.append((account_id, [(delta, transaction.id)], sequence, balance))
+    ledger.record_legs(applied)
+    activity.record_activity(transaction, *accounts)
+    stats.bump(legs[0][0], accounts=opened, balance=sum((Money.coerce(delta) for _, delta in legs), Money()))
+    outbox.emit('transaction.posted', _posted_event(transaction))
+    _commit(transaction.transaction_type)
+    return transaction
+
+
+def run_with_retries(fn, *args):
+    """
+    Run ``fn(*args)`` as one DB transaction, retrying transient conflicts.
+
+    ``PostingError`` is never retried. Retries use exponential backoff with
+    full jitter, capped by ``POSTING_MAX_RETRIES``.
+    """
+    attempts = current_app.config.get('POSTING_MAX_RETRIES', 5)
+    base_delay = current_app.config.get('POSTING_RETRY_BACKOFF', 0.01)
+    for attempt in range(attempts + 1):
+        try:
+            return fn(*args)
+        except PostingError:
+            db.session.rollback()
+            raise
+        except RETRYABLE_ERRORS:
+            db.session.rollback()
+            if attempt == attempts:
+                raise
+            time.sleep(random.uniform(0, base_delay * (2 ** attempt)))
+
+
+# ----------------------------------------------------------------------
+# Postings
+# ----------------------------------------------------------------------
+def transfer(from_account, to_account, amount, description=None):
+    """Move ``amount`` between two accounts; raises ``InsufficientFunds`` or ``LimitExceeded``."""
+    amount = Money.coerce(amount)
+
+    def attempt():
+        _charge_limits(from_account, [amount])
+        transaction = Transaction(
+            transaction_type='transfer',
+            amount=amount,
+            description=description or f'Transfer to {to_account.account_number}',
+            from_account_id=from_account.id,
+            to_account_id=to_account.id
+        )
+        legs = [(from_account.id, -amount), (to_account.id, amount)]
+        return _post(transaction, legs, (from_account, to_account))
+    return run_with_retries(attempt)
+
+
+def transfer_many(from_account, items):
+    """
+    Post many transfers out of ``from_account`` as one DB transaction.
+
+    ``items`` is a list of ``(to_account, amount, description)``; accounts
+    only need ``id``, ``account_number`` and ``user_id`` (plus the limit
+    overrides for ``from_account``), so plain column rows work. Each account
+    is updated once for its net movement (reserving one journal sequence per
+    leg), in ascending id order. Returns the new transaction ids. Raises
+    ``InsufficientFunds`` or ``LimitExceeded`` if the total does not fit, in
+    which case nothing is posted.
+    """
+    def attempt():
+        _charge_limits(from_account, [amount for _, amount, _ in items])
+        postings = []
+        for to_account, amount, description in items:
+            transaction = Transaction(
+                transaction_type='transfer',
+                amount=amount,
+                description=description or f'Transfer to {to_account.account_number}',
+                from_account_id=from_account.id,
+                to_account_id=to_account.id
+            )
+            postings.append((transaction, (from_account, to_account)))
+        db.session.add_all([transaction for transaction, _ in postings])
+        db.session.flush()  # assign transaction ids for the journal
+
+        legs = defaultdict(list)
+        for transaction, (_, to_account) in postings:
+            amount = Money.coerce(transaction.amount)
+            legs[from_account.id].append((-amount, transaction.id))
+            legs[to_account.id].append((amount, transaction.id))
+
+        applied = []
+        for account_id in sorted(legs):
+            net = sum((delta for delta, _ in legs[account_id]), Money())
+            sequence, balance = _apply(account_id, net, entries=len(legs[account_id]))
+            applied.append((account_id, legs[account_id], sequence, balance))
+        ledger.record_legs(applied)
+        activity.record_many(postings)
+        outbox.emit('transaction.posted', *(_posted_event(transaction) for transaction, _ in postings))
+        # Read ids before commit expires them (avoids a reload per row)
+        transaction_ids = [transaction.id for transaction, _ in postings]
+        _commit('batch')
+        return transaction_ids
+    return run_with_retries(attempt)
+
+
+def deposit(account, amount, description=None):
+    amount = Money.coerce(amount)
+
+    def attempt():
+        transaction = Transaction(
+            transaction_type='deposit',
+            amount=amount,
+            description=description or 'Cash deposit',
+            to_account_id=account.id
+        )
+        return _post(transaction, [(account.id, amount)], (account,))
+    return run_with_retries(attempt)
+
+
+def withdraw(account, amount, description=None):
+    """Withdraw ``amount``; raises ``InsufficientFunds`` or ``LimitExceeded``."""
+    amount = Money.coerce(amount)
+
+    def attempt():
+        _charge_limits(account, [amount])
+        transaction = Transaction(
+            transaction_type='withdrawal',
+            amount=amount,
+            description=description or 'Cash withdrawal',
+            from_account_id=account.id
+        )
+        return _post(transaction, [(account.id, -amount)], (account,))
+    return run_with_retries(attempt)
+
+
+def open_account(user_id, account_type, initial_deposit=0.0):
+    """Create an account, posting any initial deposit as a transaction."""
+    initial_deposit = Money.coerce(initial_deposit or 0)
+
+    def attempt():
+        account = Account(account_type=account_type, balance=0, user_id=user_id)
+        db.session.add(account)
+        db.session.flush()  # assign account.id for the transaction below
+
+        if initial_deposit > 0:
+            transaction = Transaction(
+                transaction_type='deposit',
+                amount=initial_deposit,
+                description='Initial deposit',
+                to_account_id=account.id
+            )
+            # The deposit's counter update also counts the new account
+            _post(transaction, [(account.id, initial_deposit)], (account,), opened=1)
+        else:
+            stats.bump(account.id, accounts=1)
+            _commit('open_account')
+        return account
+    return run_with_retries(attempt)
@@ -0,0 +1,260 @@
+"""
+Session-principal cache.
+
+``load_user`` runs on every authenticated request. Rather than loading the
+full ``User`` row and lazily loading ``User.role`` behind it, it returns a
+``Principal`` built from an immutable ``PrincipalSnapshot`` kept in a
+process-local TTL/LRU cache (or a shared backend configured through
+``PRINCIPAL_CACHE_BACKEND``). Role checks on the principal cost zero queries;
+anything not in the snapshot falls through to the ORM row on first access.
+
+Updated or deleted ``User`` and ``Role`` rows are noted during the flush and
+their entries invalidated once the transaction commits, so a rolled-back
+change never evicts anything and nothing re-reads the old row between the
+eviction and the commit. Entries can also be dropped explicitly with
+``invalidate_principal``.
+
+The in-process backend only evicts in the worker that made the change: other
+workers keep serving the old snapshot (a deactivated user stays logged in,
+a demoted admin keeps the role) for up to ``PRINCIPAL_CACHE_TTL`` seconds.
+Use the redis backend where that window matters.
+"""
+
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from importlib import import_module
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from banking_app import db
+
+PrincipalSnapshot = namedtuple(
+    'PrincipalSnapshot', ['id', 'username', 'first_name', 'role_name', 'is_active'])
+
+
+# ----------------------------------------------------------------------
+# Cache backends
+# ----------------------------------------------------------------------
+class PrincipalCache(ABC):
+    """Interface for principal cache backends."""
+
+    @abstractmethod
+    def get(self, user_id):
+        """Cached ``PrincipalSnapshot`` for ``user_id``, or None."""
+
+    @abstractmethod
+    def set(self, snapshot):
+        """Store ``snapshot`` under its ``id``."""
+
+    @abstractmethod
+    def invalidate(self, user_id):
+        """Drop the entry for ``user_id`` if there is one."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry."""
+
+
+class LocalPrincipalCache(PrincipalCache):
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, snapshot = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def set(self, snapshot):
+        with self._lock:
+            self._entries[snapshot.id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisPrincipalCache(PrincipalCache):
+    """Shared backend so every gunicorn worker sees the same invalidations."""
+
+    def __init__(self, url, ttl=60, prefix='securebank:principal:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('RedisPrincipalCache requires the "redis" package') from exc
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, user_id):
+        raw = self._client.get(f'{self.prefix}{user_id}')
+        return PrincipalSnapshot(*json.loads(raw)) if raw else None
+
+    def set(self, snapshot):
+        self._client.set(f'{self.prefix}{snapshot.id}', json.dumps(list(snapshot)), ex=self.ttl)
+
+    def invalidate(self, user_id):
+        self._client.delete(f'{self.prefix}{user_id}')
+
+    def clear(self):
+        for key in self._client.scan_iter(f'{self.prefix}*'):
+            self._client.delete(key)
+
+
+def _build_cache(config):
+    ttl = config.get('PRINCIPAL_CACHE_TTL', 60)
+    backend = config.get('PRINCIPAL_CACHE_BACKEND')
+    if backend == 'redis':
+        return RedisPrincipalCache(config['PRINCIPAL_CACHE_URL'], ttl=ttl)
+    if backend:
+        module_name, _, class_name = backend.partition(':')
+        return getattr(import_module(module_name), class_name)(config)
+    return LocalPrincipalCache(maxsize=config.get('PRINCIPAL_CACHE_SIZE', 10000), ttl=ttl)
+
+
+def get_cache():
+    return current_app.extensions['principal_cache']
+
+
+# ----------------------------------------------------------------------
+# Principal
+# ----------------------------------------------------------------------
+class Principal(UserMixin):
+    """``current_user`` backed by a cached snapshot instead of an ORM row."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._user = None
+
+    id = property(lambda self: self._snapshot.id)
+    username = property(lambda self: self._snapshot.username)
+    first_name = property(lambda self: self._snapshot.first_name)
+    is_active = property(lambda self: self._snapshot.is_active)
+
+    def is_admin(self):
+        return self._snapshot.role_name == 'admin'
+
+    def is_customer(self):
+        return self._snapshot.role_name == 'customer'
+
+    @property
+    def accounts(self):
+        # Same dynamic-query interface as User.accounts, without loading the user
+        from banking_app.models import Account
+        return Account.query.filter_by(user_id=self.id)
+
+    @property
+    def user(self):
+        """The full ``User`` row, loaded on first use."""
+        if self._user is None:
+            from banking_app.models import User
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __repr__(self):
+        return f'<Principal {self.username}>'
+
+
+def load_snapshot(user_id):
+    """Snapshot for ``user_id`` from cache, or one joined query on a miss."""
+    cache = get_cache()
+    snapshot = cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    from banking_app.models import Role, User
+    row = (db.session.query(User.id, User.username, User.first_name, Role.name, User.is_active)
+           .join(Role, User.role_id == Role.id)
+           .filter(User.id == user_id)
+           .first())
+    if row is None:
+        return None
+    snapshot = PrincipalSnapshot(*row)
+    cache.set(snapshot)
+    return snapshot
+
+
+def invalidate_principal(user_id=None):
+    """Drop one user's cached principal, or every entry when ``user_id`` is None."""
+    cache = get_cache()
+    if user_id is None:
+        cache.clear()
+    else:
+        cache.invalidate(user_id)
+
+
+# ----------------------------------------------------------------------
+# Invalidation hooks
+# ----------------------------------------------------------------------
+_SESSION_KEY = 'principal_changes'
+_EVERYONE = None
+
+
+def _note_change(target, user_id):
+    object_session(target).info.setdefault(_SESSION_KEY, set()).add(user_id)
+
+
+def _user_changed(mapper, connection, target):
+    _note_change(target, target.id)
+
+
+def _role_changed(mapper, connection, target):
+    _note_change(target, _EVERYONE)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    changed = session.info.pop(_SESSION_KEY, None)
+    if not changed or not has_app_context() or 'principal_cache' not in current_app.extensions:
+        return
+    if _EVERYONE in changed:
+        invalidate_principal()
+    else:
+        for user_id in changed:
+            invalidate_principal(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changes(session, previous_transaction):
+    # A savepoint rollback leaves the outer transaction's changes to commit
+    if previous_transaction.parent is None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def init_app(app):
+    app.extensions['principal_cache'] = _build_cache(app.config)
+
+    from banking_app.models import Role, User
+    if not event.contains(User, 'after_update', _user_changed):
+        for name in ('after_update', 'after_delete'):
+            event.listen(User, name, _user_changed)
+            event.listen(Role, name, _role_changed)
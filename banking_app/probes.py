@@ -0,0 +1,167 @@
+"""
+Liveness and readiness probes.
+
+``/live`` answers from memory and never touches a dependency: it only proves
+the worker can serve a request. ``/ready`` (and ``/health``, kept for
+existing load-balancer and DNS-failover checks) serve the cached verdict of a
+background checker that samples the database, the connection pool and any
+registered checks (e.g. the schema revision) every ``PROBE_INTERVAL`` seconds
+per worker, so probe traffic never reaches the database.
+
+A verdict is ``ready``, ``degraded`` (a non-critical check failed; still
+serving) or ``unavailable`` (a critical check failed). Each carries its age
+and the time it entered its current state; a verdict older than
+``PROBE_STALE_AFTER`` seconds is reported as ``stale`` and not ready, because
+the checker itself has stopped.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, jsonify
+from sqlalchemy import text
+
+from banking_app import metrics
+
+Verdict = namedtuple('Verdict', 'state checks sampled_at since')
+
+SERVING_STATES = ('ready', 'degraded')
+
+
+class ProbeFailed(Exception):
+    """A check found a problem; the message is reported as its detail."""
+
+
+# ----------------------------------------------------------------------
+# Built-in checks (run inside an app context; return a detail string)
+# ----------------------------------------------------------------------
+def check_database():
+    from banking_app import db
+    started = time.perf_counter()
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    elapsed = time.perf_counter() - started
+    metrics.observe('db_ping_seconds', elapsed)
+    return f'ping {elapsed * 1000:.1f}ms'
+
+
+def check_pool():
+    from banking_app import db, dbpool
+    status = dbpool.pool_status(db.engine, current_app.config)
+    if 'size' not in status:
+        return status['pool_class']
+    if status['max_overflow'] < 0:
+        # Unlimited overflow never saturates
+        return f"{status['checked_out']} connections in use (overflow unbounded)"
+    capacity = status['size'] + status['max_overflow']
+    if status['checked_out'] >= capacity:
+        raise ProbeFailed(f"pool saturated: {status['checked_out']}/{capacity} connections in use")
+    return f"{status['checked_out']}/{capacity} connections in use"
+
+
+class ReadinessChecker:
+    def __init__(self, app, interval=5.0, stale_after=None):
+        self.app = app
+        self.interval = interval
+        self.stale_after = stale_after or interval * 3
+        self.verdict = None
+        self.checks = [('database', check_database, True), ('pool', check_pool, False)]
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, name, check, critical=True):
+        """Add ``check() -> detail`` (raise to fail) to every sample."""
+        self.checks.append((name, check, critical))
+
+    def sample(self):
+        results = {}
+        state = 'ready'
+        with self.app.app_context():
+            for name, check, critical in self.checks:
+                started = time.perf_counter()
+                try:
+                    detail, ok = check(), True
+                except Exception as e:  # any failure is a verdict, not a crash
+                    detail, ok = str(e).splitlines()[0][:200] if str(e) else type(e).__name__, False
+                    state = 'unavailable' if critical else ('degraded' if state == 'ready' else state)
+                results[name] = {'ok': ok, 'detail': detail,
+                                 'ms': round((time.perf_counter() - started) * 1000, 2)}
+        now = time.time()
+        previous = self.verdict
+        since = previous.since if previous and previous.state == state else now
+        self.verdict = Verdict(state, results, now, since)
+        return self.verdict
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception:
+                self.app.logger.exception('Readiness sample failed')
+
+    def ensure_running(self):
+        """Start the sampler in this process (again after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.verdict = None
+            threading.Thread(target=self._run, name='readiness-checker', daemon=True).start()
+
+    def current(self):
+        """The cached verdict as a dict; samples once if there is none yet."""
+        self.ensure_running()
+        verdict = self.verdict or self.sample()
+        now = time.time()
+        age = now - verdict.sampled_at
+        state = 'stale' if age > self.stale_after else verdict.state
+        return {
+            'ready': state in SERVING_STATES,
+            'state': state,
+            'age_s': round(age, 2),
+            'since': datetime.utcfromtimestamp(verdict.since).isoformat() + 'Z',
+            'state_age_s': round(now - verdict.since, 2),
+            'checks': verdict.checks,
+        }
+
+
+def get_checker():
+    return current_app.extensions['readiness']
+
+
+def init_app(app):
+    checker = ReadinessChecker(app, app.config.get('PROBE_INTERVAL', 5.0),
+                               app.config.get('PROBE_STALE_AFTER'))
+    app.extensions['readiness'] = checker
+    env = os.environ.get('FLASK_ENV', 'production')
+    started_at = time.time()
+
+    # Liveness: no database, no checker, no locks
+    @app.route('/live')
+    def liveness_check():
+        return jsonify({'status': 'alive', 'uptime_s': round(time.time() - started_at, 1)}), 200
+
+    # Readiness: cached verdict from the background checker
+    @app.route('/ready')
+    def readiness_check():
+        verdict = checker.current()
+        return jsonify(verdict), 200 if verdict['ready'] else 503
+
+    # Health endpoint (for DNS/LB checks): same cached verdict, legacy shape
+    @app.route('/health')
+    def health_check():
+        verdict = checker.current()
+        status = {'ready': 'healthy', 'degraded': 'degraded'}.get(verdict['state'], 'unhealthy')
+        return jsonify({
+            'status': status,
+            'database': 'connected' if verdict['checks'].get('database', {}).get('ok') else 'disconnected',
+            'version': '1.0.0',
+            'environment': env,
+            **verdict,
+        }), 200 if verdict['ready'] else 503
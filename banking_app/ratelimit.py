@@ -0,0 +1,233 @@
+"""
+Rate limits for login and registration.
+
+A credential-stuffing burst would otherwise cost a user lookup and a full
+password KDF per attempt. Every rule is a sliding window of ``limit`` hits
+per ``window`` seconds, estimated from two fixed-window counters (this
+window's hits plus the previous window's, weighted by how much of it still
+overlaps), so a key costs two integers however many hits it sees and the
+limit cannot be doubled by straddling a window boundary.
+
+Rules (``RATE_LIMIT_<RULE>`` in the config, ``"limit/seconds"``, ``"0"``
+disables one):
+
+* ``login_ip``: every login POST from one client IP
+* ``login_username``: failed logins for one username, from any IP
+* ``register_ip``: every registration POST from one client IP
+
+Views check before any database or KDF work and answer 429 with
+``Retry-After``. Counters are per process by default; set
+``RATE_LIMIT_BACKEND=redis`` to share them between workers (see principal.py
+for the backend conventions). Client IPs come from ``request.remote_addr``;
+behind a proxy set ``TRUSTED_PROXIES`` so it is the real client.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from importlib import import_module
+
+from flask import current_app, request
+
+from banking_app import metrics
+
+Rule = namedtuple('Rule', 'name limit window')
+Decision = namedtuple('Decision', 'allowed retry_after')
+
+ALLOWED = Decision(True, 0)
+RULES = ('login_ip', 'login_username', 'register_ip')
+MAX_KEY_LENGTH = 100
+
+
+def parse_rule(name, spec):
+    """``Rule`` from ``"limit/seconds"``; ``None`` when ``spec`` is empty or ``"0"``."""
+    if not spec or spec == '0':
+        return None
+    limit, _, window = str(spec).partition('/')
+    return Rule(name, int(limit), int(window or 60))
+
+
+# ----------------------------------------------------------------------
+# Counter stores
+# ----------------------------------------------------------------------
+class RateLimitStore:
+    """
+    Interface for counter backends. Both methods return the hit counts of
+    the current and the previous fixed window of ``window`` seconds that
+    starts at ``window_index * window``.
+    """
+
+    def hit(self, key, window, window_index):
+        """Count one hit in the current window; returns ``(current, previous)``."""
+        raise NotImplementedError
+
+    def peek(self, key, window, window_index):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocalRateLimitStore(RateLimitStore):
+    """Thread-safe in-process counters, LRU-bounded to ``maxsize`` keys."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # (key, window) -> [window_index, current, previous]
+        self._lock = threading.Lock()
+
+    def _roll(self, entry_key, window_index):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return [window_index, 0, 0]
+        index, current, previous = entry
+        if index == window_index:
+            return entry
+        return [window_index, 0, current if index == window_index - 1 else 0]
+
+    def hit(self, key, window, window_index):
+        with self._lock:
+            entry = self._roll((key, window), window_index)
+            entry[1] += 1
+            self._entries[(key, window)] = entry
+            self._entries.move_to_end((key, window))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return entry[1], entry[2]
+
+    def peek(self, key, window, window_index):
+        with self._lock:
+            _, current, previous = self._roll((key, window), window_index)
+            return current, previous
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Shared backend: every gunicorn worker counts against the same windows."""
+
+    def __init__(self, url, prefix='securebank:ratelimit:'):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError('RedisRateLimitStore requires the "redis" package') from exc
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _keys(self, key, window, window_index):
+        return (f'{self.prefix}{key}:{window}:{window_index}',
+                f'{self.prefix}{key}:{window}:{window_index - 1}')
+
+    def hit(self, key, window, window_index):
+        current_key, previous_key = self._keys(key, window, window_index)
+        pipe = self._client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, 2 * window)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        return int(current), int(previous or 0)
+
+    def peek(self, key, window, window_index):
+        current, previous = self._client.mget(self._keys(key, window, window_index))
+        return int(current or 0), int(previous or 0)
+
+    def clear(self):
+        for key in self._client.scan_iter(f'{self.prefix}*'):
+            self._client.delete(key)
+
+
+def _build_store(config):
+    backend = config.get('RATE_LIMIT_BACKEND')
+    if backend == 'redis':
+        return RedisRateLimitStore(config['RATE_LIMIT_URL'])
+    if backend:
+        module_name, _, class_name = backend.partition(':')
+        return getattr(import_module(module_name), class_name)(config)
+    return LocalRateLimitStore(maxsize=config.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+
+# ----------------------------------------------------------------------
+# Limiter
+# ----------------------------------------------------------------------
+class RateLimiter:
+    def __init__(self, store, rules, clock=time.time):
+        self.store = store
+        self.rules = {rule.name: rule for rule in rules if rule is not None}
+        self.clock = clock
+
+    @staticmethod
+    def _decide(rule, current, previous, elapsed, allowed):
+        """Sliding estimate ``previous * (1 - elapsed / window) + current`` against the limit."""
+        overlap = 1 - elapsed / rule.window
+        if allowed(previous * overlap + current):
+            return ALLOWED
+        retry_after = rule.window - elapsed
+        if current < rule.limit:
+            # Sooner, once the previous window's weight has decayed enough
+            retry_after = min(retry_after, rule.window * (overlap - (rule.limit - current) / previous))
+        return Decision(False, max(1, math.ceil(retry_after)))
+
+    def _window(self, rule):
+        now = self.clock()
+        index = int(now // rule.window)
+        return index, now - index * rule.window
+
+    def hit(self, name, key):
+        """Count an attempt under rule ``name``; the ``Decision`` includes this attempt."""
+        rule = self.rules.get(name)
+        if rule is None or not key:
+            return ALLOWED
+        index, elapsed = self._window(rule)
+        current, previous = self.store.hit(f'{name}:{key[:MAX_KEY_LENGTH]}', rule.window, index)
+        decision = self._decide(rule, current, previous, elapsed, lambda hits: hits <= rule.limit)
+        _record(name, decision)
+        return decision
+
+    def count(self, name, key):
+        """Count an attempt under rule ``name`` without deciding on it (e.g. a failure after the fact)."""
+        rule = self.rules.get(name)
+        if rule is not None and key:
+            self.store.hit(f'{name}:{key[:MAX_KEY_LENGTH]}', rule.window, self._window(rule)[0])
+
+    def check(self, name, key):
+        """Whether one more attempt fits, without counting it."""
+        rule = self.rules.get(name)
+        if rule is None or not key:
+            return ALLOWED
+        index, elapsed = self._window(rule)
+        current, previous = self.store.peek(f'{name}:{key[:MAX_KEY_LENGTH]}', rule.window, index)
+        decision = self._decide(rule, current, previous, elapsed, lambda hits: hits < rule.limit)
+        _record(name, decision)
+        return decision
+
+
+def _record(name, decision):
+    metrics.inc('ratelimit_decisions_total', rule=name, outcome='allowed' if decision.allowed else 'limited')
+
+
+def get_limiter():
+    return current_app.extensions['ratelimit']
+
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def username_key(username):
+    return (username or '').strip().lower()
+
+
+def init_app(app):
+    rules = [parse_rule(name, app.config.get(f'RATE_LIMIT_{name.upper()}')) for name in RULES]
+    store = _build_store(app.config)
+    app.extensions['ratelimit'] = RateLimiter(store, rules)
+
+    if isinstance(store, LocalRateLimitStore) and 'metrics' in app.extensions:
+        app.extensions['metrics'].gauge('ratelimit_tracked_keys', lambda: [({}, len(store))],
+                                        'Keys held by the in-process rate-limit store.')
@@ -0,0 +1,101 @@
+"""
+Startup profiling and the pre-fork (preload) boot path.
+
+``create_app`` records how long each of its phases takes in a
+``StartupProfile`` (``app.extensions['startup']``); ``flask startup profile``
+prints it together with the slowest imports of a fresh interpreter
+(``python -X importtime``).
+
+With ``GUNICORN_PRELOAD=1`` (see ``gunicorn.conf.py``) the app is built once
+in the Gunicorn master and forked into the workers, so a worker boot or
+recycle costs a ``fork()`` instead of a full import and ``create_app``. The
+master keeps the cyclic GC disabled and calls ``prefork`` before forking:
+pooled connections the master opened are closed, every template is compiled
+once (see fragments.py), and every object is moved to the permanent
+generation with ``gc.freeze()``, so collections in the workers don't write
+to (and un-share) the copy-on-write pages. ``postfork``
+runs in each worker and turns the GC back on.
+"""
+
+import gc
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+ImportTime = namedtuple('ImportTime', 'module self_s cumulative_s')
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class StartupProfile:
+    """Wall-clock time of each ``create_app`` phase, in order."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+
+def import_times(module='wsgi', python=None):
+    """
+    Import ``module`` in a fresh interpreter with ``-X importtime``.
+
+    Returns ``(total_seconds, [ImportTime...])`` with one entry per module,
+    slowest cumulative first; ``total_seconds`` is the wall time of the
+    whole subprocess (interpreter start included).
+    """
+    started = time.perf_counter()
+    result = subprocess.run([python or sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    total = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else
+                           f'import {module} failed')
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            entries.append(ImportTime(name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    entries.sort(key=lambda entry: entry.cumulative_s, reverse=True)
+    return total, entries
+
+
+# ----------------------------------------------------------------------
+# Gunicorn preload hooks
+# ----------------------------------------------------------------------
+def _dispose_engines(app, close):
+    from banking_app import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def prefork(app):
+    """In the master, after the app is loaded and before workers fork."""
+    _dispose_engines(app, close=True)
+    # Workers inherit compiled templates instead of each compiling its own
+    from banking_app import fragments
+    fragments.compile_templates(app)
+    gc.collect()
+    gc.freeze()
+
+
+def postfork(app):
+    """In each worker right after fork."""
+    # Drop any pool state inherited from the master without touching its sockets
+    _dispose_engines(app, close=False)
+    gc.enable()
@@ -0,0 +1,91 @@
+"""
+Materialized system statistics for the admin dashboard.
+
+User and active-account counts and the total balance live in
+``system_stats``. Registration and the posting service bump them in the same
+DB transaction as the change itself, so the dashboard reads one aggregate
+over a handful of rows instead of scanning ``user`` and ``account``.
+
+A single counter row would make every deposit and withdrawal queue on the
+same row lock, so the counters are striped over ``SYSTEM_STATS_SLOTS`` rows
+and each change lands on the slot of the account it touches.
+``refresh`` recomputes everything from the base tables; run it periodically
+(``flask stats refresh``) or from the dashboard to correct drift from writes
+that bypass the posting service.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, insert, update
+
+from banking_app import db
+from banking_app.models import Account, SystemStats, User
+from banking_app.money import Money
+
+DEFAULT_SLOTS = 16
+
+Snapshot = namedtuple('Snapshot', 'user_count active_account_count total_balance refreshed_at updated_at')
+
+
+def slot_count():
+    return current_app.config.get('SYSTEM_STATS_SLOTS', DEFAULT_SLOTS)
+
+
+def bump(key=0, users=0, accounts=0, balance=0):
+    """
+    Add deltas to the counters. ``key`` (e.g. an account id) picks the slot.
+    Runs inside the caller's transaction; a no-op until the first ``refresh``.
+    """
+    balance = Money.coerce(balance)
+    if not (users or accounts or balance):
+        return
+    db.session.execute(
+        update(SystemStats)
+        .where(SystemStats.slot == key % slot_count())
+        .values(user_count=SystemStats.user_count + users,
+                active_account_count=SystemStats.active_account_count + accounts,
+                total_balance=SystemStats.total_balance + balance,
+                updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False))
+
+
+def refresh():
+    """Recompute every counter from the base tables and commit."""
+    now = datetime.utcnow()
+    # Take the slot locks first: postings that commit after this point wait
+    # for us, those that committed before are included in the totals below
+    locked = db.session.execute(
+        update(SystemStats).values(refreshed_at=now).execution_options(synchronize_session=False)).rowcount
+
+    user_count = db.session.query(func.count(User.id)).scalar()
+    account_count = db.session.query(func.count(Account.id)).filter(Account.is_active.is_(True)).scalar()
+    total_balance = db.session.query(func.sum(Account.balance)).scalar() or Money()
+
+    slots = slot_count()
+    if locked != slots:
+        SystemStats.query.delete(synchronize_session=False)
+        db.session.execute(insert(SystemStats), [{'slot': slot} for slot in range(slots)])
+    db.session.execute(update(SystemStats).values(
+        user_count=0, active_account_count=0, total_balance=Money(),
+        refreshed_at=now, updated_at=now).execution_options(synchronize_session=False))
+    db.session.execute(update(SystemStats).where(SystemStats.slot == 0).values(
+        user_count=user_count, active_account_count=account_count,
+        total_balance=total_balance).execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def current():
+    """The dashboard numbers as a ``Snapshot``; refreshes first if never built."""
+    row = db.session.query(
+        func.sum(SystemStats.user_count),
+        func.sum(SystemStats.active_account_count),
+        func.sum(SystemStats.total_balance),
+        func.min(SystemStats.refreshed_at),
+        func.max(SystemStats.updated_at),
+    ).one()
+    if row[3] is None:
+        refresh()
+        return current()
+    return Snapshot(row[0], row[1], Money.coerce(row[2] or 0), row[3], row[4])
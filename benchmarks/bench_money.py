@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Money representation benchmark - FLOAT dollars (before) vs BIGINT cents (after).
+
+Usage: python benchmarks/bench_money.py [--rows 200000] [--postings 20000]
+
+Runs against an in-memory SQLite database with one table per representation
+and reports, for each: SUM() aggregate time, conditional-UPDATE posting
+throughput, and the rounding drift accumulated by the aggregate.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banking_app.money import Money  # noqa: E402
+
+SCHEMAS = {
+    'float': ('CREATE TABLE account (id INTEGER PRIMARY KEY, balance FLOAT NOT NULL)',
+              lambda cents: cents / 100,
+              'UPDATE account SET balance = balance - ? WHERE id = ? AND balance >= ?'),
+    'cents': ('CREATE TABLE account (id INTEGER PRIMARY KEY, balance BIGINT NOT NULL)',
+              lambda cents: cents,
+              'UPDATE account SET balance = balance - ? WHERE id = ? AND balance >= ?'),
+}
+
+
+def timed(fn, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeat
+
+
+def run(kind, balances_cents, postings):
+    ddl, to_db, debit_sql = SCHEMAS[kind]
+    conn = sqlite3.connect(':memory:')
+    conn.execute(ddl)
+    conn.executemany('INSERT INTO account (id, balance) VALUES (?, ?)',
+                     ((i + 1, to_db(c)) for i, c in enumerate(balances_cents)))
+    conn.commit()
+
+    total, agg_seconds = timed(lambda: conn.execute('SELECT SUM(balance) FROM account').fetchone()[0], 5)
+    exact = Decimal(sum(balances_cents)) / 100
+    if kind == 'float':
+        drift = abs(Decimal(repr(total)) - exact)
+    else:
+        drift = abs(Money(total).to_decimal() - exact)
+
+    def post():
+        for account_id, amount_cents in postings:
+            amount = to_db(amount_cents)
+            conn.execute(debit_sql, (amount, account_id, amount))
+        conn.commit()
+    _, post_seconds = timed(post)
+    conn.close()
+    return agg_seconds * 1000, len(postings) / post_seconds, drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--postings', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    balances = [rng.randint(0, 10_000_000) for _ in range(args.rows)]
+    postings = [(rng.randint(1, args.rows), rng.randint(1, 50_000)) for _ in range(args.postings)]
+
+    print(f'{args.rows} accounts, {args.postings} postings (SQLite in-memory)\n')
+    print(f"{'representation':16} {'SUM ms':>10} {'postings/s':>12} {'SUM drift $':>14}")
+    print('-' * 55)
+    for kind in ('float', 'cents'):
+        agg_ms, rate, drift = run(kind, balances, postings)
+        print(f'{kind:16} {agg_ms:10.2f} {rate:12.0f} {str(drift):>14}')
+
+    # Python-side arithmetic on the posting path
+    amounts = [a for _, a in postings]
+    _, float_s = timed(lambda: sum(a / 100 for a in amounts), 5)
+    _, money_s = timed(lambda: sum((Money(a) for a in amounts), Money()), 5)
+    _, int_s = timed(lambda: sum(amounts), 5)
+    print(f"\nPython sum of {len(amounts)} amounts: float {float_s * 1000:.2f} ms, "
+          f"Money {money_s * 1000:.2f} ms, raw int cents {int_s * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark - logins/sec per core for each hashing policy.
+
+Usage: python benchmarks/bench_password_hashing.py [--seconds 3]
+
+Each policy is timed single-threaded, so the figure is what one CPU core can
+verify per second; multiply by available cores for a worker's ceiling.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash  # noqa: E402
+
+from banking_app.passwords import hash_password  # noqa: E402
+
+POLICIES = {
+    'legacy pbkdf2:sha256 (600k, 8-byte salt)': {
+        'PASSWORD_HASH_ALGORITHM': 'pbkdf2:sha256', 'PASSWORD_HASH_ITERATIONS': 600000,
+        'PASSWORD_SALT_LENGTH': 8},
+    'pbkdf2:sha256 600k': {
+        'PASSWORD_HASH_ALGORITHM': 'pbkdf2:sha256', 'PASSWORD_HASH_ITERATIONS': 600000},
+    'pbkdf2:sha256 310k': {
+        'PASSWORD_HASH_ALGORITHM': 'pbkdf2:sha256', 'PASSWORD_HASH_ITERATIONS': 310000},
+    'pbkdf2:sha512 210k': {
+        'PASSWORD_HASH_ALGORITHM': 'pbkdf2:sha512', 'PASSWORD_HASH_ITERATIONS': 210000},
+    'scrypt 32768:8:1': {
+        'PASSWORD_HASH_ALGORITHM': 'scrypt', 'PASSWORD_SCRYPT_PARAMS': '32768:8:1'},
+    'scrypt 16384:8:1': {
+        'PASSWORD_HASH_ALGORITHM': 'scrypt', 'PASSWORD_SCRYPT_PARAMS': '16384:8:1'},
+}
+
+
+def bench(config, seconds):
+    password_hash = hash_password('correct horse battery staple', config)
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        check_password_hash(password_hash, 'correct horse battery staple')
+        count += 1
+    elapsed = time.perf_counter() - started
+    return count / elapsed, elapsed / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=3.0, help='time budget per policy')
+    args = parser.parse_args()
+
+    print(f"{'policy':45} {'logins/s/core':>14} {'ms/verify':>10}")
+    print('-' * 71)
+    for name, config in POLICIES.items():
+        rate, latency = bench(config, args.seconds)
+        print(f'{name:45} {rate:14.1f} {latency:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,26 @@
 import os
 
+
+def engine_options(uri, pool_size, max_overflow, pool_timeout, pool_recycle, pre_ping,
+                   statement_timeout_ms, lock_timeout_ms):
+    """SQLALCHEMY_ENGINE_OPTIONS for the pool profile below."""
+    if uri == 'sqlite://' or (uri.startswith('sqlite') and ':memory:' in uri):
+        return {}  # one shared in-memory connection (StaticPool); nothing to size
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pre_ping,
+    }
+    if uri.startswith('postgresql'):
+        # Server-side guards: no statement or lock wait can pin a connection forever
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={statement_timeout_ms} -c lock_timeout={lock_timeout_ms}',
+        }
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'banking-secret-key-change-in-production'
     
@@ -13,14 +34,171 @@ class Config:
     # Database connection
     SQLALCHEMY_DATABASE_URI = uri or 'sqlite:///banking_app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # --- Connection pool profile ---
+    # Each gunicorn worker has its own pool: one connection per request thread,
+    # plus overflow for background work (rehash, readiness checks). Worst case the
+    # app holds GUNICORN_WORKERS x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections;
+    # set DB_MAX_CONNECTIONS to this app's share of the database's max_connections
+    # and the per-worker pool is shrunk to fit.
+    GUNICORN_WORKERS = int(os.environ.get('GUNICORN_WORKERS', '3'))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '2'))
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '0')) or None
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', GUNICORN_THREADS))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '2'))
+    if DB_MAX_CONNECTIONS:
+        DB_POOL_SIZE = max(min(DB_POOL_SIZE, DB_MAX_CONNECTIONS // GUNICORN_WORKERS), 1)
+        DB_MAX_OVERFLOW = max(min(DB_MAX_OVERFLOW, DB_MAX_CONNECTIONS // GUNICORN_WORKERS - DB_POOL_SIZE), 0)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))        # seconds waiting for a connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))        # seconds; beat server/LB idle cuts
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '5000'))  # PostgreSQL only
+    DB_LOCK_TIMEOUT_MS = int(os.environ.get('DB_LOCK_TIMEOUT_MS', '2000'))            # PostgreSQL only
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+        DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, DB_LOCK_TIMEOUT_MS)
     
     # App settings
     WTF_CSRF_ENABLED = True
     
-    # Transaction limits
+    # Transaction limits (outgoing; daily is per account and UTC day).
+    # Accounts can override both, see limits.py
     TRANSACTION_LIMIT_DAILY = float(os.environ.get('TXN_LIMIT_DAILY', '10000.00'))
     TRANSACTION_LIMIT_SINGLE = float(os.environ.get('TXN_LIMIT_SINGLE', '5000.00'))
 
+    # Account numbers: 9-digit serial + Luhn check digit, reserved in blocks per worker.
+    # The check-digit test stays off by default: pre-allocator (random) numbers would fail it.
+    # Turn it on once no such numbers are in use
+    ACCOUNT_NUMBER_BLOCK_SIZE = int(os.environ.get('ACCOUNT_NUMBER_BLOCK_SIZE', '100'))
+    ACCOUNT_NUMBER_START = int(os.environ.get('ACCOUNT_NUMBER_START', '100000000'))
+    ACCOUNT_NUMBER_CHECK_DIGIT = os.environ.get('ACCOUNT_NUMBER_CHECK_DIGIT', '0') == '1'
+
+    # Statement exports: rows fetched per round trip from the server-side cursor
+    STATEMENT_FETCH_SIZE = int(os.environ.get('STATEMENT_FETCH_SIZE', '1000'))
+
+    # Admin dashboard counters are striped over this many rows (see stats.py)
+    SYSTEM_STATS_SLOTS = int(os.environ.get('SYSTEM_STATS_SLOTS', '16'))
+
+    # Admin lists count matching rows up to this cap ("1,000+") on every page load
+    # unless the database can estimate (PostgreSQL planner rows)
+    ADMIN_COUNT_CAP = int(os.environ.get('ADMIN_COUNT_CAP', '1000'))
+
+    # Batch transfers: lines per upload, lines per DB transaction
+    BATCH_TRANSFER_MAX_LINES = int(os.environ.get('BATCH_TRANSFER_MAX_LINES', '10000'))
+    BATCH_TRANSFER_CHUNK_SIZE = int(os.environ.get('BATCH_TRANSFER_CHUNK_SIZE', '500'))
+
+    # Posting service retries on deadlock / serialization / lock conflicts
+    POSTING_MAX_RETRIES = int(os.environ.get('POSTING_MAX_RETRIES', '5'))
+    POSTING_RETRY_BACKOFF = float(os.environ.get('POSTING_RETRY_BACKOFF', '0.01'))  # seconds, doubled per attempt
+
+    # Ledger: checkpoint an account's balance every N journal entries
+    LEDGER_SNAPSHOT_INTERVAL = int(os.environ.get('LEDGER_SNAPSHOT_INTERVAL', '100'))
+
+    # Dashboard read model: transactions kept per user in the recent-activity feed
+    RECENT_ACTIVITY_SIZE = int(os.environ.get('RECENT_ACTIVITY_SIZE', '20'))
+
+    # Password hashing policy (see banking_app/passwords.py). Hashes from an
+    # older policy are upgraded on the user's next successful login.
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2:sha256')  # or 'scrypt'
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '600000'))
+    PASSWORD_SCRYPT_PARAMS = os.environ.get('PASSWORD_SCRYPT_PARAMS', '32768:8:1')  # n:r:p
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+    PASSWORD_REHASH_ON_LOGIN = True
+    # 0 verifies on the request thread; N bounds concurrent KDF work to N
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get('PASSWORD_VERIFY_WORKERS', '0'))
+    PASSWORD_VERIFY_TIMEOUT = float(os.environ.get('PASSWORD_VERIFY_TIMEOUT', '5'))
+
+    # Session-principal cache used by load_user (see banking_app/principal.py).
+    # Backend: unset for in-process LRU, 'redis' (needs PRINCIPAL_CACHE_URL), or
+    # 'module:Class' for a custom PrincipalCache built from the app config.
+    PRINCIPAL_CACHE_BACKEND = os.environ.get('PRINCIPAL_CACHE_BACKEND')
+    PRINCIPAL_CACHE_URL = os.environ.get('PRINCIPAL_CACHE_URL')
+    # Other workers may serve a changed user's old role/active flag until the TTL
+    # runs out with the in-process backend
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', '60'))
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000'))
+
+    # Metrics registry and /metrics (see banking_app/metrics.py). Percentiles cover
+    # the last METRICS_WINDOW_SECONDS. /metrics is 404 until METRICS_TOKEN is set,
+    # then requires it as a bearer token
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_WINDOW_SECONDS = int(os.environ.get('METRICS_WINDOW_SECONDS', '300'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Compare the applied schema revision with the code's at startup (one query)
+    SCHEMA_REVISION_CHECK = os.environ.get('SCHEMA_REVISION_CHECK', '1') == '1'
+
+    # Idempotency keys on transfer/batch/deposit/withdraw POSTs (see banking_app/idempotency.py)
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '2'))
+
+    # Login/registration rate limits, "limit/seconds" sliding windows; "0" disables
+    # a rule (see banking_app/ratelimit.py). Counters are per worker unless
+    # RATE_LIMIT_BACKEND is 'redis' (needs RATE_LIMIT_URL) or 'module:Class'
+    RATE_LIMIT_LOGIN_IP = os.environ.get('RATE_LIMIT_LOGIN_IP', '20/60')
+    RATE_LIMIT_LOGIN_USERNAME = os.environ.get('RATE_LIMIT_LOGIN_USERNAME', '5/300')
+    RATE_LIMIT_REGISTER_IP = os.environ.get('RATE_LIMIT_REGISTER_IP', '5/3600')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND')
+    RATE_LIMIT_URL = os.environ.get('RATE_LIMIT_URL')
+    RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted (0: none)
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+
+    # Transactional outbox drained by worker.py (see banking_app/outbox.py). Failed
+    # events are retried after OUTBOX_RETRY_BACKOFF seconds, doubling up to
+    # OUTBOX_RETRY_MAX_DELAY, and dead-lettered after OUTBOX_MAX_ATTEMPTS
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '2'))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1'))
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', '60'))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+    OUTBOX_RETRY_BACKOFF = float(os.environ.get('OUTBOX_RETRY_BACKOFF', '2'))
+    OUTBOX_RETRY_MAX_DELAY = float(os.environ.get('OUTBOX_RETRY_MAX_DELAY', '600'))
+    OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', '7'))
+
+    # Rendered-row cache and compiled-template cache (see banking_app/fragments.py).
+    # FRAGMENT_CACHE_SIZE=0 turns the row cache off; TEMPLATE_BYTECODE_CACHE_DIR
+    # defaults to a per-user temp directory
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '10000'))
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+
+    # Readiness checker (see banking_app/probes.py): sample period per worker, and
+    # the age after which a cached verdict counts as stale (default 3 x interval)
+    PROBE_INTERVAL = float(os.environ.get('PROBE_INTERVAL', '5'))
+    PROBE_STALE_AFTER = float(os.environ.get('PROBE_STALE_AFTER', '0')) or None
+
+    # Query instrumentation (see banking_app/instrumentation.py)
+    QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', '1') == '1'
+    QUERY_REPEAT_THRESHOLD = 5      # same statement this many times => N+1 warning
+    QUERY_BUDGET_STRICT = None      # None => raise only when app.testing
+    QUERY_BUDGET_DEFAULT = None     # budget for endpoints not listed below
+    QUERY_BUDGETS = {
+        'customer.dashboard': 8,
+        'customer.accounts': 6,
+        'customer.transactions': 8,
+        # Postings are budgeted at their exact worst case (first of the day, with an
+        # idempotency key) and tests/test_query_budgets.py pins them: key claim,
+        # daily usage upsert, transaction, one UPDATE per account, journal,
+        # activity INSERT + trim, counters, outbox, key completion
+        'customer.create_account': 11,
+        'customer.transfer': 13,
+        'customer.deposit': 11,
+        'customer.withdraw': 12,
+        'admin.dashboard': 10,
+        'admin.users': 10,
+        'admin.user_detail': 10,
+        'admin.accounts': 10,
+        'admin.transactions': 10,
+        'api.me': 2,
+        'api.accounts': 4,
+        'api.account': 4,
+        'api.account_transactions': 6,
+        'api.transactions': 6,
+        'api.create_transfer': 15,
+    }
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -2,6 +2,7 @@ import os
 import time
 import requests
 from datetime import datetime
+from urllib.parse import urljoin
 
 # ===========================
 # 🔧 ENVIRONMENT VARIABLES
@@ -21,13 +22,18 @@ def log(msg):
 
 
 def check_health(url):
-    """Checks service health with retry, redirects allowed."""
+    """Checks the app's cached readiness verdict (/ready) with retry; only a 200 counts."""
+    # /ready lives at the root of the app's origin, whatever path MAIN_APP carries
+    probe = urljoin(url, "/ready")
     for attempt in range(2):
         try:
-            log(f"🔍 Checking {url} (try {attempt+1})")
-            r = requests.get(url, timeout=10, allow_redirects=True)
+            log(f"🔍 Checking {probe} (try {attempt+1})")
+            r = requests.get(probe, timeout=5)
             log(f"↪️ Response {r.status_code}")
-            if r.status_code in [200, 301, 302]:
+            if r.status_code == 200:
+                verdict = r.json()
+                if verdict.get("state") != "ready":
+                    log(f"⚠️ {url} is {verdict.get('state')} for {verdict.get('state_age_s')}s")
                 return True
         except Exception as e:
             log(f"⚠️ Health check failed for {url}: {e}")
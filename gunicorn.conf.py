@@ -0,0 +1,29 @@
+"""
+Gunicorn settings read from ./gunicorn.conf.py (worker/thread counts and the
+bind address are passed on the command line, see Dockerfile).
+
+GUNICORN_PRELOAD=1 (the default) builds the app once in the master and forks
+it into the workers; see banking_app/startup.py for the copy-on-write and
+fork-safety handling. Set it to 0 to import the app in every worker instead.
+"""
+
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Keep the master's heap untouched by collections until it is frozen
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        from banking_app import startup
+        startup.prefork(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from banking_app import startup
+        startup.postfork(server.app.wsgi())
@@ -1,110 +1,228 @@
 #!/usr/bin/env python3
 """
-SecureBank Setup Script - Creates database and demo users
+SecureBank Setup Script - Upgrades the database schema and seeds demo users
+
+Safe to re-run: schema revisions already applied are skipped and demo rows
+that already exist are left alone. Pass --reset to drop everything first.
+--load-users N tops the database up to N synthetic customers (loaduser000001,
+...) with accounts and transaction history, for benchmarks.
 """
 
-import os
-import sys
-from banking_app import create_app, db
-from banking_app.models import User, Role, Account, Transaction
+import argparse
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from banking_app import create_app, db, account_numbers, activity, ledger, migrations, passwords, stats
+from banking_app.models import User, Role, Account, RecentActivity, Transaction
+from banking_app.money import Money
+
+ROLES = [
+    {'name': 'customer', 'description': 'Regular banking customer'},
+    {'name': 'admin', 'description': 'System administrator'},
+]
+
+USERS = [
+    {'username': 'admin', 'email': 'admin@securebank.com', 'first_name': 'System',
+     'last_name': 'Administrator', 'phone': '555-0000', 'role': 'admin', 'password': 'admin123'},
+    {'username': 'customer', 'email': 'customer@example.com', 'first_name': 'John',
+     'last_name': 'Doe', 'phone': '555-1234', 'role': 'customer', 'password': 'password'},
+]
+
+# Demo customer's accounts (type, balance) and history (type, amount, description, to, from)
+DEMO_ACCOUNTS = [('checking', Money(240000)), ('savings', Money(500000))]
+DEMO_TRANSACTIONS = [
+    ('deposit', Money(250000), 'Initial checking deposit', 'checking', None),
+    ('deposit', Money(500000), 'Initial savings deposit', 'savings', None),
+    ('withdrawal', Money(10000), 'ATM withdrawal', None, 'checking'),
+]
+
+
+def _existing(column, values):
+    return set(db.session.scalars(select(column).where(column.in_(values))))
+
+
+def seed_roles():
+    """Insert missing roles in one statement; returns {name: id}."""
+    missing = [r for r in ROLES if r['name'] not in _existing(Role.name, [r['name'] for r in ROLES])]
+    if missing:
+        db.session.execute(insert(Role), missing)
+    return dict(db.session.execute(select(Role.name, Role.id)).all())
+
+
+def seed_users(role_ids):
+    """Insert missing demo users in one statement; returns the usernames created."""
+    existing = _existing(User.username, [u['username'] for u in USERS])
+    rows = [{**{k: v for k, v in u.items() if k not in ('role', 'password')},
+             'role_id': role_ids[u['role']],
+             'password_hash': passwords.hash_password(u['password'])}
+            for u in USERS if u['username'] not in existing]
+    if rows:
+        db.session.execute(insert(User), rows)
+    return [row['username'] for row in rows]
+
+
+def seed_demo_customer():
+    """Accounts and history for a newly created demo customer."""
+    user_id = db.session.scalar(select(User.id).where(User.username == 'customer'))
+    numbers = {}
+    rows = []
+    for account_type, balance in DEMO_ACCOUNTS:
+        numbers[account_type] = account_numbers.allocate()
+        rows.append({'account_number': numbers[account_type], 'account_type': account_type,
+                     'balance': balance, 'user_id': user_id, 'version': 1, 'last_sequence': 0})
+    db.session.execute(insert(Account), rows)
+
+    ids = dict(db.session.execute(
+        select(Account.account_number, Account.id).where(Account.account_number.in_(numbers.values()))).all())
+    account_id = lambda account_type: ids[numbers[account_type]] if account_type else None
+    db.session.execute(insert(Transaction), [
+        {'transaction_type': kind, 'amount': amount, 'description': description,
+         'to_account_id': account_id(to), 'from_account_id': account_id(source)}
+        for kind, amount, description, to, source in DEMO_TRANSACTIONS
+    ])
+
+
+# Synthetic customers for load tests: one shared password hash (hashing is
+# deliberately slow), $5,000 opening deposits and small transfers inside each batch
+LOAD_USER_PREFIX = 'loaduser'
+LOAD_PASSWORD = 'password'
+LOAD_OPENING = Money(500000)
+LOAD_HISTORY_DAYS = 90
+
+
+def load_usernames(start, count):
+    return [f'{LOAD_USER_PREFIX}{n:06d}' for n in range(start, start + count)]
+
+
+def _insert_returning_ids(model, rows):
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return list(db.session.scalars(stmt, rows))
+
+
+def seed_load_data(users, accounts_per_user=2, transactions_per_account=10, batch_size=1000, seed=0):
+    """
+    Bulk-insert synthetic customers until ``users`` exist, each with
+    ``accounts_per_user`` accounts and about ``transactions_per_account``
+    transactions per account (an opening deposit plus transfers), journaled
+    and fed into the recent-activity ring. Commits once per batch of users
+    and returns the ids of the users created.
+    """
+    existing = db.session.scalar(
+        select(func.count()).select_from(User).where(User.username.like(f'{LOAD_USER_PREFIX}%')))
+    if existing >= users:
+        return []
+    rng = random.Random(seed + existing)
+    role_id = seed_roles()['customer']
+    password_hash = passwords.hash_password(LOAD_PASSWORD)
+    ring = activity.ring_size()
+    now = datetime.utcnow()
+    opened = now - timedelta(days=LOAD_HISTORY_DAYS)
+    created = []
+
+    for start in range(existing + 1, users + 1, batch_size):
+        user_ids = _insert_returning_ids(User, [
+            {'username': name, 'email': f'{name}@load.example.com', 'first_name': 'Load',
+             'last_name': name[len(LOAD_USER_PREFIX):], 'role_id': role_id, 'password_hash': password_hash,
+             'created_at': opened}
+            for name in load_usernames(start, min(batch_size, users + 1 - start))
+        ])
+        created.extend(user_ids)
+
+        # History is generated in memory first so accounts are inserted with
+        # their final balance and journal sequence
+        owners = [user_id for user_id in user_ids for _ in range(accounts_per_user)]
+        balances = [LOAD_OPENING] * len(owners)
+        history = [('deposit', LOAD_OPENING, None, a, 'Opening deposit') for a in range(len(owners))]
+        for _ in range(len(owners) * max(transactions_per_account - 1, 0)):
+            source, target = rng.randrange(len(owners)), rng.randrange(len(owners))
+            amount = Money(rng.randrange(100, 5000))
+            if source == target or balances[source] < amount:
+                continue
+            balances[source] -= amount
+            balances[target] += amount
+            history.append(('transfer', amount, source, target, 'Load test transfer'))
+        entries = [0] * len(owners)
+        for _, _, source, target, _ in history:
+            entries[target] += 1
+            if source is not None:
+                entries[source] += 1
+
+        account_ids = _insert_returning_ids(Account, [
+            {'account_number': account_numbers.allocate(),
+             'account_type': 'checking' if i % accounts_per_user == 0 else 'savings',
+             'user_id': user_id, 'balance': balances[i], 'version': 1, 'last_sequence': entries[i],
+             'created_at': opened}
+            for i, user_id in enumerate(owners)
+        ])
+        step = timedelta(days=LOAD_HISTORY_DAYS) / len(history)
+        times = [opened + step * i for i in range(len(history))]
+        txn_ids = _insert_returning_ids(Transaction, [
+            {'transaction_type': kind, 'amount': amount, 'description': description,
+             'from_account_id': None if source is None else account_ids[source],
+             'to_account_id': account_ids[target], 'created_at': times[i]}
+            for i, (kind, amount, source, target, description) in enumerate(history)
+        ])
+
+        # Journal every leg in posting order, and keep each user's newest ``ring`` transactions
+        legs = [[] for _ in owners]
+        feeds = {user_id: [] for user_id in user_ids}
+        for i, (kind, amount, source, target, _) in enumerate(history):
+            legs[target].append((amount, txn_ids[i]))
+            feeds[owners[target]].append(i)
+            if source is not None:
+                legs[source].append((-amount, txn_ids[i]))
+                if owners[source] != owners[target]:
+                    feeds[owners[source]].append(i)
+        ledger.record_legs([(account_ids[a], legs[a], len(legs[a]), balances[a]) for a in range(len(owners))])
+        db.session.execute(insert(RecentActivity), [
+            {'user_id': user_id, 'transaction_id': txn_ids[i], 'created_at': times[i]}
+            for user_id, feed in feeds.items() for i in feed[-ring:]
+        ])
+        db.session.commit()
+
+    return created
 
-def setup_database():
-    """Initialize database and create default data"""
+
+def setup_database(reset=False, load_users=0, accounts_per_user=2, transactions_per_account=10):
+    """Upgrade the schema and seed default data"""
     print("🏦 Setting up SecureBank Database...")
 
     app = create_app()
 
     with app.app_context():
-        # Drop and recreate all tables
-        db.drop_all()
-        db.create_all()
-        print("✅ Database tables created")
+        if reset:
+            db.drop_all()
+            print("✅ Database tables dropped")
 
-        # Create roles
-        customer_role = Role(name='customer', description='Regular banking customer')
-        admin_role = Role(name='admin', description='System administrator')
+        applied = migrations.upgrade()
+        print(f"✅ Database schema at revision {migrations.HEAD} ({len(applied)} revision(s) applied)")
 
-        db.session.add(customer_role)
-        db.session.add(admin_role)
-        db.session.commit()
-        print("✅ User roles created")
-
-        # Create admin user
-        admin_user = User(
-            username='admin',
-            email='admin@securebank.com',
-            first_name='System',
-            last_name='Administrator',
-            phone='555-0000',
-            role_id=admin_role.id
-        )
-        admin_user.set_password('admin123')
-        db.session.add(admin_user)
-        db.session.commit()  # Commit admin user first
-        print("✅ Admin user created: admin/admin123")
-
-        # Create demo customer user
-        customer_user = User(
-            username='customer',
-            email='customer@example.com',
-            first_name='John',
-            last_name='Doe',
-            phone='555-1234',
-            role_id=customer_role.id
-        )
-        customer_user.set_password('password')
-        db.session.add(customer_user)
-        db.session.commit()  # Commit customer user first
-        print("✅ Customer user created: customer/password")
-
-        # Now create demo accounts with proper user_id
-        checking_account = Account(
-            account_type='checking',
-            balance=2500.00,
-            user_id=customer_user.id  # Use the committed user's ID
-        )
-        savings_account = Account(
-            account_type='savings', 
-            balance=5000.00,
-            user_id=customer_user.id  # Use the committed user's ID
-        )
-
-        db.session.add(checking_account)
-        db.session.add(savings_account)
+        role_ids = seed_roles()
+        created = seed_users(role_ids)
+        if 'customer' in created:
+            seed_demo_customer()
         db.session.commit()
-        print("✅ Demo accounts created")
-
-        # Create sample transactions
-        initial_deposit_checking = Transaction(
-            transaction_type='deposit',
-            amount=2500.00,
-            description='Initial checking deposit',
-            to_account_id=checking_account.id
-        )
-
-        initial_deposit_savings = Transaction(
-            transaction_type='deposit',
-            amount=5000.00,
-            description='Initial savings deposit',
-            to_account_id=savings_account.id
-        )
-
-        sample_withdrawal = Transaction(
-            transaction_type='withdrawal',
-            amount=100.00,
-            description='ATM withdrawal',
-            from_account_id=checking_account.id
-        )
-
-        db.session.add(initial_deposit_checking)
-        db.session.add(initial_deposit_savings)
-        db.session.add(sample_withdrawal)
-
-        # Update checking balance after withdrawal
-        checking_account.balance = 2400.00
+        if created:
+            print(f"✅ Demo users created: {', '.join(created)}")
+        else:
+            print("✅ Demo users already present")
 
-        db.session.commit()
-        print("✅ Sample transactions created")
+        if 'customer' in created:
+            # Populate the dashboard read model for the seeded history
+            activity.rebuild()
+            print("✅ Recent activity feed built")
+
+            # Seeded balances were set directly; journal them as opening entries
+            ledger.backfill_opening_balances()
+            print("✅ Ledger opening balances journaled")
+
+        if load_users:
+            created = seed_load_data(load_users, accounts_per_user, transactions_per_account)
+            print(f"✅ Load-test customers: {len(created)} created, password '{LOAD_PASSWORD}'")
+
+        # Build the admin dashboard counters
+        stats.refresh()
+        print("✅ System statistics computed")
 
         print("\n🎉 SecureBank setup completed successfully!")
         print("=" * 50)
@@ -115,4 +233,11 @@ def setup_database():
         print("=" * 50)
 
 if __name__ == '__main__':
-    setup_database()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reset', action='store_true', help='Drop all tables before setting up')
+    parser.add_argument('--load-users', type=int, default=0, help='Top up to this many synthetic customers')
+    parser.add_argument('--accounts-per-user', type=int, default=2)
+    parser.add_argument('--transactions-per-account', type=int, default=10)
+    args = parser.parse_args()
+    setup_database(reset=args.reset, load_users=args.load_users, accounts_per_user=args.accounts_per_user,
+                   transactions_per_account=args.transactions_per_account)
@@ -0,0 +1,70 @@
+"""
+Shared fixtures: each test gets a freshly upgraded and seeded SQLite
+database (see setup.py) and an app in testing mode, where query budgets are
+strict (see banking_app/instrumentation.py).
+"""
+
+import os
+import tempfile
+
+# Config reads the environment at import time
+DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix='securebank-tests-'), 'bank.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['FLASK_ENV'] = 'production'
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+os.environ.setdefault('TEMPLATE_BYTECODE_CACHE', '0')
+
+import pytest
+
+import setup
+from banking_app import create_app, db
+from banking_app.models import Account, User
+
+
+@pytest.fixture
+def app():
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    setup.setup_database()
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    assert not app.extensions.get('query_budget_overruns'), app.extensions['query_budget_overruns']
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username, password):
+    response = client.post('/auth/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, response.data
+    return client
+
+
+@pytest.fixture
+def customer(client):
+    return login(client, 'customer', 'password')
+
+
+@pytest.fixture
+def admin(client):
+    return login(client, 'admin', 'admin123')
+
+
+@pytest.fixture(params=['NaN', 'sNaN', 'Infinity', '-Infinity', '1e999999999'])
+def not_amount(request):
+    """Amount text that parses as a number but is not a finite amount."""
+    return request.param
+
+
+@pytest.fixture
+def accounts(app):
+    """The demo customer's account numbers by type."""
+    with app.app_context():
+        user = User.query.filter_by(username='customer').one()
+        return {a.account_type: a.account_number for a in Account.query.filter_by(user_id=user.id)}
@@ -0,0 +1,34 @@
+"""Account-number checks on user-entered destinations (see banking_app/account_numbers.py)."""
+
+from sqlalchemy import update
+
+from banking_app import account_numbers, db
+from banking_app.models import Account
+from banking_app.money import Money
+
+LEGACY_NUMBER = '1234567890'  # pre-allocator number; its Luhn digit would be 7
+
+
+def test_allocated_numbers_carry_a_check_digit(app):
+    with app.app_context():
+        assert account_numbers.is_valid(account_numbers.format_number(123456789))
+        assert not account_numbers.is_valid(LEGACY_NUMBER)
+
+
+def test_transfer_to_legacy_number_by_default(app, customer, accounts):
+    with app.app_context():
+        db.session.execute(update(Account).where(Account.account_number == accounts['savings'])
+                           .values(account_number=LEGACY_NUMBER))
+        db.session.commit()
+        before = Account.query.filter_by(account_number=LEGACY_NUMBER).one().balance
+    response = customer.post('/customer/transfer', data={'to_account': LEGACY_NUMBER, 'amount': '7.00'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert Account.query.filter_by(account_number=LEGACY_NUMBER).one().balance == before + Money(700)
+
+
+def test_check_digit_rejects_mistyped_number(app):
+    app.config['ACCOUNT_NUMBER_CHECK_DIGIT'] = True
+    with app.app_context():
+        assert not account_numbers.looks_valid(LEGACY_NUMBER)
+        assert account_numbers.looks_valid('1234567897')
@@ -0,0 +1,111 @@
+"""JSON API: login, conditional reads, field selection and transfers (see banking_app/api/routes.py)."""
+
+import pytest
+
+from banking_app.models import Transaction
+
+
+def transfer(client, accounts, key, amount='5.00'):
+    return client.post('/api/v1/transfers', json={'to_account': accounts['savings'], 'amount': amount},
+                       headers={'Idempotency-Key': key})
+
+
+def transaction_count(app):
+    with app.app_context():
+        return Transaction.query.count()
+
+
+# ----------------------------------------------------------------------
+# Session
+# ----------------------------------------------------------------------
+def test_session_logs_in_and_out(client):
+    response = client.post('/api/v1/session', json={'username': 'customer', 'password': 'password'})
+    assert response.status_code == 200
+    assert response.get_json()['username'] == 'customer' and response.get_json()['csrf_token']
+    assert client.get('/api/v1/me').status_code == 200
+
+    assert client.delete('/api/v1/session').status_code == 204
+    assert client.get('/api/v1/me').status_code == 401
+
+
+def test_session_requires_json(client):
+    response = client.post('/api/v1/session', data={'username': 'customer', 'password': 'password'})
+    assert response.status_code == 400
+    assert client.get('/api/v1/me').status_code == 401
+
+
+def test_session_failures_share_the_login_rate_limit(client):
+    for _ in range(5):
+        response = client.post('/api/v1/session', json={'username': 'customer', 'password': 'wrong'})
+        assert response.status_code == 401
+    response = client.post('/api/v1/session', json={'username': 'customer', 'password': 'password'})
+    assert response.status_code == 429 and int(response.headers['Retry-After']) > 0
+    assert client.post('/auth/login', data={'username': 'customer', 'password': 'password'}).status_code == 429
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def test_unchanged_accounts_answer_304(customer, accounts):
+    first = customer.get('/api/v1/accounts')
+    etag, modified = first.headers['ETag'], first.headers['Last-Modified']
+    assert customer.get('/api/v1/accounts', headers={'If-None-Match': etag}).status_code == 304
+    assert customer.get('/api/v1/accounts', headers={'If-Modified-Since': modified}).status_code == 304
+
+    assert transfer(customer, accounts, 'moves-money').status_code == 201
+    assert customer.get('/api/v1/accounts', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_fields_selects_representation(customer):
+    body = customer.get('/api/v1/accounts?fields=account_number,balance').get_json()
+    assert body['accounts'] and all(set(a) == {'account_number', 'balance'} for a in body['accounts'])
+
+    response = customer.get('/api/v1/accounts?fields=account_number,pin')
+    assert response.status_code == 400 and 'pin' in response.get_json()['error']
+
+
+def test_cursor_walks_every_transaction_once(customer, accounts):
+    for i in range(3):
+        transfer(customer, accounts, f'page-{i}')
+    everything = [t['id'] for t in customer.get('/api/v1/transactions?limit=100').get_json()['transactions']]
+
+    seen, cursor = [], None
+    while True:
+        query = '/api/v1/transactions?limit=2&fields=id' + (f'&cursor={cursor}' if cursor else '')
+        body = customer.get(query).get_json()
+        assert len(body['transactions']) <= 2
+        seen += [t['id'] for t in body['transactions']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert seen == everything and len(everything) >= 3
+
+
+# ----------------------------------------------------------------------
+# Transfers
+# ----------------------------------------------------------------------
+@pytest.mark.parametrize('amount', [float('nan'), float('inf')])
+def test_transfer_rejects_non_finite_numbers(app, customer, accounts, amount):
+    before = transaction_count(app)
+    response = customer.post('/api/v1/transfers', json={'to_account': accounts['savings'], 'amount': amount})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Amount must be a number like 25.00'}
+    assert transaction_count(app) == before
+
+
+def test_transfer_rejects_non_finite_amounts(app, customer, accounts, not_amount):
+    before = transaction_count(app)
+    response = customer.post('/api/v1/transfers', json={'to_account': accounts['savings'], 'amount': not_amount})
+    assert response.status_code == 400
+    assert transaction_count(app) == before
+
+
+def test_repeated_transfer_is_replayed(app, customer, accounts):
+    before = transaction_count(app)
+    first = transfer(customer, accounts, 'api-repeat')
+    second = transfer(customer, accounts, 'api-repeat')
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert transaction_count(app) == before + 1
+
+    assert transfer(customer, accounts, 'api-repeat', amount='6.00').status_code == 422
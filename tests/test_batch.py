@@ -0,0 +1,62 @@
+"""Batch transfer parsing and posting (see banking_app/batch.py)."""
+
+import io
+
+import pytest
+from sqlalchemy import func
+
+from banking_app import batch, db
+from banking_app.models import Transaction
+
+
+@pytest.mark.parametrize('amount', ['NaN', 'sNaN', 'Infinity', '1e999999999', 'abc'])
+def test_bad_amount_rejects_only_its_line(amount):
+    lines = batch.parse_csv(f'1000000016,{amount}\n1000000016,5.00\n')
+    assert [line.status for line in lines] == ['failed', 'pending']
+    assert lines[0].error == f'Invalid amount {amount!r}'
+
+
+def test_json_batch_reports_non_finite_lines(customer, accounts):
+    response = customer.post('/customer/batch_transfer', json=[
+        {'to_account': accounts['savings'], 'amount': float('inf')},
+        {'to_account': accounts['savings'], 'amount': '1e999999999'},
+        {'to_account': accounts['savings'], 'amount': '5.00'},
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [line['status'] for line in body['lines']] == ['failed', 'failed', 'posted']
+    assert body['summary']['posted'] == 1
+
+
+def transaction_count(app):
+    with app.app_context():
+        return db.session.query(func.count(Transaction.id)).scalar()
+
+
+def test_repeated_form_batch_posts_once(app, customer, accounts):
+    before = transaction_count(app)
+    data = {'payees': f"{accounts['savings']},5.00\n", 'idempotency_key': 'batch-form'}
+    assert customer.post('/customer/batch_transfer', data=data).status_code == 200
+    repeat = customer.post('/customer/batch_transfer', data=data)
+    assert repeat.status_code == 302
+    assert transaction_count(app) == before + 1
+
+
+def test_repeated_json_batch_posts_once(app, customer, accounts):
+    before = transaction_count(app)
+    payload = [{'to_account': accounts['savings'], 'amount': '5.00'}]
+    headers = {'Idempotency-Key': 'batch-json'}
+    first = customer.post('/customer/batch_transfer', json=payload, headers=headers)
+    second = customer.post('/customer/batch_transfer', json=payload, headers=headers)
+    assert second.get_json() == first.get_json()
+    assert transaction_count(app) == before + 1
+
+
+def test_different_upload_under_same_key_is_rejected(app, customer, accounts):
+    def upload(amount):
+        return customer.post('/customer/batch_transfer', content_type='multipart/form-data', data={
+            'payee_file': (io.BytesIO(f"{accounts['savings']},{amount}\n".encode()), 'payees.csv'),
+            'idempotency_key': 'batch-file'})
+
+    assert upload('5.00').status_code == 200
+    assert upload('6.00').status_code == 422
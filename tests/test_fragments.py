@@ -0,0 +1,20 @@
+"""Fragment and compiled-template cache wiring (see banking_app/fragments.py)."""
+
+import os
+
+import config
+from banking_app import create_app
+
+
+def test_fragment_cache_size_is_exported(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape'
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape'})
+    assert b'\nfragment_cache_entries ' in response.data
+
+
+def test_bytecode_cache_directory_is_created(app, monkeypatch, tmp_path):
+    directory = tmp_path / 'jinja' / 'bytecode'
+    monkeypatch.setattr(config.ProductionConfig, 'TEMPLATE_BYTECODE_CACHE', True)
+    monkeypatch.setattr(config.ProductionConfig, 'TEMPLATE_BYTECODE_CACHE_DIR', str(directory))
+    create_app()
+    assert os.path.isdir(directory)
@@ -0,0 +1,83 @@
+"""
+Idempotency keys (see banking_app/idempotency.py): a key posts at most once,
+is released by any request that did not post, and is marked done in the
+posting's own commit.
+"""
+
+import pytest
+from sqlalchemy import func, update
+
+from banking_app import db, idempotency
+from banking_app.models import Account, IdempotencyKey, Transaction
+
+
+def transaction_count(app):
+    with app.app_context():
+        return db.session.query(func.count(Transaction.id)).scalar()
+
+
+def key_state(app, key):
+    with app.app_context():
+        return db.session.query(IdempotencyKey.state).filter_by(key=key).scalar()
+
+
+def transfer(client, accounts, key):
+    return client.post('/customer/transfer', data={'to_account': accounts['savings'], 'amount': '5.00',
+                                                   'idempotency_key': key})
+
+
+def test_repeat_is_replayed(app, customer, accounts):
+    before = transaction_count(app)
+    first = transfer(customer, accounts, 'repeat')
+    second = transfer(customer, accounts, 'repeat')
+    assert first.status_code == second.status_code == 302
+    assert second.location == first.location
+    assert transaction_count(app) == before + 1
+
+
+def test_failure_redirect_releases_key(app, customer, accounts):
+    def set_checking_active(active):
+        with app.app_context():
+            db.session.execute(update(Account).where(Account.account_number == accounts['checking'])
+                               .values(is_active=active))
+            db.session.commit()
+
+    set_checking_active(False)
+    assert transfer(customer, accounts, 'retry-me').status_code == 302  # "No checking account"
+    assert key_state(app, 'retry-me') is None
+    set_checking_active(True)
+
+    before = transaction_count(app)
+    transfer(customer, accounts, 'retry-me')
+    assert transaction_count(app) == before + 1
+
+
+def test_form_answer_is_stored_with_the_posting(app, customer, accounts):
+    before = transaction_count(app)
+    first = transfer(customer, accounts, 'stored')
+    assert key_state(app, 'stored') == 'done'
+    app.extensions['idempotency'].clear()  # as seen by another worker
+
+    repeat = transfer(customer, accounts, 'stored')
+    assert repeat.status_code == 302 and repeat.location == first.location == '/customer/dashboard'
+    assert transaction_count(app) == before + 1
+
+
+def test_key_is_done_with_the_posting(app, customer, accounts, monkeypatch):
+    def worker_dies(*args):
+        raise RuntimeError('worker died after the posting committed')
+
+    def api_transfer():
+        return customer.post('/api/v1/transfers', json={'to_account': accounts['savings'], 'amount': '5.00'},
+                             headers={'Idempotency-Key': 'crash'})
+
+    before = transaction_count(app)
+    with monkeypatch.context() as patch:
+        patch.setattr(idempotency, 'complete', worker_dies)
+        with pytest.raises(RuntimeError):
+            api_transfer()
+    assert key_state(app, 'crash') == 'done'
+
+    repeat = api_transfer()
+    assert repeat.status_code == 200 and repeat.get_json() == {'message': idempotency.PROCESSED}
+    assert transaction_count(app) == before + 1
@@ -0,0 +1,62 @@
+"""
+Journal backfill: balances that predate the journal get one ``opening``
+entry, whether or not the account has posted since, and the journal then
+verifies against every balance.
+"""
+
+import pytest
+from sqlalchemy import update
+
+from banking_app import db, ledger, postings
+from banking_app.models import Account, JournalEntry, User
+from banking_app.money import Money
+
+LEGACY = Money(25000)
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield app
+
+
+def legacy_account(balance=LEGACY):
+    """An account as it looked before the journal: a balance and no entries."""
+    user_id = User.query.filter_by(username='customer').one().id
+    account_id = postings.open_account(user_id, 'savings').id
+    db.session.execute(update(Account).where(Account.id == account_id)
+                       .values(balance=balance).execution_options(synchronize_session=False))
+    db.session.commit()
+    return account_id
+
+
+def entries(account_id):
+    return (JournalEntry.query.filter_by(account_id=account_id)
+            .order_by(JournalEntry.sequence).all())
+
+
+def test_backfill_journals_untouched_balance(ctx):
+    account_id = legacy_account()
+    assert ledger.backfill_opening_balances() == 1
+    (opening,) = entries(account_id)
+    assert (opening.sequence, opening.entry_type, opening.amount) == (1, 'opening', LEGACY)
+    assert list(ledger.verify()) == []
+
+
+def test_backfill_journals_account_that_posted_since(ctx):
+    account_id = legacy_account()
+    postings.deposit(db.session.get(Account, account_id), Money(500))
+    assert ledger.backfill_opening_balances() == 1
+
+    opening, deposit = entries(account_id)
+    assert (opening.sequence, opening.entry_type, opening.amount) == (0, 'opening', LEGACY)
+    assert deposit.sequence == 1
+    assert list(ledger.verify()) == []
+    assert ledger.balance_at(account_id) == LEGACY + Money(500)
+    assert ledger.balance_at(account_id, sequence=0) == LEGACY
+
+
+def test_backfill_is_idempotent(ctx):
+    legacy_account()
+    ledger.backfill_opening_balances()
+    assert ledger.backfill_opening_balances() == 0
@@ -0,0 +1,28 @@
+"""Daily usage counters (see banking_app/limits.py)."""
+
+from banking_app import db, limits
+from banking_app.models import Account, DailyUsage
+from banking_app.money import Money
+
+LIMIT = Money(10000)
+
+
+def used(account_id):
+    return db.session.get(DailyUsage, (account_id, limits.today())).used
+
+
+def test_consume_creates_and_bumps_the_counter_within_the_limit(app):
+    with app.app_context():
+        account_id = Account.query.first().id
+        assert limits.consume(account_id, Money(6000), LIMIT)
+        assert limits.consume(account_id, Money(4000), LIMIT)  # exactly at the limit
+        assert not limits.consume(account_id, Money(1), LIMIT)
+        db.session.commit()
+        assert used(account_id) == LIMIT
+
+
+def test_consume_rejects_a_first_amount_over_the_limit(app):
+    with app.app_context():
+        account_id = Account.query.first().id
+        assert not limits.consume(account_id, LIMIT + Money(1), LIMIT)
+        assert db.session.get(DailyUsage, (account_id, limits.today())) is None
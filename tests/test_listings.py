@@ -0,0 +1,23 @@
+"""Admin list counts and planner estimates (see banking_app/listings.py)."""
+
+from sqlalchemy.dialects import postgresql
+
+from banking_app import listings
+from banking_app.models import User
+
+SEARCH = "x' OR 1=1 --"
+
+
+def test_explain_keeps_search_text_bound(app):
+    with app.app_context():
+        statement = listings.explain(User.query.filter(listings.prefix(User.username, SEARCH)))
+        compiled = statement.compile(dialect=postgresql.dialect())
+    assert SEARCH not in str(compiled)
+    assert SEARCH in compiled.params.values()
+
+
+def test_capped_count_reports_at_least(app):
+    app.config['ADMIN_COUNT_CAP'] = 1
+    with app.app_context():
+        count = listings.approximate_count(User.query)
+    assert (count.value, count.kind) == (1, 'at_least')
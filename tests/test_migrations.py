@@ -0,0 +1,75 @@
+"""
+Data revisions: ``flask db upgrade`` journals pre-journal balances and
+fills recent-activity rings that predate the feed, so an upgraded database
+verifies without the manual ``ledger backfill`` / ``activity rebuild`` steps.
+"""
+
+from sqlalchemy import delete, inspect, update
+
+from banking_app import activity, db, ledger, migrations, postings
+from banking_app.models import Account, RecentActivity, SchemaRevision, User
+from banking_app.money import Money
+
+
+def rewind(version):
+    """Pretend the database was last upgraded by a release at ``version``."""
+    db.session.execute(delete(SchemaRevision).where(SchemaRevision.version > version))
+    db.session.commit()
+
+
+def test_upgrade_journals_legacy_balances(app):
+    with app.app_context():
+        rewind(11)
+        user_id = User.query.filter_by(username='customer').one().id
+        untouched, posted = (postings.open_account(user_id, 'savings').id for _ in range(2))
+        db.session.execute(update(Account).where(Account.id.in_([untouched, posted]))
+                           .values(balance=Money(40000)).execution_options(synchronize_session=False))
+        db.session.commit()
+        postings.deposit(db.session.get(Account, posted), Money(100))
+
+        applied = migrations.upgrade()
+
+        assert [r.version for r in applied] == [12, 13]
+        assert migrations.status().is_current
+        assert list(ledger.verify()) == []
+
+
+def test_upgrade_rebuilds_rings_that_predate_the_feed(app):
+    with app.app_context():
+        user_id = User.query.filter_by(username='customer').one().id
+        expected = [t.id for t in activity.recent_for_user(user_id)]
+        assert expected
+        rewind(11)
+        db.session.execute(delete(RecentActivity))
+        db.session.commit()
+
+        migrations.upgrade()
+
+        assert [t.id for t in activity.recent_for_user(user_id)] == expected
+
+
+def test_revision_chain_builds_the_model_schema(app):
+    with app.app_context():
+        db.drop_all()
+        with db.engine.begin() as connection:
+            migrations.REVISIONS[0].upgrade(connection)  # a database from before versioning
+
+        applied = migrations.upgrade()
+
+        assert [r.version for r in applied] == list(range(1, migrations.HEAD + 1))
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            assert {c['name'] for c in inspector.get_columns(table.name)} == set(table.c.keys()), table.name
+            assert ({i['name'] for i in inspector.get_indexes(table.name)}
+                    >= {index.name for index in table.indexes}), table.name
+
+
+def test_activity_backfill_commits_per_batch(app):
+    with app.app_context():
+        rewind(12)
+        db.session.execute(delete(RecentActivity))
+        db.session.commit()
+        commits = []
+        with db.engine.connect() as connection:
+            rebuilt = activity.rebuild_incomplete(connection, batch_size=1, commit=lambda: commits.append(1))
+        assert rebuilt == len(commits) == User.query.count()
@@ -0,0 +1,49 @@
+"""Money values, coercion and form input (see banking_app/money.py)."""
+
+import pytest
+
+from banking_app.models import Transaction
+from banking_app.money import Money
+
+def test_coerce_rejects_non_finite_amounts(not_amount):
+    with pytest.raises(TypeError):
+        Money.coerce(not_amount)
+
+
+@pytest.mark.parametrize('value', ['abc', None, object()])
+def test_coerce_rejects_non_numbers(value):
+    with pytest.raises(TypeError):
+        Money.coerce(value)
+
+
+@pytest.mark.parametrize('value, cents', [('1.005', 101), (2.5, 250), ('1e2', 10000), (0.1, 10)])
+def test_coerce_rounds_half_up_to_the_cent(value, cents):
+    assert Money.coerce(value).cents == cents
+
+
+@pytest.mark.parametrize('path', ['/customer/deposit', '/customer/withdraw', '/customer/transfer'])
+def test_forms_reject_non_finite_amounts(app, customer, accounts, path, not_amount):
+    with app.app_context():
+        before = Transaction.query.count()
+    response = customer.post(path, data={'amount': not_amount, 'to_account': accounts['savings']})
+    assert response.status_code == 200  # form re-rendered with a validation error
+    with app.app_context():
+        assert Transaction.query.count() == before
+
+
+def test_plain_numbers_do_not_mix_with_money():
+    assert Money(100) != 1 and Money(100) != 100
+    with pytest.raises(TypeError):
+        Money(100) + 1
+    with pytest.raises(TypeError):
+        Money(100) < 1.5
+
+
+def test_zero_is_the_same_in_every_unit():
+    assert Money() == 0 and hash(Money()) == hash(0)
+    assert Money(-1) < 0 < Money(1)
+    assert sum([Money(150), Money(250)]) == Money(400)
+
+
+def test_equal_values_hash_alike():
+    assert len({Money(100), Money.coerce('1.00'), Money.coerce(1)}) == 1
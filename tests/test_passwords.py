@@ -0,0 +1,35 @@
+"""KDF worker pool and rehash scheduling (see banking_app/passwords.py)."""
+
+import threading
+
+import pytest
+
+from banking_app.passwords import KdfPool, PasswordVerifierBusy
+
+
+def test_background_work_is_skipped_when_every_slot_is_busy():
+    pool = KdfPool(1, timeout=1)
+    release = threading.Event()
+    assert pool.submit(release.wait) is not None
+    assert pool.submit(release.wait) is None
+    release.set()
+
+
+def test_verification_never_queues_behind_background_work():
+    pool = KdfPool(1, timeout=0.1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    with pytest.raises(PasswordVerifierBusy):
+        pool.run(lambda: True)
+    release.set()
+    assert pool.run(lambda: True) is True
+
+
+def test_slow_work_times_out_and_keeps_its_slot_until_done():
+    pool = KdfPool(1, timeout=0.1)
+    release = threading.Event()
+    with pytest.raises(PasswordVerifierBusy):
+        pool.run(release.wait)
+    assert pool.submit(lambda: None) is None  # still running
+    release.set()
+    assert pool.run(lambda: 'done') == 'done'
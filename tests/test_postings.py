@@ -0,0 +1,197 @@
+"""
+Posting service invariants: the conditional UPDATE never overdraws, a
+rejected posting writes nothing, version-checked ORM writes detect
+concurrent changes, and concurrent transfers conserve money without lost
+updates (see benchmarks/stress_transfers.py for the long-running version).
+"""
+
+import random
+import threading
+
+import pytest
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from banking_app import db, ledger, postings
+from banking_app.models import Account, Transaction, User
+from banking_app.money import Money
+
+OPENING = Money(10000)
+
+
+@pytest.fixture
+def ctx(app):
+    app.config.update(POSTING_MAX_RETRIES=50, POSTING_RETRY_BACKOFF=0.001,
+                      TRANSACTION_LIMIT_SINGLE=1000000, TRANSACTION_LIMIT_DAILY=1000000)
+    with app.app_context():
+        yield app
+
+
+def open_accounts(count, balance=OPENING):
+    user_id = User.query.filter_by(username='customer').one().id
+    return [postings.open_account(user_id, 'checking', balance).id for _ in range(count)]
+
+
+def snapshot(account_id):
+    db.session.expire_all()
+    account = db.session.get(Account, account_id)
+    return account.balance, account.version
+
+
+def transaction_count():
+    return db.session.query(func.count(Transaction.id)).scalar()
+
+
+# ----------------------------------------------------------------------
+# Rejected postings
+# ----------------------------------------------------------------------
+def test_withdraw_overdraft_writes_nothing(ctx):
+    (account_id,) = open_accounts(1)
+    before, transactions = snapshot(account_id), transaction_count()
+    with pytest.raises(postings.InsufficientFunds):
+        postings.withdraw(db.session.get(Account, account_id), OPENING + Money(1))
+    assert snapshot(account_id) == before
+    assert transaction_count() == transactions
+
+
+def test_transfer_overdraft_moves_neither_side(ctx):
+    source, target = open_accounts(2)
+    before = snapshot(source), snapshot(target)
+    with pytest.raises(postings.InsufficientFunds):
+        postings.transfer(db.session.get(Account, source), db.session.get(Account, target), OPENING + Money(1))
+    assert (snapshot(source), snapshot(target)) == before
+
+
+def test_withdraw_exact_balance_succeeds(ctx):
+    (account_id,) = open_accounts(1)
+    postings.withdraw(db.session.get(Account, account_id), OPENING)
+    assert snapshot(account_id)[0] == Money(0)
+
+
+def test_inactive_account_is_unavailable(ctx):
+    source, target = open_accounts(2)
+    db.session.get(Account, target).is_active = False
+    db.session.commit()
+    with pytest.raises(postings.AccountUnavailable):
+        postings.transfer(db.session.get(Account, source), db.session.get(Account, target), Money(100))
+    assert snapshot(source)[0] == OPENING
+
+
+def test_debit_from_inactive_account_is_unavailable_not_insufficient(ctx):
+    source, target = open_accounts(2)
+    db.session.get(Account, source).is_active = False
+    db.session.commit()
+    before, transactions = snapshot(source), transaction_count()
+    with pytest.raises(postings.AccountUnavailable):
+        postings.withdraw(db.session.get(Account, source), Money(100))
+    with pytest.raises(postings.AccountUnavailable):
+        postings.transfer(db.session.get(Account, source), db.session.get(Account, target), Money(100))
+    assert snapshot(source) == before
+    assert transaction_count() == transactions
+
+
+# ----------------------------------------------------------------------
+# Conflicts
+# ----------------------------------------------------------------------
+def test_stale_orm_write_is_rejected(ctx):
+    (account_id,) = open_accounts(1)
+    account = db.session.get(Account, account_id)
+    # A posting elsewhere bumps the version behind this session's back
+    db.session.execute(update(Account).where(Account.id == account_id)
+                       .values(version=Account.version + 1).execution_options(synchronize_session=False))
+    account.account_type = 'savings'
+    with pytest.raises(StaleDataError):
+        db.session.commit()
+    db.session.rollback()
+
+
+def test_transient_conflicts_are_retried(ctx):
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OperationalError('UPDATE account', {}, Exception('database is locked'))
+        return 'posted'
+
+    assert postings.run_with_retries(attempt) == 'posted'
+    assert len(calls) == 3
+
+
+def test_rejections_are_not_retried(ctx):
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise postings.InsufficientFunds('Insufficient funds')
+
+    with pytest.raises(postings.InsufficientFunds):
+        postings.run_with_retries(attempt)
+    assert len(calls) == 1
+
+
+def test_retries_give_up(ctx):
+    ctx.config['POSTING_MAX_RETRIES'] = 2
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise StaleDataError('stale')
+
+    with pytest.raises(StaleDataError):
+        postings.run_with_retries(attempt)
+    assert len(calls) == 3
+
+
+# ----------------------------------------------------------------------
+# Concurrency
+# ----------------------------------------------------------------------
+def test_concurrent_postings_conserve_money(ctx):
+    account_ids = open_accounts(4, Money(5000))
+    versions = {account_id: snapshot(account_id)[1] for account_id in account_ids}
+    first_new = db.session.query(func.max(Transaction.id)).scalar() + 1
+    outcomes = {'ok': 0, 'insufficient': 0}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(25):
+            with ctx.app_context():
+                source, target = rng.sample(account_ids, 2)
+                amount = Money(rng.choice([100, 500, 1000, 2500]))
+                try:
+                    if rng.random() < 0.9:
+                        postings.transfer(db.session.get(Account, source), db.session.get(Account, target), amount)
+                    else:
+                        postings.withdraw(db.session.get(Account, source), amount)
+                    key = 'ok'
+                except postings.InsufficientFunds:
+                    key = 'insufficient'
+                except Exception as e:
+                    errors.append(e)
+                    continue
+            with lock:
+                outcomes[key] += 1
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db.session.expire_all()
+    accounts = Account.query.filter(Account.id.in_(account_ids)).all()
+    new = Transaction.query.filter(Transaction.id >= first_new)
+    withdrawn = sum((t.amount for t in new.filter_by(transaction_type='withdrawal')), Money())
+    assert new.count() == outcomes['ok']
+    assert sum((a.balance for a in accounts), Money()) == Money(5000 * len(account_ids)) - withdrawn
+    assert min(a.balance for a in accounts) >= 0
+    for account in accounts:
+        # Every posting bumped the version exactly once: no update was lost
+        touched = new.filter(or_(Transaction.from_account_id == account.id,
+                                 Transaction.to_account_id == account.id)).count()
+        assert account.version == versions[account.id] + touched
+    assert list(ledger.verify()) == []
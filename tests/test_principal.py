@@ -0,0 +1,39 @@
+"""Principal cache invalidation on commit (see banking_app/principal.py)."""
+
+import pytest
+
+from banking_app import db, principal
+from banking_app.models import User
+
+
+def test_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        principal.PrincipalCache()
+
+
+def test_change_invalidates_only_after_commit(app):
+    with app.app_context():
+        user = User.query.filter_by(username='customer').one()
+        cache = principal.get_cache()
+        principal.load_snapshot(user.id)
+
+        user.is_active = False
+        db.session.flush()
+        assert cache.get(user.id) is not None  # flushed, not yet committed
+
+        db.session.commit()
+        assert cache.get(user.id) is None
+        assert principal.load_snapshot(user.id).is_active is False
+
+
+def test_rolled_back_change_keeps_entry(app):
+    with app.app_context():
+        user = User.query.filter_by(username='customer').one()
+        cache = principal.get_cache()
+        principal.load_snapshot(user.id)
+
+        user.first_name = 'Jonathan'
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert cache.get(user.id) is not None
@@ -0,0 +1,33 @@
+"""Readiness verdicts as shown on the admin health page (see banking_app/probes.py)."""
+
+from banking_app.probes import ProbeFailed
+
+
+def failing_check():
+    raise ProbeFailed('replica lag 42s')
+
+
+def test_system_health_reports_probe_results(app, admin):
+    checker = app.extensions['readiness']
+    checker.register('replica', failing_check, critical=False)
+    checker.sample()
+
+    page = admin.get('/admin/system_health').data.decode()
+    assert 'Replica' in page and 'replica lag 42s' in page
+    assert 'Degraded' in page  # a non-critical failure degrades the served components
+    assert 'Migrations' in page
+
+
+def test_unbounded_overflow_never_saturates(app, monkeypatch):
+    from banking_app import dbpool, probes
+    monkeypatch.setattr(dbpool, 'pool_status', lambda engine, config: {
+        'pool_class': 'QueuePool', 'size': 5, 'checked_out': 40, 'max_overflow': -1})
+    with app.app_context():
+        assert probes.check_pool() == '40 connections in use (overflow unbounded)'
+
+
+def test_metrics_closed_without_token(app, client):
+    assert client.get('/metrics').status_code == 404
+    app.config['METRICS_TOKEN'] = 'scrape'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
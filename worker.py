@@ -0,0 +1,87 @@
+"""
+Outbox worker pool: drains ``outbox_event`` next to the web workers (see
+banking_app/outbox.py).
+
+Usage:
+    python worker.py [--processes 2] [--batch-size 100]
+    python worker.py --once        # process what is due in this process, then exit
+
+The parent only supervises: each child builds its own app and database pool,
+and a child that exits unexpectedly is started again. SIGTERM or Ctrl-C on the
+parent is relayed to the children as SIGTERM, which stops each one after its
+current batch.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import signal
+import sys
+import threading
+
+from config import Config
+
+logger = logging.getLogger('banking_app.outbox')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Drain the transactional outbox.')
+    parser.add_argument('--processes', type=int, default=Config.OUTBOX_WORKERS,
+                        help='worker processes (default: OUTBOX_WORKERS)')
+    parser.add_argument('--batch-size', type=int, help='events claimed per batch (default: OUTBOX_BATCH_SIZE)')
+    parser.add_argument('--once', action='store_true', help='drain due events in this process and exit')
+    return parser.parse_args()
+
+
+def stop_on_signals(*signals):
+    """A ``threading.Event`` set by ``signals`` (safe to set from a handler, unlike a multiprocessing one)."""
+    stop = threading.Event()
+    for signum in signals:
+        signal.signal(signum, lambda *_: stop.set())
+    return stop
+
+
+def work(batch_size):
+    # Ctrl-C reaches the whole process group; the parent relays it as SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stop = stop_on_signals(signal.SIGTERM)
+    from banking_app import create_app, outbox
+    app = create_app()
+    with app.app_context():
+        outbox.run(stop, batch_size=batch_size)
+
+
+def supervise(processes, batch_size):
+    stop = stop_on_signals(signal.SIGTERM, signal.SIGINT)
+    children = [None] * processes
+    while not stop.is_set():
+        for slot, child in enumerate(children):
+            if child is not None and child.is_alive():
+                continue
+            if child is not None:
+                logger.warning('Outbox worker %s exited with code %s; restarting', child.pid, child.exitcode)
+            children[slot] = multiprocessing.Process(target=work, args=(batch_size,), name=f'outbox-worker-{slot}')
+            children[slot].start()
+        stop.wait(1)
+
+    for child in children:
+        child.terminate()  # SIGTERM: finish the current batch
+    for child in children:
+        child.join()
+    return 0
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    if args.once:
+        from banking_app import create_app, outbox
+        with create_app().app_context():
+            outcomes = outbox.drain(args.batch_size)
+        logger.info('Outbox drained: %s', dict(outcomes) or 'nothing due')
+        return 0
+    return supervise(max(args.processes, 1), args.batch_size)
+
+
+if __name__ == '__main__':
+    sys.exit(main())